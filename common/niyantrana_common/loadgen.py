@@ -0,0 +1,272 @@
+"""
+Measurement helpers shared by the benchmark suites of both services: micro-benchmark
+timing, an in-process HTTP load generator, peak RSS sampling and JSON results that can
+be diffed across commits.
+
+Only depends on the standard library, NumPy and Werkzeug (installed with Flask), and
+never imports a service's `src`.
+
+Compare two result files (e.g. from two commits):
+
+    python -m niyantrana_common.loadgen compare results/before.json results/after.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+# --- 1. Latency Summaries ---
+def summarize(latencies):
+    """Percentiles of a list of latencies in seconds, reported in milliseconds."""
+    samples = np.asarray(latencies, dtype=np.float64) * 1000
+    if samples.size == 0:
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        'count': int(samples.size),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(samples.max()),
+    }
+
+
+def time_call(fn, repeats=200, warmup=5, items=1):
+    """
+    Micro-benchmark: calls fn() `warmup` times untimed, then `repeats` times.
+
+    Args:
+        items (int): Units of work per call (rows, meals...), for the items_per_sec figure.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    result = summarize(samples)
+    result['items_per_call'] = items
+    result['items_per_sec'] = items * repeats / sum(samples)
+    return result
+
+
+# --- 2. Memory ---
+def current_rss_mb():
+    """Resident set size of this process, from /proc where available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    """Peak RSS over the whole process lifetime (kilobytes on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class RSSSampler:
+    """Polls the RSS in a background thread to find the peak within a block of code."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def result(self):
+        return {'rss_start_mb': self.start_mb, 'rss_peak_mb': self.peak_mb, 'rss_growth_mb': self.peak_mb - self.start_mb}
+
+
+# --- 3. HTTP Load Generation ---
+@contextmanager
+def serve_in_process(app, threaded=True):
+    """
+    Serves a WSGI app from a background thread on a free local port; yields its base URL.
+
+    Uses Werkzeug's threaded server speaking HTTP/1.1, so load-generator connections are
+    kept alive like behind a real proxy. Latencies therefore include HTTP parsing and
+    JSON (de)serialization, but the server shares this process's CPU with the clients.
+    """
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=threaded, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def _worker(base_url, path, payloads, offset, stride, deadline, max_requests, counter, counter_lock, results):
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    headers = {'Content-Type': 'application/json'}
+    i = offset
+    while time.perf_counter() < deadline:
+        with counter_lock:
+            if max_requests and counter[0] >= max_requests:
+                break
+            counter[0] += 1
+        body = payloads[i % len(payloads)]
+        i += stride
+        start = time.perf_counter()
+        try:
+            connection.request('POST', path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            connection.close()
+        results.append((start, time.perf_counter() - start, status))
+    connection.close()
+
+
+def run_load(base_url, path, payloads, concurrency=8, duration=10.0, max_requests=0, warmup_requests=20):
+    """
+    Closed-loop load: `concurrency` clients each send the next payload as soon as their
+    previous response arrives, for `duration` seconds or `max_requests` requests in total.
+
+    Args:
+        payloads (list): Request bodies (dicts), cycled through; each client starts at a
+            different offset so concurrent requests differ.
+
+    Returns:
+        dict: Latency percentiles of successful (2xx) requests, throughput, status counts
+        and RSS of this process during the run (which includes the server when in-process).
+    """
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+    if warmup_requests:
+        _worker(base_url, path, bodies, 0, 1, time.perf_counter() + 60, warmup_requests, [0], threading.Lock(), [])
+
+    results = []
+    counter, counter_lock = [0], threading.Lock()
+    deadline = time.perf_counter() + (duration or float('inf'))
+    threads = [
+        threading.Thread(target=_worker, args=(base_url, path, bodies, i, concurrency, deadline, max_requests,
+                                               counter, counter_lock, results))
+        for i in range(concurrency)
+    ]
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    statuses = {}
+    for _, _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [latency for _, latency, status in results if isinstance(status, int) and 200 <= status < 300]
+    return {
+        'path': path,
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'status_counts': statuses,
+        'elapsed_seconds': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed else 0.0,
+        'latency': summarize(ok),
+        **rss.result(),
+    }
+
+
+# --- 4. Results ---
+def environment():
+    """Commit, interpreter and machine details recorded with every result file."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def default_results_path(service):
+    commit = environment()['commit'] or 'nocommit'
+    return os.path.join('benchmarks', 'results', f"{service}-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+
+def write_results(results, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {path}")
+
+
+def _flatten(node, prefix=''):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, node
+
+
+def compare(before_path, after_path, threshold=0.05):
+    """Prints every numeric metric present in both files whose relative change exceeds `threshold`."""
+    with open(before_path) as f:
+        before = dict(_flatten(json.load(f)['benchmarks']))
+    with open(after_path) as f:
+        after = dict(_flatten(json.load(f)['benchmarks']))
+    print(f"{'metric':<60} {'before':>12} {'after':>12} {'change':>8}")
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old if old else 0.0
+        if abs(change) >= threshold:
+            print(f"{key:<60} {old:>12.4g} {new:>12.4g} {change:>+8.1%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare_parser = subparsers.add_parser('compare', help="Show metrics that changed between two result files.")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=0.05, help="Minimum relative change to show.")
+    args = parser.parse_args()
+    compare(args.before, args.after, args.threshold)
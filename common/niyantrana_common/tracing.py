@@ -0,0 +1,346 @@
+"""
+Per-stage latency tracing, Prometheus metrics and an opt-in sampling profiler.
+
+Dependency-free (Flask is only imported by Tracer.instrument) and used by both services.
+Metrics are kept per process and rendered in the Prometheus text format by
+MetricsRegistry.render(); under gunicorn every worker keeps its own, so scrape each
+worker or aggregate by instance.
+
+    metrics = MetricsRegistry()
+    tracer = Tracer(metrics, 'ml', sample_rate=0.01, trace_path='traces.jsonl')
+
+    with tracer.stage('model'):          # one histogram observation, ~1 us
+        model.predict_on_batch(inputs)
+
+Tracer.instrument(app) times every Flask request. A sampled fraction of requests is also
+written to `trace_path` as one JSON line with the offset and duration of each stage.
+"""
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Tally
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; spans sub-millisecond NumPy stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- 1. Metrics ---
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [f"{name}{labels} {_number(self.value)}"]
+
+
+class _GaugeValue(_CounterValue):
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        inner = labels[1:-1] + ',' if labels else ''
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{inner}le="{_number(bound)}"}} {cumulative}')
+        lines.append(f"{name}_sum{labels} {_number(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Metric:
+    """A metric family; labels(*values) returns the child to update (created on first use)."""
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        if self.kind == 'histogram':
+            return _HistogramValue(self.buckets)
+        return _GaugeValue() if self.kind == 'gauge' else _CounterValue()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}.")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines += child.samples(self.name, _labels(self.labelnames, values))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of one process.
+
+    Values that already live elsewhere (cache counters, model version) are exported by
+    collectors: callables run at scrape time that return (name, kind, documentation,
+    labels dict, value) tuples, so the hot path never updates them twice.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, kind, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register('counter', name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register('gauge', name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register('histogram', name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        for collector in self._collectors:
+            families = {}
+            for name, kind, documentation, labels, value in collector():
+                family = families.setdefault(name, [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"])
+                family.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+            for family in families.values():
+                lines += family
+        return '\n'.join(lines) + '\n'
+
+
+# --- 2. Tracing ---
+class _Stage:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        self.tracer._stage_histogram(self.name).observe(duration)
+        trace = getattr(self.tracer._local, 'trace', None)
+        if trace is not None:
+            trace['stages'].append((self.name, self.start - trace['perf_start'], duration))
+        return False
+
+
+class Tracer:
+    """
+    Times pipeline stages and requests into `<prefix>_stage_duration_seconds{stage}` and
+    `<prefix>_request_duration_seconds{endpoint}`, and counts `<prefix>_requests_total`.
+
+    Stages run inside a sampled request are also recorded on its trace, which end()
+    appends to `trace_path` as JSON. The current request is tracked per thread, so a stage
+    run on another thread (e.g. a batching worker) only feeds the histograms.
+
+    Args:
+        registry (MetricsRegistry): Where the metrics are registered.
+        prefix (str): Metric name prefix, e.g. 'ml' or 'rag'.
+        sample_rate (float): Fraction of requests written as traces; 0 disables tracing.
+        trace_path (str): JSON-lines file the sampled traces are appended to.
+    """
+
+    def __init__(self, registry, prefix, sample_rate=0.0, trace_path='traces.jsonl'):
+        self.sample_rate = sample_rate
+        self.trace_path = trace_path
+        self.stage_seconds = registry.histogram(f"{prefix}_stage_duration_seconds", "Time spent in each pipeline stage.", ('stage',))
+        self.request_seconds = registry.histogram(f"{prefix}_request_duration_seconds", "Request latency, until the response is returned to the server.", ('endpoint',))
+        self.requests_total = registry.counter(f"{prefix}_requests_total", "Requests handled, by endpoint and HTTP status.", ('endpoint', 'status'))
+        self._stage_children = {}
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _stage_histogram(self, name):
+        child = self._stage_children.get(name)
+        if child is None:
+            child = self._stage_children[name] = self.stage_seconds.labels(name)
+        return child
+
+    def stage(self, name):
+        """Context manager timing one stage."""
+        return _Stage(self, name)
+
+    def begin(self, endpoint):
+        """Marks the start of a request on this thread and decides whether to sample it."""
+        self._local.request = (endpoint, time.perf_counter())
+        sampled = self.sample_rate and random.random() < self.sample_rate
+        self._local.trace = {'perf_start': time.perf_counter(), 'stages': [], 'attributes': {}} if sampled else None
+
+    def annotate(self, **attributes):
+        """Attaches attributes (cache hit, batch size...) to the current sampled trace, if any."""
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace['attributes'].update(attributes)
+
+    def end(self, status):
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            return
+        endpoint, start = request
+        duration = time.perf_counter() - start
+        self.request_seconds.labels(endpoint).observe(duration)
+        self.requests_total.labels(endpoint, str(status)).inc()
+        trace, self._local.trace, self._local.request = getattr(self._local, 'trace', None), None, None
+        if trace is not None:
+            self._write_trace(endpoint, status, duration, trace)
+
+    def _write_trace(self, endpoint, status, duration, trace):
+        record = {
+            'trace_id': uuid.uuid4().hex,
+            'endpoint': endpoint,
+            'status': status,
+            'timestamp': time.time() - duration,
+            'duration_ms': duration * 1000,
+            'stages': [{'stage': name, 'offset_ms': offset * 1000, 'duration_ms': length * 1000}
+                       for name, offset, length in trace['stages']],
+            'attributes': trace['attributes'],
+            'pid': os.getpid(),
+        }
+        try:
+            with self._write_lock, open(self.trace_path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        except OSError as e:
+            print(f"Could not write trace to {self.trace_path}: {e}")
+
+    def instrument(self, app):
+        """
+        Times every request of a Flask app. Streamed responses are timed until the
+        response object is returned, i.e. time to first byte.
+        """
+        from flask import request
+
+        @app.before_request
+        def _begin_trace():
+            self.begin(request.url_rule.rule if request.url_rule else 'unmatched')
+
+        @app.after_request
+        def _end_trace(response):
+            self.end(response.status_code)
+            return response
+
+
+# --- 3. Sampling Profiler ---
+class SamplingProfiler:
+    """
+    Statistical profiler for finding hot spots in a live process.
+
+    Samples the stacks of all other threads every `interval` seconds and returns them in
+    the collapsed format ("outer;inner;leaf count" per line) read by flamegraph.pl and
+    speedscope. Only one profile runs at a time; the sampling thread costs roughly one
+    stack walk per thread per interval while active, and nothing otherwise.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stack(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def profile(self, seconds):
+        """
+        Samples for `seconds` and returns the collapsed stacks, most frequent first.
+
+        Raises:
+            RuntimeError: If another profile is already running in this process.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running in this process.")
+        try:
+            own_thread = threading.get_ident()
+            tally = _Tally()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_thread:
+                        tally[self._stack(frame)] += 1
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+        return ''.join(f"{stack} {count}\n" for stack, count in tally.most_common())
@@ -0,0 +1,36 @@
+import json
+
+from niyantrana_common.tracing import MetricsRegistry, Tracer
+
+
+def test_render_counters_histograms_and_collectors():
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', "Jobs run.", ('kind',)).labels('a"b').inc(2)
+    registry.histogram('wait_seconds', "Wait.", buckets=(0.1, 1.0)).observe(0.5)
+    registry.add_collector(lambda: [('queue_depth', 'gauge', "Queued jobs.", {}, 3)])
+
+    text = registry.render()
+    assert 'jobs_total{kind="a\\"b"} 2.0' in text
+    assert 'wait_seconds_bucket{le="0.1"} 0' in text
+    assert 'wait_seconds_bucket{le="1.0"} 1' in text
+    assert 'wait_seconds_bucket{le="+Inf"} 1' in text
+    assert 'wait_seconds_count 1' in text
+    assert '# TYPE queue_depth gauge\nqueue_depth 3' in text
+
+
+def test_sampled_request_is_written_as_a_trace(tmp_path):
+    trace_path = tmp_path / 'traces.jsonl'
+    registry = MetricsRegistry()
+    tracer = Tracer(registry, 'svc', sample_rate=1.0, trace_path=str(trace_path))
+
+    tracer.begin('/work')
+    with tracer.stage('parse'):
+        pass
+    tracer.annotate(cache_hit=False)
+    tracer.end(200)
+
+    record = json.loads(trace_path.read_text())
+    assert record['endpoint'] == '/work' and record['status'] == 200
+    assert [stage['stage'] for stage in record['stages']] == ['parse']
+    assert record['attributes'] == {'cache_hit': False}
+    assert 'svc_requests_total{endpoint="/work",status="200"} 1.0' in registry.render()
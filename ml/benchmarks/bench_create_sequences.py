@@ -0,0 +1,91 @@
+"""
+Compares the vectorized create_sequences() with the original per-window loop.
+
+Checks that both produce byte-identical arrays, then reports timings for growing
+dataset sizes. Run from the ml/ directory:
+
+    python -m benchmarks.bench_create_sequences --users 50 200 1000 --days 120
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import create_sequences, TIME_SERIES_FEATURES, TABULAR_FEATURES, TARGET_FEATURES
+
+
+def make_synthetic_history(num_users, num_days, seed=0):
+    """Random daily records with the same columns as the raw synthetic CSV."""
+    rng = np.random.default_rng(seed)
+    n = num_users * num_days
+    df = pd.DataFrame({
+        'user_id': np.repeat([f"user_{i:05d}" for i in range(num_users)], num_days),
+        'date': np.tile(pd.date_range('2024-01-01', periods=num_days), num_users),
+        'gender': np.repeat(rng.choice(['M', 'F'], num_users), num_days),
+        'age': np.repeat(rng.integers(20, 70, num_users), num_days),
+        'bmi': np.repeat(rng.uniform(18, 38, num_users), num_days),
+        'has_hereditary_risk': np.repeat(rng.integers(0, 2, num_users), num_days),
+        'tee': rng.uniform(1800, 3000, n),
+        'calorie_intake': rng.uniform(1500, 3500, n),
+        'fat_grams': rng.uniform(30, 130, n),
+        'carbs_grams': rng.uniform(150, 450, n),
+        'protein_grams': rng.uniform(40, 150, n),
+        'daily_steps': rng.integers(1000, 15000, n),
+        'active_minutes': rng.integers(0, 120, n),
+        'sleep_hours': rng.uniform(4, 9, n),
+        'sleep_quality_score': rng.integers(40, 100, n),
+        'resting_heart_rate': rng.integers(55, 90, n),
+        'heart_rate_variability': rng.integers(20, 80, n),
+        'triglycerides': rng.uniform(60, 300, n),
+        'ggt': rng.uniform(10, 120, n),
+        'trend_type': 'stable',
+    })
+    df['energy_balance'] = df['calorie_intake'] - df['tee']
+    df['cumulative_balance'] = df.groupby('user_id')['energy_balance'].cumsum()
+    # Shuffle so the sort inside create_sequences is exercised
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def create_sequences_loop(data, sequence_length=14):
+    """The original implementation, kept here as the reference for equivalence and speed."""
+    X_lstm, X_mlp, y = [], [], []
+    data['gender_numeric'] = data['gender'].apply(lambda x: 1 if x == 'M' else 0)
+    for user_id, group in data.groupby('user_id'):
+        user_data = group.sort_values('date')
+        if len(user_data) < sequence_length:
+            continue
+        for i in range(len(user_data) - sequence_length):
+            X_lstm.append(user_data.iloc[i:i+sequence_length][TIME_SERIES_FEATURES].values)
+            X_mlp.append(user_data.iloc[i+sequence_length][TABULAR_FEATURES].values)
+            y.append(user_data.iloc[i+sequence_length][TARGET_FEATURES].values)
+    return np.array(X_lstm, dtype=np.float32), np.array(X_mlp, dtype=np.float32), np.array(y, dtype=np.float32)
+
+
+def _timed(fn, df, sequence_length):
+    start = time.perf_counter()
+    result = fn(df.copy(), sequence_length)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[20, 100, 500])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--sequence-length', type=int, default=14)
+    parser.add_argument('--skip-loop-above', type=int, default=200000,
+                        help="Skip the slow reference loop for datasets with more rows than this.")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'windows':>10} {'loop (s)':>10} {'vectorized (s)':>15} {'speedup':>8}")
+    for num_users in args.users:
+        df = make_synthetic_history(num_users, args.days)
+        fast, fast_time = _timed(create_sequences, df, args.sequence_length)
+        if len(df) > args.skip_loop_above:
+            print(f"{len(df):>10} {len(fast[0]):>10} {'-':>10} {fast_time:>15.4f} {'-':>8}")
+            continue
+        slow, slow_time = _timed(create_sequences_loop, df, args.sequence_length)
+        for name, a, b in zip(('X_lstm', 'X_mlp', 'y'), fast, slow):
+            if a.shape != b.shape or a.tobytes() != b.tobytes():
+                raise AssertionError(f"{name} differs from the reference implementation.")
+        print(f"{len(df):>10} {len(fast[0]):>10} {slow_time:>10.4f} {fast_time:>15.4f} {slow_time / fast_time:>7.0f}x")
@@ -0,0 +1,182 @@
+"""
+Benchmark and load-test suite for the prediction service.
+
+Run from the ml/ directory once the model artifacts are in models/:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --quick --skip-http
+    python -m benchmarks.suite --concurrency 1 8 32 --duration 20 --output benchmarks/results/baseline.json
+
+Micro-benchmarks time predict_risk (the DataFrame API), predict_risk_from_json,
+predict_risk_batch and create_sequences. The HTTP benchmarks serve src/app.py in this
+process and drive /predict and /predict/batch with synthetic 14-day payloads at each
+concurrency level. Results are written as JSON; compare two runs with
+`python -m niyantrana_common.loadgen compare before.json after.json`.
+
+The prediction cache is disabled unless --with-cache is given, so every request runs the
+model. Set ML_INFERENCE_ENGINE etc. as for the service to benchmark another engine.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from niyantrana_common.loadgen import time_call, serve_in_process, run_load, environment, default_results_path, write_results, max_rss_mb
+
+
+# --- 1. Synthetic Payloads ---
+def make_watch_records(rng, days=14, start='2024-01-01'):
+    """Daily watch records in the /predict 'watch_data' schema."""
+    dates = np.datetime64(start) + np.arange(days)
+    return [
+        {
+            'date': str(date),
+            'daily_steps': int(rng.integers(1000, 15000)),
+            'active_minutes': int(rng.integers(0, 120)),
+            'sleep_hours': round(float(rng.uniform(4, 9)), 2),
+            'sleep_quality_score': int(rng.integers(40, 100)),
+            'resting_heart_rate': int(rng.integers(55, 90)),
+            'heart_rate_variability': int(rng.integers(20, 80)),
+        }
+        for date in dates
+    ]
+
+
+def make_user_profile(rng):
+    """A profile in the /predict 'user_data' schema."""
+    tee = float(rng.uniform(1800, 3000))
+    calorie_intake = float(rng.uniform(1500, 3500))
+    return {
+        'age': int(rng.integers(20, 70)),
+        'gender': str(rng.choice(['M', 'F'])),
+        'bmi': round(float(rng.uniform(18, 38)), 1),
+        'has_hereditary_risk': int(rng.integers(0, 2)),
+        'tee': round(tee),
+        'calorie_intake': round(calorie_intake),
+        'fat_grams': round(float(rng.uniform(30, 130)), 1),
+        'carbs_grams': round(float(rng.uniform(150, 450)), 1),
+        'protein_grams': round(float(rng.uniform(40, 150)), 1),
+        'energy_balance': round(calorie_intake - tee),
+        'cumulative_balance': round(float(rng.uniform(-20000, 20000))),
+    }
+
+
+def make_prediction_payloads(count, seed=0):
+    """Distinct {'watch_data', 'user_data'} payloads, as sent by the Express backend."""
+    rng = np.random.default_rng(seed)
+    return [{'watch_data': make_watch_records(rng), 'user_data': make_user_profile(rng)} for _ in range(count)]
+
+
+# --- 2. Micro-benchmarks ---
+def micro_benchmarks(payloads, repeats, batch_size, history_users, history_days):
+    import pandas as pd
+    from src.predict import predict_risk, predict_risk_from_json, predict_risk_batch, parse_json_inputs
+    from src.data_processing import create_sequences
+    from benchmarks.bench_create_sequences import make_synthetic_history
+
+    results = {}
+    frames = [(pd.DataFrame(p['watch_data']), pd.DataFrame([p['user_data']])) for p in payloads]
+    cycle = iter(range(10**9))
+
+    def one_frame():
+        watch, profile = frames[next(cycle) % len(frames)]
+        predict_risk(watch, profile)
+
+    def one_json():
+        payload = payloads[next(cycle) % len(payloads)]
+        predict_risk_from_json(payload['watch_data'], payload['user_data'])
+
+    arrays = [parse_json_inputs(p['watch_data'], p['user_data']) for p in payloads[:batch_size]]
+    watch_batch = np.stack([watch for watch, _ in arrays])
+    profile_batch = np.stack([profile for _, profile in arrays])
+
+    print("Timing predict_risk (DataFrame API)...")
+    results['predict_risk'] = time_call(one_frame, repeats)
+    print("Timing predict_risk_from_json...")
+    results['predict_risk_from_json'] = time_call(one_json, repeats)
+    print(f"Timing predict_risk_batch ({len(watch_batch)} users)...")
+    results['predict_risk_batch'] = time_call(lambda: predict_risk_batch(watch_batch, profile_batch),
+                                              max(repeats // 4, 10), items=len(watch_batch))
+
+    history = make_synthetic_history(history_users, history_days)
+    num_windows = len(create_sequences(history.copy())[0])
+    print(f"Timing create_sequences ({len(history)} rows, {num_windows} windows)...")
+    results['create_sequences'] = time_call(lambda: create_sequences(history.copy()), max(repeats // 40, 3),
+                                            warmup=1, items=num_windows)
+    return results
+
+
+# --- 3. HTTP Load ---
+def http_benchmarks(payloads, concurrency_levels, duration, max_requests, batch_size):
+    from src.app import app
+
+    batch_payloads = [{'requests': payloads[i:i + batch_size]} for i in range(0, len(payloads) - batch_size + 1, batch_size)]
+    results = {}
+    with serve_in_process(app) as base_url:
+        for concurrency in concurrency_levels:
+            print(f"Load testing /predict with {concurrency} concurrent clients...")
+            results[f"predict_c{concurrency}"] = run_load(base_url, '/predict', payloads, concurrency, duration, max_requests)
+        print(f"Load testing /predict/batch ({batch_size} users per request)...")
+        result = run_load(base_url, '/predict/batch', batch_payloads, max(concurrency_levels), duration, max_requests)
+        result['users_per_sec'] = result['throughput_rps'] * batch_size
+        results[f"predict_batch{batch_size}"] = result
+    return results
+
+
+def print_summary(benchmarks):
+    print(f"\n{'benchmark':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per sec':>11} {'peak RSS MB':>12}")
+    for name, result in benchmarks.get('micro', {}).items():
+        print(f"{name:<28} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+              f"{result['items_per_sec']:>11.1f} {'':>12}")
+    for name, result in benchmarks.get('http', {}).items():
+        latency = result['latency']
+        if not latency['count']:
+            print(f"{name:<28} all {result['requests']} requests failed: {result['status_counts']}")
+            continue
+        print(f"{name:<28} {latency['p50_ms']:>9.3f} {latency['p95_ms']:>9.3f} {latency['p99_ms']:>9.3f} "
+              f"{result['throughput_rps']:>11.1f} {result['rss_peak_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="Results JSON (default: benchmarks/results/ml-<commit>-<time>.json).")
+    parser.add_argument('--payloads', type=int, default=2000, help="Distinct synthetic payloads to cycle through.")
+    parser.add_argument('--repeats', type=int, default=400, help="Timed calls per micro-benchmark.")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--history-users', type=int, default=200, help="Users in the create_sequences input.")
+    parser.add_argument('--history-days', type=int, default=90)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per HTTP load level.")
+    parser.add_argument('--max-requests', type=int, default=0, help="Stop a load level after this many requests (0 = no limit).")
+    parser.add_argument('--with-cache', action='store_true', help="Keep the prediction cache enabled.")
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--quick', action='store_true', help="Short smoke run: fewer repeats, 2 s per load level.")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeats, args.duration, args.history_users = 50, 2.0, 50
+    # Must be set before src.predict is imported
+    if not args.with_cache:
+        os.environ['ML_PREDICTION_CACHE_SIZE'] = '0'
+
+    payloads = make_prediction_payloads(args.payloads)
+    benchmarks = {}
+    if not args.skip_micro:
+        benchmarks['micro'] = micro_benchmarks(payloads, args.repeats, args.batch_size, args.history_users, args.history_days)
+    if not args.skip_http:
+        benchmarks['http'] = http_benchmarks(payloads, args.concurrency, args.duration, args.max_requests, args.batch_size)
+
+    from src.registry import model_registry
+
+    results = {
+        'service': 'ml',
+        'environment': environment(),
+        'config': {**vars(args), 'model': model_registry.status(), 'prediction_cache': args.with_cache,
+                   'inference_engine': os.environ.get('ML_INFERENCE_ENGINE', 'auto'),
+                   'micro_batching': os.environ.get('ML_MICRO_BATCHING', '1') == '1'},
+        'benchmarks': benchmarks,
+        'max_rss_mb': max_rss_mb(),
+    }
+    print_summary(benchmarks)
+    write_results(results, args.output or default_results_path('ml'))
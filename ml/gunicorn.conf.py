@@ -0,0 +1,52 @@
+# Gunicorn settings for the ML prediction service.
+# Run from the ml/ directory: gunicorn -c gunicorn.conf.py src.app:app
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('ML_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('ML_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('ML_THREADS', '4'))  # lets the micro-batcher see concurrent requests
+timeout = 30
+
+# Import the app once in the master, then fork. The NumPy engine's model is loaded there
+# too: its weight arrays are never written after loading, so their pages stay shared
+# copy-on-write. TensorFlow and ONNX Runtime thread pools don't survive a fork, so any
+# other engine (including 'auto' when only the Keras .h5 is present) is loaded by each
+# worker after the fork instead. ML_PRELOAD_MODEL=0 defers every load to the workers.
+preload_app = True
+
+
+def _load_model(log):
+    from src.registry import model_registry, ModelNotAvailableError
+    try:
+        model_registry.load()
+    except ModelNotAvailableError as e:
+        # Workers still start; they report 503 on /ready and retry the load lazily
+        log.warning(f"Model load failed: {e}")
+
+
+def on_starting(server):
+    if os.environ.get('ML_PRELOAD_MODEL', '1') != '1':
+        return
+    from src.registry import model_registry, ModelNotAvailableError
+    try:
+        engine = model_registry.resolved_engine()
+    except ModelNotAvailableError as e:
+        server.log.warning(f"Model preload skipped: {e}")
+        return
+    if engine != 'numpy':
+        server.log.info(f"Not preloading the {engine} model in the master; each worker loads its own.")
+        return
+    _load_model(server.log)
+
+
+def post_fork(server, worker):
+    # No-op when the master already loaded the (NumPy) model
+    _load_model(worker.log)
+
+
+def when_ready(server):
+    # Move everything allocated so far out of the GC's view so collections in the workers
+    # don't touch (and un-share) the master's pages.
+    gc.freeze()
@@ -1,12 +1,70 @@
-from flask import Flask, request, jsonify
-import pandas as pd
+from flask import Flask, Response, request, jsonify
 import numpy as np
+import atexit
+import os
 
-# Import your prediction function from predict.py
-from src.predict import predict_risk
+# Import your prediction functions from predict.py
+from src.predict import (
+    predict_risk_from_json, predict_risk_batch, predict_risk_scaled, parse_json_inputs,
+    cached_prediction, prediction_cache, metrics, tracer
+)
+from src.registry import model_registry, ModelNotAvailableError
+from src.batching import MicroBatcher
+from src.feature_state import FeatureStateStore
+from src.feature_plan import SEQUENCE_LENGTH
+from niyantrana_common.tracing import SamplingProfiler, PROMETHEUS_CONTENT_TYPE
 
 # Initialize the Flask application
 app = Flask(__name__)
+tracer.instrument(app)
+
+# --- Micro-batching of concurrent /predict calls ---
+# A request with nothing queued behind it runs at once; under concurrent load, requests
+# wait up to ML_BATCH_MAX_WAIT_MS to share a forward pass. Set ML_MICRO_BATCHING=0 to run
+# every request as its own forward pass.
+MICRO_BATCHING = os.environ.get('ML_MICRO_BATCHING', '1') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('ML_BATCH_MAX_SIZE', '32'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('ML_BATCH_MAX_WAIT_MS', '5'))
+
+micro_batch_sizes = metrics.histogram(
+    'ml_micro_batch_size', "Requests per micro-batched forward pass.", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+def run_micro_batch(watch_batch, profile_batch):
+    micro_batch_sizes.observe(len(watch_batch))
+    return predict_risk_batch(watch_batch, profile_batch)
+
+
+batcher = MicroBatcher(run_micro_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS) if MICRO_BATCHING else None
+
+# --- Rolling per-user feature state for /predict/daily ---
+# Set ML_FEATURE_STATE_DB to a SQLite file to keep the state across restarts.
+feature_store = FeatureStateStore(
+    snapshot_path=os.environ.get('ML_FEATURE_STATE_DB'),
+    snapshot_interval=float(os.environ.get('ML_FEATURE_STATE_SNAPSHOT_INTERVAL', '60')),
+)
+atexit.register(feature_store.snapshot)
+
+# --- Opt-in sampling profiler: ML_PROFILING=1 enables GET /debug/profile ---
+PROFILING = os.environ.get('ML_PROFILING', '0') == '1'
+profiler = SamplingProfiler(interval=float(os.environ.get('ML_PROFILER_INTERVAL', '0.005')))
+
+
+def is_admin_request():
+    """True unless ML_ADMIN_TOKEN is set and the X-Admin-Token header doesn't match it."""
+    admin_token = os.environ.get('ML_ADMIN_TOKEN')
+    return not admin_token or request.headers.get('X-Admin-Token') == admin_token
+
+
+def parse_prediction_request(json_data):
+    """
+    Converts one {'watch_data': [...], 'user_data': {...}} payload into the
+    raw (watch_array, profile_array) inputs of predict_risk_batch.
+    """
+    # The watch data should be a list of 14 daily records, the user data a single record
+    return parse_json_inputs(json_data.get('watch_data'), json_data.get('user_data'))
+
 
 @app.route('/predict', methods=['POST'])
 def handle_prediction():
@@ -20,24 +78,26 @@ def handle_prediction():
         return jsonify({"error": "No input data provided"}), 400
 
     try:
-        # 2. Convert the JSON data into the pandas DataFrames that our function expects
-        # The watch data should be a list of 14 daily records
-        watch_data_list = json_data.get('watch_data')
-        # The user data is a single record, so we put it in a list
-        user_data_dict = json_data.get('user_data')
-        
-        if not watch_data_list or not user_data_dict:
-            return jsonify({"error": "Missing 'watch_data' or 'user_data' in JSON payload"}), 400
-
-        time_series_df = pd.DataFrame(watch_data_list)
-        tabular_df = pd.DataFrame([user_data_dict])
-
-        # 3. Call our prediction function
-        prediction_result = predict_risk(time_series_df, tabular_df)
-
-        # 4. Return the prediction as a JSON response
+        # 2. Call our prediction function (through the micro-batcher when enabled)
+        if batcher is not None:
+            with tracer.stage('parse'):
+                watch_array, profile_array = parse_prediction_request(json_data)
+            # Cache hits skip the micro-batcher's wait entirely
+            prediction_result = cached_prediction(watch_array, profile_array)
+            tracer.annotate(cache_hit=prediction_result is not None)
+            if prediction_result is None:
+                # Queueing, the batched forward pass and the wait for its result
+                with tracer.stage('micro_batch'):
+                    prediction_result = batcher.predict(watch_array, profile_array)
+        else:
+            prediction_result = predict_risk_from_json(json_data.get('watch_data'), json_data.get('user_data'))
+
+        # 3. Return the prediction as a JSON response
         return jsonify(prediction_result)
 
+    except ModelNotAvailableError as e:
+        # The worker stays up; the model is retried on the next request
+        return jsonify({"error": f"Model is not available: {str(e)}"}), 503
     except (ValueError, TypeError, KeyError) as e:
         # Handle potential errors in data format or prediction
         return jsonify({"error": f"An error occurred: {str(e)}"}), 400
@@ -45,7 +105,167 @@ def handle_prediction():
         # Handle unexpected server errors
         return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
 
+
+@app.route('/predict/batch', methods=['POST'])
+def handle_batch_prediction():
+    """
+    Scores many users in one forward pass.
+
+    Expects {"requests": [{"watch_data": [...], "user_data": {...}}, ...]} and returns
+    {"predictions": [...]} in the same order.
+    """
+    json_data = request.get_json()
+
+    if not json_data or not isinstance(json_data.get('requests'), list):
+        return jsonify({"error": "Expected a 'requests' list in JSON payload"}), 400
+
+    try:
+        with tracer.stage('parse'):
+            arrays = [parse_prediction_request(item) for item in json_data['requests']]
+        if not arrays:
+            return jsonify({"predictions": []})
+        watch_batch = np.stack([watch for watch, _ in arrays])
+        profile_batch = np.stack([profile for _, profile in arrays])
+
+        return jsonify({"predictions": predict_risk_batch(watch_batch, profile_batch)})
+
+    except ModelNotAvailableError as e:
+        return jsonify({"error": f"Model is not available: {str(e)}"}), 503
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+
+@app.route('/predict/daily', methods=['POST'])
+def handle_daily_prediction():
+    """
+    Incremental prediction from today's record only.
+
+    Expects {"user_id": ..., "day": {watch fields, optional "date", diet fields, "tee"}}.
+    "user_data" is required until the service has a profile for the user, and "history"
+    (earlier daily records, oldest first) can seed a new user's 14-day window.
+    Returns 409 while fewer than 14 days are known.
+    """
+    json_data = request.get_json()
+
+    if not json_data:
+        return jsonify({"error": "No input data provided"}), 400
+
+    try:
+        user_id = json_data['user_id']
+        day = json_data['day']
+        bundle = model_registry.get()
+        with tracer.stage('feature_state'):
+            X_lstm, X_mlp, state = feature_store.update(
+                str(user_id), day, bundle.feature_plan,
+                user_data=json_data.get('user_data'), history=json_data.get('history')
+            )
+
+        summary = {
+            "days_available": min(state.count, SEQUENCE_LENGTH),
+            "energy_balance": state.energy_balance,
+            "cumulative_balance": state.cumulative_balance,
+        }
+        if X_lstm is None:
+            missing = "'user_data'" if not state.has_profile else f"{SEQUENCE_LENGTH - state.count} more day(s)"
+            return jsonify({"error": f"Not enough data to predict yet: send {missing}.", **summary}), 409
+
+        prediction_result = predict_risk_scaled(X_lstm[np.newaxis], X_mlp[np.newaxis], bundle)[0]
+        return jsonify({**prediction_result, **summary})
+
+    except ModelNotAvailableError as e:
+        return jsonify({"error": f"Model is not available: {str(e)}"}), 503
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+
+def collect_service_metrics():
+    """Prediction cache counters and the loaded model, read at scrape time."""
+    stats = prediction_cache.stats()
+    yield 'ml_prediction_cache_hits_total', 'counter', "Prediction cache hits.", {}, stats['hits']
+    yield 'ml_prediction_cache_misses_total', 'counter', "Prediction cache misses.", {}, stats['misses']
+    yield 'ml_prediction_cache_evictions_total', 'counter', "Entries evicted to respect the size limit.", {}, stats['evictions']
+    yield 'ml_prediction_cache_invalidations_total', 'counter', "Times the cache was cleared because a new model was loaded.", {}, stats['invalidations']
+    yield 'ml_prediction_cache_hit_rate', 'gauge', "Hits over lookups since the worker started.", {}, stats['hit_rate']
+    yield 'ml_prediction_cache_entries', 'gauge', "Entries in the prediction cache.", {}, stats['size']
+    yield 'ml_feature_state_users', 'gauge', "Users with rolling feature state.", {}, len(feature_store)
+    status = model_registry.status()
+    yield 'ml_model_ready', 'gauge', "1 when a model is loaded.", {}, int(status['ready'])
+    if status['ready']:
+        labels = {'version': status['model_version'], 'engine': status['engine'], 'precision': status['precision']}
+        yield 'ml_model_info', 'gauge', "The loaded model version.", labels, 1
+
+
+metrics.add_collector(collect_service_metrics)
+
+
+@app.route('/metrics', methods=['GET'])
+def handle_metrics():
+    """
+    Prometheus metrics for this worker process: request and per-stage latency histograms,
+    micro-batch sizes, prediction cache counters and the loaded model version.
+    """
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/debug/profile', methods=['GET'])
+def handle_profile():
+    """
+    Samples this worker's stacks for ?seconds=N (default 10, at most 60) and returns them
+    in collapsed format for flamegraph.pl or speedscope. Requires ML_PROFILING=1, and the
+    X-Admin-Token header when ML_ADMIN_TOKEN is set.
+    """
+    if not PROFILING:
+        return jsonify({"error": "Profiling is disabled. Set ML_PROFILING=1 to enable it."}), 404
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        seconds = min(float(request.args.get('seconds', '10')), 60.0)
+        return Response(profiler.profile(seconds), mimetype='text/plain')
+    except ValueError:
+        return jsonify({"error": "'seconds' must be a number"}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+
+@app.route('/health', methods=['GET'])
+def handle_health():
+    """Liveness: the process is up and serving HTTP, whether or not the model is loaded."""
+    return jsonify({"status": "ok", **model_registry.status()})
+
+
+@app.route('/ready', methods=['GET'])
+def handle_ready():
+    """Readiness: loads the model if needed and reports 503 until it can serve predictions."""
+    try:
+        model_registry.get()
+    except ModelNotAvailableError:
+        return jsonify(model_registry.status()), 503
+    return jsonify(model_registry.status())
+
+
+@app.route('/admin/reload', methods=['POST'])
+def handle_reload():
+    """
+    Hot-reloads the model in this process, optionally from a new {"model_dir": ...}.
+
+    Requires the X-Admin-Token header when ML_ADMIN_TOKEN is set. Under gunicorn this
+    only reaches one worker; use ML_MODEL_RELOAD_INTERVAL to roll out new files to all of them.
+    """
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    json_data = request.get_json(silent=True) or {}
+    try:
+        model_registry.reload(json_data.get('model_dir'))
+    except ModelNotAvailableError as e:
+        return jsonify({"error": str(e), **model_registry.status()}), 503
+    return jsonify(model_registry.status())
+
 if __name__ == '__main__':
-    # Run the Flask app
+    # Development server only; in production run `gunicorn -c gunicorn.conf.py src.app:app`
     # The host='0.0.0.0' makes it accessible from your Express.js app
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
@@ -0,0 +1,90 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-user prediction requests and runs them as one batched forward pass.
+
+    A background thread waits for the first request. If no other request is queued behind
+    it, the request runs at once, so a lone caller never pays for the batching window.
+    Otherwise the thread keeps collecting for at most `max_wait_ms` (or until
+    `max_batch_size` requests are queued) before calling `batch_fn` on the stacked inputs.
+    Each caller blocks only on its own result.
+
+    The thread is started on first use and restarted in a forked child, so the batcher can
+    be created in a preloading gunicorn master.
+
+    Args:
+        batch_fn (callable): Takes (watch_batch, profile_batch) arrays and returns one result per row.
+        max_batch_size (int): Upper bound on the number of requests per forward pass.
+        max_wait_ms (float): How long the first request of a batch may wait for others to join.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() or not self._worker.is_alive():
+                # Threads do not survive fork(), and the parent's queue may hold its own requests
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, args=(self._queue,), name='micro-batcher', daemon=True)
+                self._worker.start()
+                self._pid = os.getpid()
+
+    def submit(self, watch_array, profile_array):
+        """Queues one user's inputs and returns a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((watch_array, profile_array, future))
+        return future
+
+    def predict(self, watch_array, profile_array, timeout=None):
+        """Blocking helper around submit()."""
+        return self.submit(watch_array, profile_array).result(timeout=timeout)
+
+    def _collect(self, work_queue):
+        items = [work_queue.get()]
+        if work_queue.empty():
+            return items
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(work_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self, work_queue):
+        while True:
+            items = self._collect(work_queue)
+            futures = [item[2] for item in items]
+            try:
+                watch_batch = np.stack([item[0] for item in items])
+                profile_batch = np.stack([item[1] for item in items])
+                results = self.batch_fn(watch_batch, profile_batch)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a time-to-live for prediction results.
+
+    Keys are fingerprints of the model version and the raw float32 input arrays, so
+    JSON payloads that differ only in key order or int/float spelling share an entry,
+    and entries from an older model version can never be returned.
+
+    Args:
+        max_size (int): Maximum number of entries; 0 disables the cache.
+        ttl (float): Seconds an entry stays valid; 0 means no expiry.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(model_version, *arrays):
+        digest = hashlib.blake2b(model_version.encode(), digest_size=16)
+        for array in arrays:
+            digest.update(np.ascontiguousarray(array, dtype=np.float32).tobytes())
+        return digest.digest()
+
+    def get(self, key, record_miss=True):
+        """Returns a copy of the cached value or None. Pass record_miss=False for a pre-check that is followed by a counted lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (not self.ttl or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            if record_miss:
+                self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -1,8 +1,8 @@
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
 import joblib
-import os
 
 def load_data(filepath):
     """Loads the final synthetic data from the CSV file."""
@@ -10,41 +10,77 @@ def load_data(filepath):
     df = pd.read_csv(filepath, parse_dates=['date'])
     return df
 
-def create_sequences(data, sequence_length=14):
+TIME_SERIES_FEATURES = [
+    'daily_steps', 'active_minutes', 'sleep_hours',
+    'sleep_quality_score', 'resting_heart_rate', 'heart_rate_variability'
+]
+TABULAR_FEATURES = [
+    'age', 'gender_numeric', 'bmi', 'has_hereditary_risk', 'calorie_intake',
+    'fat_grams', 'carbs_grams', 'protein_grams'
+]
+TARGET_FEATURES = ['triglycerides', 'ggt']
+# Raw columns that are not scaled with the feature scaler
+NON_FEATURE_COLS = ['user_id', 'date', 'gender', 'triglycerides', 'ggt', 'trend_type']
+
+
+def _as_float32(df, cols):
+    # Same rounding path as the old per-window `.values` -> np.array(dtype=float32) conversion
+    return df[cols].to_numpy(dtype=np.float64).astype(np.float32)
+
+
+def window_starts(user_ids, sequence_length):
+    """
+    Row indices (into rows sorted by user and date) at which a full window starts.
+
+    A window covers rows [s, s + sequence_length) and its target is row s + sequence_length,
+    so both must belong to the same user. Users with `sequence_length` rows or fewer give none.
+    """
+    n = len(user_ids)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    boundaries = np.flatnonzero(user_ids[1:] != user_ids[:-1]) + 1
+    block_starts = np.concatenate(([0], boundaries))
+    block_lengths = np.diff(np.concatenate((block_starts, [n])))
+    counts = np.maximum(block_lengths - sequence_length, 0)
+    # Concatenation of arange(start, start + count) for every user, without a Python loop
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(block_starts, counts) + offsets
+
+
+def create_sequences(data, sequence_length=14, return_users=False):
     """
     Reshapes the data into sequences for the LSTM and corresponding tabular data for the MLP.
+
+    Rows are sorted once by (user_id, date) so every user is a contiguous block; the
+    windows are then strided views over that block and are gathered into output arrays
+    sized up front. Dates are assumed to be unique per user.
+
+    With `return_users`, also returns the user number (0..num_users-1) of every window,
+    for splits that keep each user's windows on one side.
     """
     print(f"Creating sequences with a look-back window of {sequence_length} days...")
-    
-    time_series_features = [
-        'daily_steps', 'active_minutes', 'sleep_hours', 
-        'sleep_quality_score', 'resting_heart_rate', 'heart_rate_variability'
-    ]
-    tabular_features = [
-        'age', 'gender_numeric', 'bmi', 'has_hereditary_risk', 'calorie_intake', 
-        'fat_grams', 'carbs_grams', 'protein_grams'
-    ]
-    target_features = ['triglycerides', 'ggt']
-
-    X_lstm, X_mlp, y = [], [], []
-    
+
     # Convert gender to a numeric format for the model
-    data['gender_numeric'] = data['gender'].apply(lambda x: 1 if x == 'M' else 0)
-    
-    for user_id, group in data.groupby('user_id'):
-        user_data = group.sort_values('date')
-        if len(user_data) < sequence_length:
-            continue
-        for i in range(len(user_data) - sequence_length):
-            lstm_seq = user_data.iloc[i:i+sequence_length][time_series_features].values
-            X_lstm.append(lstm_seq)
-            mlp_data = user_data.iloc[i+sequence_length][tabular_features].values
-            X_mlp.append(mlp_data)
-            target_vals = user_data.iloc[i+sequence_length][target_features].values
-            y.append(target_vals)
-
-    # Explicitly convert to float32 to prevent dtype errors in TensorFlow
-    return np.array(X_lstm, dtype=np.float32), np.array(X_mlp, dtype=np.float32), np.array(y, dtype=np.float32)
+    data['gender_numeric'] = (data['gender'] == 'M').astype(np.int64)
+
+    ordered = data[data['user_id'].notna()].sort_values(['user_id', 'date'], kind='stable')
+    starts = window_starts(ordered['user_id'].to_numpy(), sequence_length)
+    num_windows = len(starts)
+
+    X_lstm = np.empty((num_windows, sequence_length, len(TIME_SERIES_FEATURES)), dtype=np.float32)
+    X_mlp = np.empty((num_windows, len(TABULAR_FEATURES)), dtype=np.float32)
+    y = np.empty((num_windows, len(TARGET_FEATURES)), dtype=np.float32)
+    users = pd.factorize(ordered['user_id'])[0][starts].astype(np.int64)
+    if num_windows == 0:
+        return (X_lstm, X_mlp, y, users) if return_users else (X_lstm, X_mlp, y)
+
+    time_series = _as_float32(ordered, TIME_SERIES_FEATURES)
+    # (rows - sequence_length + 1, features, sequence_length) view, no copy
+    windows = sliding_window_view(time_series, sequence_length, axis=0)
+    np.take(windows.transpose(0, 2, 1), starts, axis=0, out=X_lstm)
+    np.take(_as_float32(ordered, TABULAR_FEATURES), starts + sequence_length, axis=0, out=X_mlp)
+    np.take(_as_float32(ordered, TARGET_FEATURES), starts + sequence_length, axis=0, out=y)
+    return (X_lstm, X_mlp, y, users) if return_users else (X_lstm, X_mlp, y)
 
 
 if __name__ == '__main__':
@@ -60,8 +96,8 @@ if __name__ == '__main__':
     
     # 2. Scale the data and save the scalers
     print("Scaling features and targets separately...")
-    feature_cols = main_df.columns.drop(['user_id', 'date', 'gender', 'triglycerides', 'ggt', 'trend_type'])
-    target_cols = ['triglycerides', 'ggt']
+    feature_cols = main_df.columns.drop(NON_FEATURE_COLS)
+    target_cols = TARGET_FEATURES
 
     feature_scaler = MinMaxScaler()
     main_df[feature_cols] = feature_scaler.fit_transform(main_df[feature_cols])
@@ -75,10 +111,10 @@ if __name__ == '__main__':
     
     # 3. Create the LSTM sequences and MLP inputs
     SEQUENCE_LENGTH = 14
-    X_lstm, X_mlp, y = create_sequences(main_df, sequence_length=SEQUENCE_LENGTH)
+    X_lstm, X_mlp, y, window_users = create_sequences(main_df, sequence_length=SEQUENCE_LENGTH, return_users=True)
     
-    # 4. Save the processed data
-    np.savez(PROCESSED_DATA_PATH, X_lstm=X_lstm, X_mlp=X_mlp, y=y)
+    # 4. Save the processed data (window_users lets train.py split by user)
+    np.savez(PROCESSED_DATA_PATH, X_lstm=X_lstm, X_mlp=X_mlp, y=y, window_users=window_users)
     
     print("\n--- Data Processing Complete ---")
     print(f"Processed data saved to {PROCESSED_DATA_PATH}")
\ No newline at end of file
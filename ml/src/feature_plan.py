@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+
+# --- 1. Feature Layout ---
+SEQUENCE_LENGTH = 14
+
+# Column order the feature scaler was fitted on in data_processing.py
+FEATURE_COLS = ['age', 'bmi', 'has_hereditary_risk', 'tee', 'calorie_intake', 'fat_grams', 'carbs_grams', 'protein_grams', 'daily_steps', 'active_minutes', 'sleep_hours', 'sleep_quality_score', 'resting_heart_rate', 'heart_rate_variability', 'energy_balance', 'cumulative_balance']
+
+# Watch features, one row per day (LSTM branch)
+TIME_SERIES_FEATURES = ['daily_steps', 'active_minutes', 'sleep_hours', 'sleep_quality_score', 'resting_heart_rate', 'heart_rate_variability']
+
+# Profile features, one row per user (MLP branch). Same order as create_sequences() used in training.
+TABULAR_FEATURES = ['age', 'gender_numeric', 'bmi', 'has_hereditary_risk', 'calorie_intake', 'fat_grams', 'carbs_grams', 'protein_grams']
+
+# gender_numeric is added after scaling during training, so it passes through unscaled
+UNSCALED_FEATURES = {'gender_numeric'}
+
+
+def gender_to_numeric(gender):
+    return 1.0 if gender == 'M' else 0.0
+
+
+# --- 2. Raw Input Conversion ---
+def records_to_arrays(watch_data_list, user_data_dict):
+    """
+    Converts the JSON payload of /predict straight into raw model inputs, without pandas.
+
+    Args:
+        watch_data_list (list): Daily watch records (dicts keyed by TIME_SERIES_FEATURES).
+        user_data_dict (dict): The user's profile, including 'gender'.
+
+    Returns:
+        tuple: (watch_array of shape (days, 6), profile_array of shape (8,)), both float32 and unscaled.
+    """
+    watch_array = np.array([[day[col] for col in TIME_SERIES_FEATURES] for day in watch_data_list], dtype=np.float32)
+    profile_array = np.array(
+        [gender_to_numeric(user_data_dict['gender']) if col == 'gender_numeric' else user_data_dict[col] for col in TABULAR_FEATURES],
+        dtype=np.float32
+    )
+    return watch_array, profile_array
+
+
+def frames_to_arrays(time_series_data, tabular_data):
+    """Same as records_to_arrays(), for the DataFrame inputs of predict_risk()."""
+    profile = tabular_data.iloc[0]
+    watch_array = time_series_data[TIME_SERIES_FEATURES].to_numpy(dtype=np.float32)
+    profile_array = np.array(
+        [gender_to_numeric(profile['gender']) if col == 'gender_numeric' else profile[col] for col in TABULAR_FEATURES],
+        dtype=np.float32
+    )
+    return watch_array, profile_array
+
+
+# --- 3. Precompiled Scaling Plan ---
+class FeaturePlan:
+    """
+    The fitted feature MinMaxScaler compiled down to per-branch NumPy vectors.
+
+    Column positions are resolved once when the plan is built. transform() then writes
+    `x * scale_ + min_` straight into float32 buffers that are reused across calls,
+    so no DataFrames or temporary feature matrices are created per request.
+
+    Buffers are per thread and are overwritten by the next transform() on the same
+    thread; copy the outputs if they need to outlive that.
+    """
+
+    def __init__(self, feature_scaler):
+        fitted_cols = list(getattr(feature_scaler, 'feature_names_in_', FEATURE_COLS))
+        scale = np.asarray(feature_scaler.scale_, dtype=np.float32)
+        offset = np.asarray(feature_scaler.min_, dtype=np.float32)
+
+        ts_idx = [fitted_cols.index(col) for col in TIME_SERIES_FEATURES]
+        self.ts_scale = scale[ts_idx]
+        self.ts_min = offset[ts_idx]
+
+        self.tab_scale = np.ones(len(TABULAR_FEATURES), dtype=np.float32)
+        self.tab_min = np.zeros(len(TABULAR_FEATURES), dtype=np.float32)
+        for pos, col in enumerate(TABULAR_FEATURES):
+            if col not in UNSCALED_FEATURES:
+                self.tab_scale[pos] = scale[fitted_cols.index(col)]
+                self.tab_min[pos] = offset[fitted_cols.index(col)]
+
+        self._local = threading.local()
+
+    def _buffers(self, n):
+        lstm_buf = getattr(self._local, 'lstm', None)
+        if lstm_buf is None or lstm_buf.shape[0] < n:
+            capacity = max(n, 1)
+            self._local.lstm = np.empty((capacity, SEQUENCE_LENGTH, len(TIME_SERIES_FEATURES)), dtype=np.float32)
+            self._local.mlp = np.empty((capacity, len(TABULAR_FEATURES)), dtype=np.float32)
+        return self._local.lstm[:n], self._local.mlp[:n]
+
+    def transform(self, watch_batch, profile_batch):
+        """
+        Scales raw batches into model inputs.
+
+        Args:
+            watch_batch (np.ndarray): Shape (N, 14, 6), TIME_SERIES_FEATURES order.
+            profile_batch (np.ndarray): Shape (N, 8), TABULAR_FEATURES order.
+
+        Returns:
+            tuple: (X_lstm, X_mlp) as float32 views into this thread's buffers.
+        """
+        X_lstm, X_mlp = self._buffers(watch_batch.shape[0])
+        np.multiply(watch_batch, self.ts_scale, out=X_lstm, casting='unsafe')
+        X_lstm += self.ts_min
+        np.multiply(profile_batch, self.tab_scale, out=X_mlp, casting='unsafe')
+        X_mlp += self.tab_min
+        return X_lstm, X_mlp
+
+    def scale_days(self, watch_rows):
+        """Scales individual days of watch data, shape (..., 6), into a new array."""
+        return np.asarray(watch_rows, dtype=np.float32) * self.ts_scale + self.ts_min
+
+    def scale_profile(self, profile_array):
+        """Scales one or more profile rows, shape (..., 8), into a new array."""
+        return np.asarray(profile_array, dtype=np.float32) * self.tab_scale + self.tab_min
+
+
+def compile_target_inverse(target_scaler):
+    """Returns (scale, offset) such that `scaled * scale + offset` matches target_scaler.inverse_transform."""
+    scale = np.asarray(target_scaler.scale_, dtype=np.float64)
+    offset = np.asarray(target_scaler.min_, dtype=np.float64)
+    return 1.0 / scale, -offset / scale
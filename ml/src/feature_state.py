@@ -0,0 +1,249 @@
+import os
+import sqlite3
+from contextlib import closing
+import threading
+import time
+
+import numpy as np
+
+from src.feature_plan import SEQUENCE_LENGTH, TIME_SERIES_FEATURES, TABULAR_FEATURES, gender_to_numeric
+
+# Daily diet fields that may arrive with today's record and update the user's profile
+DAILY_PROFILE_FIELDS = ['calorie_intake', 'fat_grams', 'carbs_grams', 'protein_grams']
+
+
+class UserFeatureState:
+    """
+    Rolling model inputs for one user.
+
+    `raw` is a ring buffer of the last 14 days of watch features; `head` is the slot the
+    next day is written to. `scaled` mirrors it through the current FeaturePlan and is
+    rebuilt from `raw` whenever the plan (i.e. the model version) changes.
+    `energy_balance` and `cumulative_balance` are running aggregates over all days seen.
+    """
+
+    def __init__(self):
+        self.raw = np.zeros((SEQUENCE_LENGTH, len(TIME_SERIES_FEATURES)), dtype=np.float32)
+        self.scaled = np.zeros_like(self.raw)
+        self.head = 0
+        self.count = 0
+        self.last_date = None
+        self.profile = np.zeros(len(TABULAR_FEATURES), dtype=np.float32)
+        self.has_profile = False
+        self.energy_balance = 0.0
+        self.cumulative_balance = 0.0
+        self.plan = None
+        self.updated_at = 0.0
+
+    @property
+    def is_complete(self):
+        return self.count >= SEQUENCE_LENGTH and self.has_profile
+
+    def _order(self):
+        # Oldest day first, as the LSTM was trained
+        return (self.head + np.arange(SEQUENCE_LENGTH)) % SEQUENCE_LENGTH
+
+    def window(self, plan):
+        """Returns the scaled (14, 6) window, oldest day first."""
+        if self.plan is not plan:
+            self.scaled = plan.scale_days(self.raw)
+            self.plan = plan
+        return self.scaled[self._order()]
+
+
+class FeatureStateStore:
+    """
+    In-memory per-user feature state with an optional SQLite snapshot.
+
+    With `snapshot_path` set, existing state is loaded at startup and changed users are
+    written back by snapshot(), which a background thread calls every `snapshot_interval`
+    seconds, off the request path. Like the MicroBatcher's, the thread is started on first
+    update and restarted in a forked child.
+
+    State lives in each process. Under several gunicorn workers, route a user's daily
+    requests to the same worker (e.g. hash on user_id at the proxy).
+    """
+
+    def __init__(self, snapshot_path=None, snapshot_interval=60.0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._states = {}
+        # user_id -> update count at the time of the user's latest unsaved change
+        self._dirty = {}
+        self._updates = 0
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._snapshotter = None
+        self._pid = None
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load_snapshot()
+
+    def __len__(self):
+        return len(self._states)
+
+    # --- Updates ---
+    @staticmethod
+    def _parse_record(record):
+        """Converts one daily record to (watch_row, date, energy_balance) without touching any state."""
+        missing = [col for col in TIME_SERIES_FEATURES if col not in record]
+        if missing:
+            raise KeyError(f"Missing watch fields in daily record: {', '.join(missing)}")
+        watch_row = np.array([float(record[col]) for col in TIME_SERIES_FEATURES], dtype=np.float32)
+        if 'energy_balance' in record:
+            energy_balance = float(record['energy_balance'])
+        elif 'calorie_intake' in record and 'tee' in record:
+            energy_balance = float(record['calorie_intake']) - float(record['tee'])
+        else:
+            energy_balance = 0.0
+        return watch_row, record.get('date'), energy_balance
+
+    @staticmethod
+    def _parse_profile(user_data, day):
+        """(position, value) pairs to write into the profile, from `user_data` and today's diet fields."""
+        updates = []
+        if user_data:
+            for pos, col in enumerate(TABULAR_FEATURES):
+                if col == 'gender_numeric':
+                    if 'gender' in user_data:
+                        updates.append((pos, gender_to_numeric(user_data['gender'])))
+                elif col in user_data:
+                    updates.append((pos, float(user_data[col])))
+        for col in DAILY_PROFILE_FIELDS:
+            if col in day:
+                updates.append((TABULAR_FEATURES.index(col), float(day[col])))
+        return updates
+
+    def _append_day(self, state, plan, watch_row, date, energy_balance):
+        if date is not None and date == state.last_date and state.count:
+            # Re-sent day (e.g. a retried sync): replace it instead of shifting the window
+            slot = (state.head - 1) % SEQUENCE_LENGTH
+            state.cumulative_balance -= state.energy_balance
+        else:
+            slot = state.head
+            state.head = (state.head + 1) % SEQUENCE_LENGTH
+            state.count += 1
+        state.raw[slot] = watch_row
+        if state.plan is plan:
+            state.scaled[slot] = plan.scale_days(watch_row)
+        state.last_date = date
+        state.energy_balance = energy_balance
+        state.cumulative_balance += energy_balance
+
+    def update(self, user_id, day, plan, user_data=None, history=None):
+        """
+        Adds one day for `user_id` and returns (scaled_window, scaled_profile, state).
+
+        Every record and profile field is converted before the user's state is changed,
+        so an invalid request raises without leaving the state partly updated.
+
+        Args:
+            user_id (str): The user the record belongs to.
+            day (dict): Today's watch record; may also carry 'date', diet fields and 'tee'.
+            plan (FeaturePlan): The current model's scaling plan.
+            user_data (dict): Full profile; required until the store has one for this user.
+            history (list): Optional earlier daily records (oldest first) to seed a new user.
+
+        Returns:
+            tuple: (window, profile, state). window (14, 6) and profile (8,) are scaled model
+            inputs, or None while fewer than 14 days or no profile are known.
+
+        Raises:
+            KeyError, ValueError, TypeError: If a field is missing or not a number.
+        """
+        self._ensure_snapshotter()
+        days = [self._parse_record(record) for record in list(history or []) + [day]]
+        profile_updates = self._parse_profile(user_data, day)
+
+        with self._lock:
+            state = self._states.get(user_id) or UserFeatureState()
+            if user_data and not state.has_profile:
+                # The first profile must be complete; later ones may update single fields
+                missing = [col for col in TABULAR_FEATURES if col != 'gender_numeric' and col not in user_data]
+                missing += [] if 'gender' in user_data else ['gender']
+                if missing:
+                    raise KeyError(f"Missing profile fields in 'user_data': {', '.join(missing)}")
+            for pos, value in profile_updates:
+                state.profile[pos] = value
+            if user_data:
+                state.has_profile = True
+            for watch_row, date, energy_balance in days:
+                self._append_day(state, plan, watch_row, date, energy_balance)
+            state.updated_at = time.time()
+            self._states[user_id] = state
+            self._updates += 1
+            self._dirty[user_id] = self._updates
+
+            if not state.is_complete:
+                return None, None, state
+            return state.window(plan), plan.scale_profile(state.profile), state
+
+    def get(self, user_id):
+        return self._states.get(user_id)
+
+    # --- SQLite snapshot ---
+    def _connect(self):
+        conn = sqlite3.connect(self.snapshot_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_state ("
+            "user_id TEXT PRIMARY KEY, raw BLOB, head INTEGER, count INTEGER, last_date TEXT, "
+            "profile BLOB, has_profile INTEGER, energy_balance REAL, cumulative_balance REAL, updated_at REAL)"
+        )
+        return conn
+
+    def _load_snapshot(self):
+        with closing(self._connect()) as conn:
+            for row in conn.execute("SELECT * FROM user_state"):
+                state = UserFeatureState()
+                user_id, raw, state.head, state.count, state.last_date, profile, has_profile, \
+                    state.energy_balance, state.cumulative_balance, state.updated_at = row
+                state.raw = np.frombuffer(raw, dtype=np.float32).reshape(state.raw.shape).copy()
+                state.profile = np.frombuffer(profile, dtype=np.float32).copy()
+                state.has_profile = bool(has_profile)
+                self._states[user_id] = state
+        print(f"Loaded feature state for {len(self._states)} users from {self.snapshot_path}")
+
+    def snapshot(self):
+        """
+        Writes every user changed since the last snapshot to SQLite.
+
+        Users stay marked as changed until the write is committed, so a failed write is
+        retried by the next snapshot instead of losing their state.
+        """
+        if not self.snapshot_path:
+            return 0
+        with self._snapshot_lock:
+            with self._lock:
+                written = dict(self._dirty)
+                rows = [
+                    (user_id, s.raw.tobytes(), s.head, s.count, s.last_date, s.profile.tobytes(),
+                     int(s.has_profile), s.energy_balance, s.cumulative_balance, s.updated_at)
+                    for user_id, s in ((uid, self._states[uid]) for uid in written)
+                ]
+            with closing(self._connect()) as conn, conn:
+                conn.executemany("INSERT OR REPLACE INTO user_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            with self._lock:
+                # A user updated again during the write stays pending with the newer state
+                for user_id, version in written.items():
+                    if self._dirty.get(user_id) == version:
+                        del self._dirty[user_id]
+        return len(rows)
+
+    def _ensure_snapshotter(self):
+        if not self.snapshot_path or (self._pid == os.getpid() and self._snapshotter.is_alive()):
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() or not self._snapshotter.is_alive():
+                # Threads do not survive fork(), so each worker runs its own
+                self._snapshotter = threading.Thread(target=self._run_snapshots, name='feature-snapshot', daemon=True)
+                self._snapshotter.start()
+                self._pid = os.getpid()
+
+    def _run_snapshots(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(f"Feature state snapshot failed, retrying in {self.snapshot_interval:.0f}s: {e}")
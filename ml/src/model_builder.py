@@ -2,13 +2,24 @@ import tensorflow as tf
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Input, LSTM, Dense, Concatenate, Dropout
 
-def build_multimodal_model(lstm_input_shape, mlp_input_shape):
+def build_multimodal_model(lstm_input_shape, mlp_input_shape, learning_rate=0.001,
+                           lstm_units=64, mlp_units=(32, 16), head_units=32,
+                           lstm_dropout=0.2, mlp_dropout=0.2, head_dropout=0.3):
     """
     Builds a multi-modal neural network with an LSTM and an MLP branch.
 
+    The defaults are the production architecture; src/sweep.py varies them.
+
     Args:
         lstm_input_shape (tuple): Shape of the time-series input (sequence_length, num_features).
         mlp_input_shape (tuple): Shape of the tabular input (num_features,).
+        learning_rate (float): Adam learning rate (scaled with the batch size by train.py).
+        lstm_units (int): Units of the LSTM layer.
+        mlp_units (tuple): Units of each Dense layer of the tabular branch, in order.
+        head_units (int): Units of the Dense layer after the fusion.
+        lstm_dropout (float): Dropout rate after the LSTM.
+        mlp_dropout (float): Dropout rate after the tabular branch.
+        head_dropout (float): Dropout rate before the output layer.
 
     Returns:
         keras.Model: The compiled multi-modal model.
@@ -19,35 +30,37 @@ def build_multimodal_model(lstm_input_shape, mlp_input_shape):
     # This branch is the "Behavioral Analyst"
     lstm_input = Input(shape=lstm_input_shape, name='lstm_input')
     # LSTM layer to capture temporal patterns. `return_sequences=False` means we only get the final output.
-    lstm_layer = LSTM(64, return_sequences=False)(lstm_input)
-    lstm_dropout = Dropout(0.2)(lstm_layer) # Dropout for regularization
+    lstm_layer = LSTM(lstm_units, return_sequences=False)(lstm_input)
+    lstm_branch = Dropout(lstm_dropout)(lstm_layer) # Dropout for regularization
 
     # --- 2. Tabular Branch (MLP) for Diet & Static Data ---
     # This branch is the "Nutritionist & Profiler"
     mlp_input = Input(shape=mlp_input_shape, name='mlp_input')
-    dense_layer_1 = Dense(32, activation='relu')(mlp_input)
-    dense_layer_2 = Dense(16, activation='relu')(dense_layer_1)
-    mlp_dropout = Dropout(0.2)(dense_layer_2)
+    dense_layer = mlp_input
+    for units in mlp_units:
+        dense_layer = Dense(units, activation='relu')(dense_layer)
+    mlp_branch = Dropout(mlp_dropout)(dense_layer)
 
     # --- 3. Fusion Layer ---
     # This is where the two experts' reports are combined
-    fusion_layer = Concatenate()([lstm_dropout, mlp_dropout])
+    fusion_layer = Concatenate()([lstm_branch, mlp_branch])
     
     # --- 4. Prediction Head ---
     # A final set of layers to make a decision based on the combined information
-    head_dense_1 = Dense(32, activation='relu')(fusion_layer)
-    head_dropout = Dropout(0.3)(head_dense_1)
+    head_dense_1 = Dense(head_units, activation='relu')(fusion_layer)
+    head_branch = Dropout(head_dropout)(head_dense_1)
     
     # The final output layer has 2 neurons (for TG and GGT)
     # 'linear' activation is used for regression problems (predicting a continuous value)
-    output_layer = Dense(2, activation='linear', name='output')(head_dropout)
+    # Kept in float32 so the loss is computed in full precision under a mixed precision policy
+    output_layer = Dense(2, activation='linear', name='output', dtype='float32')(head_branch)
 
     # --- 5. Create and Compile the Model ---
     model = Model(inputs=[lstm_input, mlp_input], outputs=output_layer, name='NAFLD_Risk_Forecaster')
     
     # Compile the model with an optimizer, loss function, and metrics
     # Adam is a great default optimizer. Mean Squared Error is standard for regression.
-    model.compile(optimizer='adam', 
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), 
                   loss='mean_squared_error', 
                   metrics=['mean_absolute_error'])
     
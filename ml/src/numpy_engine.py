@@ -0,0 +1,245 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# Nothing in this module imports TensorFlow. export_weights() and verify_against_keras()
+# take an already-loaded Keras model; only the command-line exporter below loads one.
+
+NUMPY_MODEL_FORMAT_VERSION = 1
+
+
+# --- 1. Activations ---
+def _sigmoid(x):
+    # tanh form avoids overflow in exp() for large negative inputs
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+}
+
+
+def _activation(name):
+    if name not in _ACTIVATIONS:
+        raise ValueError(f"Unsupported activation '{name}' in exported model.")
+    return _ACTIVATIONS[name]
+
+
+# --- 2. Exporter (needs TensorFlow) ---
+def _layer_name_refs(node, known_names):
+    """Collects the layer names referenced anywhere in a layer's 'inbound_nodes' config (Keras 2 or 3 format)."""
+    refs = []
+    if isinstance(node, str):
+        if node in known_names:
+            refs.append(node)
+    elif isinstance(node, dict):
+        for value in node.values():
+            refs.extend(_layer_name_refs(value, known_names))
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            refs.extend(_layer_name_refs(value, known_names))
+    return refs
+
+
+def _activation_name(activation):
+    return activation if isinstance(activation, str) else activation.__name__
+
+
+def export_weights(keras_model, output_path):
+    """
+    Extracts the weights of a model built by model_builder.build_multimodal_model into a `.npz`.
+
+    The graph is walked from each input to the Concatenate layer (the two branches) and
+    from there to the output (the head). Dropout layers are skipped since they are
+    identities at inference time.
+
+    Args:
+        keras_model (keras.Model): The trained two-input model.
+        output_path (str): Where to write the `.npz` file.
+    """
+    layer_configs = keras_model.get_config()['layers']
+    names = {cfg['config']['name'] for cfg in layer_configs}
+    consumers = {name: [] for name in names}
+    for cfg in layer_configs:
+        for ref in dict.fromkeys(_layer_name_refs(cfg.get('inbound_nodes', []), names)):
+            consumers[ref].append(cfg['config']['name'])
+
+    arrays = {}
+
+    def walk(start_name):
+        """Follows the single-consumer chain from `start_name`; returns (steps, last layer, stopping layer)."""
+        steps, name = [], start_name
+        while True:
+            next_names = consumers[name]
+            if len(next_names) != 1:
+                return steps, name, None
+            layer = keras_model.get_layer(next_names[0])
+            kind = type(layer).__name__
+            if kind == 'Concatenate':
+                return steps, name, layer.name
+            name = layer.name
+            if kind == 'Dropout':
+                continue
+            key = f"layer_{len(arrays)}"
+            weights = layer.get_weights()
+            if kind == 'LSTM':
+                arrays[f"{key}/kernel"], arrays[f"{key}/recurrent_kernel"], arrays[f"{key}/bias"] = weights
+                steps.append({
+                    'type': 'lstm', 'key': key, 'units': int(layer.units),
+                    'activation': _activation_name(layer.activation),
+                    'recurrent_activation': _activation_name(layer.recurrent_activation),
+                    'return_sequences': bool(layer.return_sequences),
+                })
+            elif kind == 'Dense':
+                arrays[f"{key}/kernel"], arrays[f"{key}/bias"] = weights
+                steps.append({'type': 'dense', 'key': key, 'activation': _activation_name(layer.activation)})
+            else:
+                raise ValueError(f"Layer '{name}' of type {kind} is not supported by the NumPy engine.")
+
+    branches, tails = {}, {}
+    concat_name = None
+    for input_name in ('lstm_input', 'mlp_input'):
+        if input_name not in names:
+            raise ValueError(f"Model has no input layer named '{input_name}'.")
+        branches[input_name], tail, concat_name = walk(input_name)
+        if concat_name is None:
+            raise ValueError(f"Branch starting at '{input_name}' does not end in a Concatenate layer.")
+        tails[tail] = input_name
+
+    # Concatenate inputs, in order, mapped back to the branch that produced them
+    concat_cfg = next(cfg for cfg in layer_configs if cfg['config']['name'] == concat_name)
+    concat_order = [tails[ref] for ref in dict.fromkeys(_layer_name_refs(concat_cfg.get('inbound_nodes', []), names))]
+    head, _, _ = walk(concat_name)
+    spec = {
+        'format_version': NUMPY_MODEL_FORMAT_VERSION,
+        'branches': branches,
+        'concat_order': concat_order,
+        'head': head,
+    }
+    np.savez_compressed(output_path, spec=np.array(json.dumps(spec)), **arrays)
+    print(f"NumPy model weights saved to {output_path}")
+
+
+# --- 3. NumPy Forward Pass ---
+class NumpyMultimodalModel:
+    """
+    Pure-NumPy, batched forward pass for the LSTM + MLP model exported by export_weights().
+
+    Exposes predict() and predict_on_batch() with the same [X_lstm, X_mlp] calling
+    convention as the Keras model, so predict.py can use either.
+    """
+
+    def __init__(self, spec, arrays):
+        if spec.get('format_version') != NUMPY_MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported NumPy model format version: {spec.get('format_version')}.")
+        self.spec = spec
+        self.arrays = {key: np.ascontiguousarray(value, dtype=np.float32) for key, value in arrays.items()}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            spec = json.loads(str(data['spec']))
+            arrays = {key: data[key] for key in data.files if key != 'spec'}
+        return cls(spec, arrays)
+
+    def _lstm(self, x, step):
+        kernel = self.arrays[f"{step['key']}/kernel"]
+        recurrent_kernel = self.arrays[f"{step['key']}/recurrent_kernel"]
+        bias = self.arrays[f"{step['key']}/bias"]
+        units = step['units']
+        act = _activation(step['activation'])
+        rec_act = _activation(step['recurrent_activation'])
+
+        n, timesteps, _ = x.shape
+        # Input projections for all timesteps in one matmul; only h @ U remains in the loop
+        x_proj = x @ kernel + bias
+        h = np.zeros((n, units), dtype=np.float32)
+        c = np.zeros((n, units), dtype=np.float32)
+        outputs = np.empty((n, timesteps, units), dtype=np.float32) if step['return_sequences'] else None
+        for t in range(timesteps):
+            z = x_proj[:, t] + h @ recurrent_kernel
+            # Keras gate order: input, forget, cell candidate, output
+            i = rec_act(z[:, :units])
+            f = rec_act(z[:, units:2 * units])
+            g = act(z[:, 2 * units:3 * units])
+            o = rec_act(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * act(c)
+            if outputs is not None:
+                outputs[:, t] = h
+        return outputs if outputs is not None else h
+
+    def _dense(self, x, step):
+        return _activation(step['activation'])(x @ self.arrays[f"{step['key']}/kernel"] + self.arrays[f"{step['key']}/bias"])
+
+    def _run(self, x, steps):
+        for step in steps:
+            x = self._lstm(x, step) if step['type'] == 'lstm' else self._dense(x, step)
+        return x
+
+    def predict_on_batch(self, inputs):
+        X_lstm, X_mlp = (np.asarray(x, dtype=np.float32) for x in inputs)
+        branch_inputs = {'lstm_input': X_lstm, 'mlp_input': X_mlp}
+        fused = np.concatenate(
+            [self._run(branch_inputs[name], self.spec['branches'][name]) for name in self.spec['concat_order']],
+            axis=-1
+        )
+        return self._run(fused, self.spec['head'])
+
+    def predict(self, inputs, batch_size=None, verbose=0):
+        X_lstm, X_mlp = inputs
+        if batch_size is None or batch_size >= len(X_lstm):
+            return self.predict_on_batch([X_lstm, X_mlp])
+        return np.concatenate([
+            self.predict_on_batch([X_lstm[i:i + batch_size], X_mlp[i:i + batch_size]])
+            for i in range(0, len(X_lstm), batch_size)
+        ])
+
+
+# --- 4. Equivalence Check against Keras ---
+def verify_against_keras(keras_model, numpy_model, num_samples=256, atol=1e-4, seed=0):
+    """
+    Runs both models on the same random inputs in [0, 1] (the scaled feature range).
+
+    Returns:
+        float: The largest absolute difference between the two outputs.
+
+    Raises:
+        AssertionError: If the difference exceeds `atol`.
+    """
+    rng = np.random.default_rng(seed)
+    lstm_shape = tuple(keras_model.inputs[0].shape[1:])
+    mlp_shape = tuple(keras_model.inputs[1].shape[1:])
+    X_lstm = rng.random((num_samples,) + lstm_shape, dtype=np.float32)
+    X_mlp = rng.random((num_samples,) + mlp_shape, dtype=np.float32)
+
+    expected = keras_model.predict([X_lstm, X_mlp], verbose=0)
+    actual = numpy_model.predict([X_lstm, X_mlp])
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > atol:
+        raise AssertionError(f"NumPy engine differs from Keras by {max_diff:.2e} (tolerance {atol:.0e}).")
+    return max_diff
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the Keras model to the NumPy inference format.")
+    parser.add_argument('--model', default='models/multimodal_model.h5')
+    parser.add_argument('--output', default='models/multimodal_model.npz')
+    parser.add_argument('--atol', type=float, default=1e-4, help="Tolerance for the Keras equivalence check.")
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(args.model)
+    export_weights(keras_model, args.output)
+    try:
+        diff = verify_against_keras(keras_model, NumpyMultimodalModel.load(args.output), atol=args.atol)
+    except AssertionError as e:
+        print(f"Verification failed: {e}")
+        sys.exit(1)
+    print(f"Verified against Keras: max abs difference {diff:.2e}")
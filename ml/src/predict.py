@@ -1,75 +1,153 @@
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import joblib
 import os
+from src.feature_plan import frames_to_arrays, records_to_arrays, SEQUENCE_LENGTH, TIME_SERIES_FEATURES, TABULAR_FEATURES
+from src.registry import model_registry
+from src.cache import PredictionCache
+from niyantrana_common.tracing import MetricsRegistry, Tracer
 
-# --- 1. Define Paths and Load Artifacts ---
-MODEL_PATH = 'models/multimodal_model.h5'
-FEATURE_SCALER_PATH = 'models/feature_scaler.pkl'
-TARGET_SCALER_PATH = 'models/target_scaler.pkl'
+# Artifacts are loaded lazily by the model registry on the first prediction (or eagerly
+# via model_registry.load(), e.g. in a gunicorn master). Configure it with ML_MODEL_DIR,
+# ML_INFERENCE_ENGINE ('auto', 'numpy', 'keras', 'tflite' or 'onnx') and ML_MODEL_RELOAD_INTERVAL.
+# The 'tflite' and 'onnx' engines load the src/quantize.py export selected by
+# ML_MODEL_PRECISION ('float32', 'float16' or 'int8'), with ML_INFERENCE_THREADS threads.
 
-print("Loading model and scalers...")
-if not all(os.path.exists(p) for p in [MODEL_PATH, FEATURE_SCALER_PATH, TARGET_SCALER_PATH]):
-    print("Error: Model or scaler files not found. Please train the model first by running 'src/train.py'.")
-    exit()
+# Results for identical inputs (dashboard reloads, retries, several widgets) are served
+# from this cache. ML_PREDICTION_CACHE_SIZE=0 disables it.
+prediction_cache = PredictionCache(
+    max_size=int(os.environ.get('ML_PREDICTION_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('ML_PREDICTION_CACHE_TTL', '300')),
+)
+# Entries are keyed by model version, so this only frees memory held by the old version
+model_registry.add_reload_listener(lambda bundle: prediction_cache.clear())
+
+# Per-stage latency histograms, served with the request metrics on /metrics (see app.py).
+# ML_TRACE_SAMPLE_RATE > 0 also appends that fraction of requests, with the offset and
+# duration of each stage, to ML_TRACE_PATH as JSON lines.
+metrics = MetricsRegistry()
+tracer = Tracer(
+    metrics, 'ml',
+    sample_rate=float(os.environ.get('ML_TRACE_SAMPLE_RATE', '0')),
+    trace_path=os.environ.get('ML_TRACE_PATH', 'traces.jsonl'),
+)
+
+
+def _format_prediction(row):
+    return {
+        'predicted_triglycerides': float(round(row[0], 2)),
+        'predicted_ggt': float(round(row[1], 2))
+    }
+
+
+# --- 1. Define the Prediction Functions ---
+def predict_risk_batch(watch_batch, profile_batch):
+    """
+    Predicts TG and GGT for many users with a single forward pass.
+
+    Args:
+        watch_batch (np.ndarray): Raw watch data of shape (N, 14, 6), columns in TIME_SERIES_FEATURES order.
+        profile_batch (np.ndarray): Raw profile data of shape (N, 8), columns in TABULAR_FEATURES order
+            (gender_numeric is 1 for 'M', else 0).
+
+    Returns:
+        list: One result dict per user, in input order.
+    """
+    watch_batch = np.asarray(watch_batch, dtype=np.float32)
+    profile_batch = np.asarray(profile_batch, dtype=np.float32)
+    if watch_batch.ndim != 3 or watch_batch.shape[1:] != (SEQUENCE_LENGTH, len(TIME_SERIES_FEATURES)):
+        raise ValueError(f"Watch batch must have shape (N, {SEQUENCE_LENGTH}, {len(TIME_SERIES_FEATURES)}), but got {watch_batch.shape}.")
+    if profile_batch.ndim != 2 or profile_batch.shape[1] != len(TABULAR_FEATURES):
+        raise ValueError(f"Profile batch must have shape (N, {len(TABULAR_FEATURES)}), but got {profile_batch.shape}.")
+    if watch_batch.shape[0] != profile_batch.shape[0]:
+        raise ValueError("Watch and profile batches must contain the same number of users.")
+    if watch_batch.shape[0] == 0:
+        return []
+
+    bundle = model_registry.get()
+    if not prediction_cache.enabled:
+        with tracer.stage('scale'):
+            X_lstm, X_mlp = bundle.feature_plan.transform(watch_batch, profile_batch)
+        return predict_risk_scaled(X_lstm, X_mlp, bundle)
+
+    # Only the rows that miss the cache go through the model
+    with tracer.stage('cache_lookup'):
+        keys = [prediction_cache.make_key(bundle.version, w, p) for w, p in zip(watch_batch, profile_batch)]
+        results = [prediction_cache.get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+    tracer.annotate(batch_size=len(keys), cache_misses=len(misses))
+    if misses:
+        with tracer.stage('scale'):
+            X_lstm, X_mlp = bundle.feature_plan.transform(watch_batch[misses], profile_batch[misses])
+        for i, result in zip(misses, predict_risk_scaled(X_lstm, X_mlp, bundle)):
+            prediction_cache.put(keys[i], result)
+            results[i] = result
+    return results
+
+
+def cached_prediction(watch_array, profile_array):
+    """Returns the cached result for one user's raw inputs, or None (also when the model isn't loaded yet)."""
+    if not prediction_cache.enabled or not model_registry.is_ready:
+        return None
+    bundle = model_registry.get()
+    # A miss here is counted by the predict_risk_batch() call that follows it
+    return prediction_cache.get(prediction_cache.make_key(bundle.version, watch_array, profile_array), record_miss=False)
+
+
+def predict_risk_scaled(X_lstm, X_mlp, bundle=None):
+    """
+    Runs the model on inputs that are already scaled, e.g. from the per-user feature state.
+
+    Args:
+        X_lstm (np.ndarray): Scaled watch windows, shape (N, 14, 6).
+        X_mlp (np.ndarray): Scaled profiles, shape (N, 8).
+        bundle (ModelBundle): The model version the inputs were scaled for (default: current).
+    """
+    bundle = bundle or model_registry.get()
+    with tracer.stage('model'):
+        scaled_prediction = bundle.model.predict_on_batch([X_lstm, X_mlp])
+    with tracer.stage('inverse_transform'):
+        unscaled_prediction = np.asarray(scaled_prediction) * bundle.target_inverse_scale + bundle.target_inverse_offset
+        return [_format_prediction(row) for row in unscaled_prediction]
+
+
+def parse_json_inputs(watch_data_list, user_data_dict):
+    """
+    Validates a raw JSON payload and converts it into (watch_array, profile_array) without pandas.
+
+    Args:
+        watch_data_list (list): 14 daily watch records.
+        user_data_dict (dict): The user's profile.
+    """
+    if not watch_data_list or not user_data_dict:
+        raise KeyError("Missing 'watch_data' or 'user_data' in JSON payload")
+    if len(watch_data_list) != SEQUENCE_LENGTH:
+        raise ValueError(f"Time-series data must contain exactly {SEQUENCE_LENGTH} days of data, but got {len(watch_data_list)}.")
+    return records_to_arrays(watch_data_list, user_data_dict)
+
+
+def predict_risk_from_json(watch_data_list, user_data_dict):
+    """Entry point for raw JSON payloads: skips the DataFrame API entirely."""
+    with tracer.stage('parse'):
+        watch_array, profile_array = parse_json_inputs(watch_data_list, user_data_dict)
+    return predict_risk_batch(watch_array[np.newaxis], profile_array[np.newaxis])[0]
 
-model = load_model(MODEL_PATH)
-feature_scaler = joblib.load(FEATURE_SCALER_PATH)
-target_scaler = joblib.load(TARGET_SCALER_PATH)
-print("Artifacts loaded successfully.")
 
-# --- 2. Define the Prediction Function ---
 def predict_risk(time_series_data, tabular_data):
-    # ... (The first parts of the function (A, B, C, D) remain exactly the same)
     # --- A. Data Validation ---
     if not isinstance(time_series_data, pd.DataFrame) or not isinstance(tabular_data, pd.DataFrame):
         raise TypeError("Inputs must be pandas DataFrames.")
-    if len(time_series_data) != 14:
-        raise ValueError(f"Time-series data must contain exactly 14 days of data, but got {len(time_series_data)}.")
+    if len(time_series_data) != SEQUENCE_LENGTH:
+        raise ValueError(f"Time-series data must contain exactly {SEQUENCE_LENGTH} days of data, but got {len(time_series_data)}.")
     if len(tabular_data) != 1:
         raise ValueError("Tabular data must contain exactly 1 row of data.")
 
-    # --- B. Data Preprocessing ---
-    combined_df = pd.concat([tabular_data.reset_index(drop=True), time_series_data.reset_index(drop=True)], axis=1)
-    feature_cols = ['age', 'bmi', 'has_hereditary_risk', 'tee', 'calorie_intake', 'fat_grams', 'carbs_grams', 'protein_grams', 'daily_steps', 'active_minutes', 'sleep_hours', 'sleep_quality_score', 'resting_heart_rate', 'heart_rate_variability', 'energy_balance', 'cumulative_balance']
-    
-    full_features_df = pd.DataFrame(columns=feature_cols)
-    for col in feature_cols:
-        if col in combined_df.columns:
-            full_features_df[col] = combined_df[col]
-    
-    scaled_features = feature_scaler.transform(full_features_df)
-    scaled_df = pd.DataFrame(scaled_features, columns=feature_cols)
-
-    # --- C. Reshape Data for the Model ---
-    time_series_features = ['daily_steps', 'active_minutes', 'sleep_hours', 'sleep_quality_score', 'resting_heart_rate', 'heart_rate_variability']
-    tabular_features = ['age', 'bmi', 'has_hereditary_risk', 'calorie_intake', 'fat_grams', 'carbs_grams', 'protein_grams']
-    
-    tabular_data['gender_numeric'] = 1 if tabular_data['gender'].iloc[0] == 'M' else 0
-    tabular_features_with_gender = ['gender_numeric'] + tabular_features
-
-    X_lstm = scaled_df[time_series_features].values.reshape(1, 14, 6)
-    X_mlp_tabular_part = scaled_df.iloc[-1][tabular_features].values
-    X_mlp = np.concatenate(([tabular_data['gender_numeric'].iloc[0]], X_mlp_tabular_part)).reshape(1, 8)
-
-    # --- D. Make the Prediction ---
-    scaled_prediction = model.predict([X_lstm, X_mlp])
-
-    # --- E. Inverse-Transform the Output ---
-    unscaled_prediction = target_scaler.inverse_transform(scaled_prediction)
-
-    # --- F. Format and Return the Result (THIS IS THE CORRECTED PART) ---
-    result = {
-        'predicted_triglycerides': float(round(unscaled_prediction[0][0], 2)),
-        'predicted_ggt': float(round(unscaled_prediction[0][1], 2))
-    }
-    return result
+    # --- B. Convert to Arrays and Predict as a Batch of One (the DataFrame API is a thin wrapper) ---
+    with tracer.stage('dataframe_to_arrays'):
+        watch_array, profile_array = frames_to_arrays(time_series_data, tabular_data)
+    return predict_risk_batch(watch_array[np.newaxis], profile_array[np.newaxis])[0]
 
-# --- 3. Example Usage ---
+# --- 2. Example Usage ---
 if __name__ == '__main__':
-    # ... (The example usage part remains the same)
     print("\n--- Running Prediction Example ---")
     sample_watch_data = pd.DataFrame({'daily_steps': np.random.randint(4000, 8000, 14), 'active_minutes': np.random.randint(20, 60, 14), 'sleep_hours': np.random.uniform(6.5, 8.0, 14), 'sleep_quality_score': np.random.randint(75, 90, 14), 'resting_heart_rate': np.random.randint(60, 70, 14), 'heart_rate_variability': np.random.randint(45, 60, 14)})
     sample_user_data = pd.DataFrame({'age': [45], 'gender': ['M'], 'bmi': [29.5], 'has_hereditary_risk': [1], 'tee': [2400], 'calorie_intake': [2800], 'fat_grams': [100], 'carbs_grams': [350], 'protein_grams': [120], 'energy_balance': [400], 'cumulative_balance': [5000]})
@@ -79,4 +157,4 @@ if __name__ == '__main__':
         print(f"  Predicted Triglycerides: {prediction['predicted_triglycerides']} mg/dL")
         print(f"  Predicted GGT: {prediction['predicted_ggt']} U/L")
     except Exception as e:
-        print(f"An error occurred during prediction: {e}")
\ No newline at end of file
+        print(f"An error occurred during prediction: {e}")
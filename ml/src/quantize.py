@@ -0,0 +1,273 @@
+"""
+Post-training quantization of the multimodal model, with an accuracy vs. latency report.
+
+Run from the ml/ directory after training:
+
+    python -m src.quantize
+    python -m src.quantize --engines tflite --precisions float16 int8 --tolerance-tg 2
+
+Exports the Keras model to TFLite and ONNX at float32, float16 and int8, writing
+models/multimodal_model_<precision>.tflite / .onnx. int8 is calibrated on windows from
+the training split of the processed data. Every variant is then scored on windows from
+the validation split: TG/GGT error in mg/dL and U/L, drift from the Keras float32 model,
+latency and size. The report goes to models/quantization_report.json, and the fastest
+variant within tolerance is printed with the ML_INFERENCE_ENGINE/ML_MODEL_PRECISION
+settings that serve it (see registry.py).
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import tensorflow as tf
+
+from src.feature_plan import compile_target_inverse
+from src.numpy_engine import NumpyMultimodalModel
+from src.registry import MODEL_FILENAME, NUMPY_MODEL_FILENAME, TARGET_SCALER_FILENAME
+from src.runtimes import load_runtime_model, runtime_model_filename, RUNTIME_ENGINES, PRECISIONS
+from src.train import DEFAULT_CONFIG, load_training_data, split_indices
+
+INPUT_NAMES = ('lstm_input', 'mlp_input')
+TARGET_NAMES = ('tg', 'ggt')
+
+
+# --- 1. Calibration and Evaluation Samples ---
+def load_samples(config, num_calibration=512, num_eval=2000, seed=0):
+    """
+    Draws calibration inputs from the training split and scored samples from the
+    validation split, so the report measures the variants on windows none of them saw.
+
+    Returns:
+        tuple: ((X_lstm, X_mlp) for calibration, ((X_lstm, X_mlp), y) for evaluation).
+    """
+    dataset = load_training_data(config)
+    train_idx, val_idx = split_indices(dataset, config)
+    rng = np.random.default_rng(seed)
+    calibration_idx = np.sort(rng.choice(train_idx, min(num_calibration, len(train_idx)), replace=False))
+    eval_idx = np.sort(rng.choice(val_idx, min(num_eval, len(val_idx)), replace=False))
+    calibration_inputs, _ = dataset.get_batch(calibration_idx)
+    (X_lstm, X_mlp), y = dataset.get_batch(eval_idx)
+    calibration = tuple(np.asarray(x, dtype=np.float32) for x in calibration_inputs)
+    return calibration, ((np.asarray(X_lstm, dtype=np.float32), np.asarray(X_mlp, dtype=np.float32)), np.asarray(y))
+
+
+def _calibration_batches(calibration, batch_size=16):
+    X_lstm, X_mlp = calibration
+    for i in range(0, len(X_lstm), batch_size):
+        yield {INPUT_NAMES[0]: X_lstm[i:i + batch_size], INPUT_NAMES[1]: X_mlp[i:i + batch_size]}
+
+
+# --- 2. Export ---
+def unrolled_copy(keras_model):
+    """
+    Same model and weights with the LSTM unrolled over its 14 timesteps.
+
+    A rolled LSTM converts to a while loop over tensor lists, which needs a fixed batch
+    size and breaks int8 calibration; unrolled it's a plain graph of matmuls that both
+    converters quantize, with a dynamic batch dimension.
+    """
+    config = keras_model.get_config()
+    for layer in config['layers']:
+        if layer['class_name'] == 'LSTM':
+            layer['config']['unroll'] = True
+    model = tf.keras.Model.from_config(config)
+    model.set_weights(keras_model.get_weights())
+    return model
+
+
+def _input_signature(model):
+    return [tf.TensorSpec((None,) + tuple(x.shape[1:]), tf.float32, name=name) for x, name in zip(model.inputs, INPUT_NAMES)]
+
+
+def export_tflite(model, output_dir, precisions, calibration):
+    """Writes one .tflite per precision. float16 stores float16 weights; int8 is calibrated (float I/O)."""
+    paths = {}
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        model.export(saved_model_dir, input_signature=[_input_signature(model)], verbose=False)
+        for precision in precisions:
+            converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+            if precision == 'float16':
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.target_spec.supported_types = [tf.float16]
+            elif precision == 'int8':
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.representative_dataset = lambda: _calibration_batches(calibration)
+            path = os.path.join(output_dir, runtime_model_filename('tflite', precision))
+            with open(path, 'wb') as f:
+                f.write(converter.convert())
+            print(f"TFLite {precision} model saved to {path}")
+            paths[precision] = path
+    return paths
+
+
+class _CalibrationReader:
+    """onnxruntime.quantization calibration data reader over the calibration sample."""
+
+    def __init__(self, calibration):
+        self._batches = _calibration_batches(calibration)
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def export_onnx(model, output_dir, precisions, calibration, opset=17):
+    """
+    Writes one .onnx per precision via tf2onnx. The float32 file is always written, as
+    the other two are derived from it: float16 with ONNX Runtime's converter (float I/O
+    kept), int8 by static QDQ quantization calibrated like the TFLite model.
+    """
+    try:
+        import onnx
+        import tf2onnx
+        from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+        from onnxruntime.transformers.float16 import convert_float_to_float16
+    except ImportError as e:
+        print(f"Skipping ONNX export: {e}. Install tf2onnx and onnxruntime to enable it.")
+        return {}
+
+    float32_path = os.path.join(output_dir, runtime_model_filename('onnx', 'float32'))
+    forward = tf.function(lambda lstm_input, mlp_input: model([lstm_input, mlp_input], training=False))
+    tf2onnx.convert.from_function(forward, input_signature=_input_signature(model), opset=opset, output_path=float32_path)
+    print(f"ONNX float32 model saved to {float32_path}")
+    paths = {'float32': float32_path}
+
+    if 'float16' in precisions:
+        path = os.path.join(output_dir, runtime_model_filename('onnx', 'float16'))
+        onnx.save(convert_float_to_float16(onnx.load(float32_path), keep_io_types=True), path)
+        print(f"ONNX float16 model saved to {path}")
+        paths['float16'] = path
+    if 'int8' in precisions:
+        path = os.path.join(output_dir, runtime_model_filename('onnx', 'int8'))
+        quantize_static(float32_path, path, _CalibrationReader(calibration), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+        print(f"ONNX int8 model saved to {path}")
+        paths['int8'] = path
+    return paths
+
+
+# --- 3. Accuracy vs. Latency Report ---
+def measure_latency(model, inputs, batch_size, repeats=100):
+    """Median milliseconds per predict_on_batch at `batch_size`, after one warm-up call."""
+    batch = [x[:batch_size] for x in inputs]
+    model.predict_on_batch(batch)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_on_batch(batch)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples) * 1000)
+
+
+def evaluate(name, model, path, inputs, y_true, reference, target_inverse, repeats):
+    """Scores one variant in original units (TG mg/dL, GGT U/L). `reference` is the Keras float32 output."""
+    scale, offset = target_inverse
+    predicted = np.asarray(model.predict(list(inputs), batch_size=256, verbose=0)) * scale + offset
+    actual = y_true * scale + offset
+    row = {'variant': name, 'path': path, 'size_kb': os.path.getsize(path) / 1024}
+    for i, target in enumerate(TARGET_NAMES):
+        row[f"mae_{target}"] = float(np.mean(np.abs(predicted[:, i] - actual[:, i])))
+        if reference is not None:
+            drift = np.abs(predicted[:, i] - reference[:, i])
+            row[f"drift_{target}"] = float(drift.mean())
+            row[f"max_drift_{target}"] = float(drift.max())
+    row['latency_ms_batch1'] = measure_latency(model, inputs, 1, repeats)
+    row['latency_ms_batch64'] = measure_latency(model, inputs, 64, max(repeats // 4, 10))
+    return row, predicted
+
+
+def build_report(model_dir, exports, eval_data, tolerances, repeats=100, num_threads=1):
+    """
+    Evaluates the Keras model, the NumPy engine (if exported) and every TFLite/ONNX export.
+
+    Returns:
+        dict: 'variants' (rows sorted by batch-1 latency), 'tolerance' and 'recommended',
+        the fastest variant whose mean TG and GGT drift stay within tolerance.
+    """
+    (X_lstm, X_mlp), y = eval_data
+    inputs = (X_lstm, X_mlp)
+    target_inverse = compile_target_inverse(joblib.load(os.path.join(model_dir, TARGET_SCALER_FILENAME)))
+
+    keras_path = os.path.join(model_dir, MODEL_FILENAME)
+    keras_row, reference = evaluate('keras-float32', tf.keras.models.load_model(keras_path, compile=False),
+                                    keras_path, inputs, y, None, target_inverse, repeats)
+    for target in TARGET_NAMES:
+        keras_row[f"drift_{target}"] = keras_row[f"max_drift_{target}"] = 0.0
+    rows = [keras_row]
+
+    candidates = []
+    numpy_path = os.path.join(model_dir, NUMPY_MODEL_FILENAME)
+    if os.path.exists(numpy_path):
+        candidates.append(('numpy-float32', NumpyMultimodalModel.load(numpy_path), numpy_path))
+    for engine, paths in exports.items():
+        for precision, path in paths.items():
+            candidates.append((f"{engine}-{precision}", load_runtime_model(engine, path, num_threads), path))
+    for name, model, path in candidates:
+        print(f"Evaluating {name}...")
+        rows.append(evaluate(name, model, path, inputs, y, reference, target_inverse, repeats)[0])
+
+    for row in rows:
+        row['within_tolerance'] = all(row[f"drift_{target}"] <= tolerances[target] for target in TARGET_NAMES)
+    rows.sort(key=lambda row: row['latency_ms_batch1'])
+    recommended = next((row['variant'] for row in rows if row['within_tolerance']), None)
+    return {'num_eval_samples': int(len(y)), 'tolerance': tolerances, 'recommended': recommended, 'variants': rows}
+
+
+def print_report(report):
+    print(f"\nEvaluated on {report['num_eval_samples']} validation windows "
+          f"(drift = mean |prediction - Keras float32|, tolerance TG {report['tolerance']['tg']:g} mg/dL, "
+          f"GGT {report['tolerance']['ggt']:g} U/L)")
+    print(f"{'variant':<16} {'TG MAE':>7} {'GGT MAE':>8} {'TG drift':>9} {'GGT drift':>10} {'ms (b=1)':>9} {'ms (b=64)':>10} {'KB':>7}  ok")
+    for row in report['variants']:
+        print(f"{row['variant']:<16} {row['mae_tg']:>7.3f} {row['mae_ggt']:>8.3f} {row['drift_tg']:>9.4f} {row['drift_ggt']:>10.4f} "
+              f"{row['latency_ms_batch1']:>9.3f} {row['latency_ms_batch64']:>10.3f} {row['size_kb']:>7.1f}  "
+              f"{'yes' if row['within_tolerance'] else 'no'}")
+
+    recommended = report['recommended']
+    if recommended is None:
+        print("\nNo variant is within tolerance.")
+        return
+    engine, precision = recommended.split('-')
+    print(f"\nFastest variant within tolerance: {recommended}")
+    settings = f"ML_INFERENCE_ENGINE={engine}"
+    if engine in RUNTIME_ENGINES:
+        settings += f" ML_MODEL_PRECISION={precision}"
+    print(f"  Serve it with {settings}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--data-path', default=DEFAULT_CONFIG['data_path'])
+    parser.add_argument('--windows-dir', default=DEFAULT_CONFIG['windows_dir'])
+    parser.add_argument('--engines', nargs='+', choices=RUNTIME_ENGINES, default=list(RUNTIME_ENGINES))
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument('--calibration-samples', type=int, default=512)
+    parser.add_argument('--eval-samples', type=int, default=2000)
+    parser.add_argument('--tolerance-tg', type=float, default=1.0, help="Allowed mean TG drift, mg/dL.")
+    parser.add_argument('--tolerance-ggt', type=float, default=1.0, help="Allowed mean GGT drift, U/L.")
+    parser.add_argument('--repeats', type=int, default=100, help="Timed calls per latency measurement.")
+    parser.add_argument('--threads', type=int, default=1, help="Threads for the TFLite and ONNX runtimes.")
+    parser.add_argument('--report-path', help="Defaults to <model-dir>/quantization_report.json.")
+    args = parser.parse_args()
+
+    config = {**DEFAULT_CONFIG, 'data_path': args.data_path, 'windows_dir': args.windows_dir}
+    calibration, eval_data = load_samples(config, args.calibration_samples, args.eval_samples, config['seed'])
+
+    keras_model = tf.keras.models.load_model(os.path.join(args.model_dir, MODEL_FILENAME), compile=False)
+    export_model = unrolled_copy(keras_model)
+    exports = {}
+    if 'tflite' in args.engines:
+        exports['tflite'] = export_tflite(export_model, args.model_dir, args.precisions, calibration)
+    if 'onnx' in args.engines:
+        exports['onnx'] = export_onnx(export_model, args.model_dir, args.precisions, calibration)
+
+    tolerances = {'tg': args.tolerance_tg, 'ggt': args.tolerance_ggt}
+    report = build_report(args.model_dir, exports, eval_data, tolerances, args.repeats, args.threads)
+    report_path = args.report_path or os.path.join(args.model_dir, 'quantization_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report saved to {report_path}")
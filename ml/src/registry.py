@@ -0,0 +1,229 @@
+import hashlib
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from src.feature_plan import FeaturePlan, compile_target_inverse, SEQUENCE_LENGTH, TIME_SERIES_FEATURES, TABULAR_FEATURES
+from src.numpy_engine import NumpyMultimodalModel
+from src.runtimes import load_runtime_model, runtime_model_filename, RUNTIME_ENGINES, PRECISIONS
+
+MODEL_FILENAME = 'multimodal_model.h5'
+NUMPY_MODEL_FILENAME = 'multimodal_model.npz'
+FEATURE_SCALER_FILENAME = 'feature_scaler.pkl'
+TARGET_SCALER_FILENAME = 'target_scaler.pkl'
+
+
+class ModelNotAvailableError(RuntimeError):
+    """Raised when the model artifacts are missing or fail to load."""
+
+
+class ModelBundle:
+    """Everything one model version needs to serve predictions, loaded and warmed up together."""
+
+    def __init__(self, model, feature_plan, target_inverse, version, model_dir, engine, precision='float32'):
+        self.model = model
+        self.feature_plan = feature_plan
+        self.target_inverse_scale, self.target_inverse_offset = target_inverse
+        self.version = version
+        self.model_dir = model_dir
+        self.engine = engine
+        self.precision = precision
+        self.loaded_at = time.time()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """
+    Loads the model and scalers on first use instead of at import time.
+
+    - get() loads lazily (thread-safe) and returns the current ModelBundle.
+    - load() loads eagerly, e.g. in a gunicorn master with preload_app so workers
+      share the weights copy-on-write (see gunicorn.conf.py).
+    - reload() builds and warms up a new bundle, then swaps it in atomically, so
+      in-flight requests finish on the old version.
+    - With `auto_reload_interval` set, get() re-checks the artifact files at most that
+      often and reloads when they change, which reaches every worker process.
+
+    Args:
+        model_dir (str): Directory containing the model and scaler files.
+        engine (str): 'auto', 'numpy', 'keras', 'tflite' or 'onnx' (see predict.py).
+        precision (str): Which quantize.py export the 'tflite' and 'onnx' engines load:
+            'float32', 'float16' or 'int8'.
+        num_threads (int): Threads per forward pass for the 'tflite' and 'onnx' engines.
+        auto_reload_interval (float): Seconds between artifact change checks; 0 disables.
+    """
+
+    def __init__(self, model_dir='models', engine='auto', precision='float32', num_threads=1, auto_reload_interval=0.0):
+        self.model_dir = model_dir
+        self.engine = engine
+        self.precision = precision
+        self.num_threads = num_threads
+        self.auto_reload_interval = auto_reload_interval
+        self._bundle = None
+        self._fingerprint = None
+        self._last_check = 0.0
+        self._last_error = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reload_listeners = []
+
+    # --- Artifact resolution ---
+    def _resolve_engine(self, model_dir):
+        if self.engine in RUNTIME_ENGINES:
+            if self.precision not in PRECISIONS:
+                raise ModelNotAvailableError(f"Unknown model precision '{self.precision}'.")
+            return self.engine, os.path.join(model_dir, runtime_model_filename(self.engine, self.precision))
+        if self.engine == 'numpy' or (self.engine == 'auto' and os.path.exists(os.path.join(model_dir, NUMPY_MODEL_FILENAME))):
+            return 'numpy', os.path.join(model_dir, NUMPY_MODEL_FILENAME)
+        if self.engine not in ('auto', 'keras'):
+            raise ModelNotAvailableError(f"Unknown inference engine '{self.engine}'.")
+        return 'keras', os.path.join(model_dir, MODEL_FILENAME)
+
+    def resolved_engine(self):
+        """The engine load() would use for the current model directory, with 'auto' resolved."""
+        return self._resolve_engine(self.model_dir)[0]
+
+    def _artifact_paths(self, model_dir):
+        engine, model_path = self._resolve_engine(model_dir)
+        return engine, model_path, os.path.join(model_dir, FEATURE_SCALER_FILENAME), os.path.join(model_dir, TARGET_SCALER_FILENAME)
+
+    def _fingerprint_of(self, model_dir):
+        _, *paths = self._artifact_paths(model_dir)
+        try:
+            return tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+        except OSError:
+            return None
+
+    # --- Loading ---
+    def _build_bundle(self, model_dir):
+        engine, model_path, feature_scaler_path, target_scaler_path = self._artifact_paths(model_dir)
+        missing = [p for p in (model_path, feature_scaler_path, target_scaler_path) if not os.path.exists(p)]
+        if missing:
+            raise ModelNotAvailableError(
+                f"Model or scaler files not found: {', '.join(missing)}. Please train the model first by running 'src/train.py'."
+            )
+
+        print(f"Loading {engine} model from {model_path}...")
+        try:
+            if engine == 'numpy':
+                model = NumpyMultimodalModel.load(model_path)
+            elif engine in RUNTIME_ENGINES:
+                model = load_runtime_model(engine, model_path, self.num_threads)
+            else:
+                # Imported here so the NumPy engine never pulls in TensorFlow
+                from tensorflow.keras.models import load_model
+                model = load_model(model_path)
+
+            bundle = ModelBundle(
+                model=model,
+                feature_plan=FeaturePlan(joblib.load(feature_scaler_path)),
+                target_inverse=compile_target_inverse(joblib.load(target_scaler_path)),
+                version=f"{engine}-{_file_digest(model_path)}",
+                model_dir=model_dir,
+                engine=engine,
+                precision=self.precision if engine in RUNTIME_ENGINES else 'float32',
+            )
+            self._warm_up(bundle)
+        except Exception as e:
+            raise ModelNotAvailableError(f"Failed to load model from {model_dir}: {e}") from e
+        print(f"Model version {bundle.version} loaded and warmed up.")
+        return bundle
+
+    @staticmethod
+    def _warm_up(bundle):
+        """Runs one dummy forward pass so graph tracing and buffer allocation happen before real traffic."""
+        watch = np.zeros((1, SEQUENCE_LENGTH, len(TIME_SERIES_FEATURES)), dtype=np.float32)
+        profile = np.zeros((1, len(TABULAR_FEATURES)), dtype=np.float32)
+        bundle.model.predict_on_batch(list(bundle.feature_plan.transform(watch, profile)))
+
+    def load(self):
+        """Loads the artifacts now if they are not loaded yet; returns the bundle."""
+        with self._lock:
+            if self._bundle is None:
+                try:
+                    self._bundle = self._build_bundle(self.model_dir)
+                except ModelNotAvailableError as e:
+                    self._last_error = str(e)
+                    raise
+                self._fingerprint = self._fingerprint_of(self.model_dir)
+                self._last_error = None
+            return self._bundle
+
+    def get(self):
+        bundle = self._bundle
+        if bundle is None:
+            return self.load()
+        if self.auto_reload_interval and time.monotonic() - self._last_check >= self.auto_reload_interval:
+            self._last_check = time.monotonic()
+            changed = self._fingerprint_of(self.model_dir) not in (None, self._fingerprint)
+            # Only one thread reloads; the others keep serving the current bundle meanwhile
+            if changed and not self._reload_lock.locked():
+                try:
+                    return self.reload()
+                except ModelNotAvailableError as e:
+                    # Keep serving the current version; a half-written artifact is retried next interval
+                    print(f"Model auto-reload failed, keeping version {bundle.version}: {e}")
+        return bundle
+
+    def reload(self, model_dir=None):
+        """
+        Loads the artifacts from `model_dir` (default: the current model directory) and swaps them in.
+
+        The old bundle keeps serving until the new one has loaded and warmed up successfully.
+        """
+        model_dir = model_dir or self.model_dir
+        with self._reload_lock:
+            try:
+                new_bundle = self._build_bundle(model_dir)
+            except ModelNotAvailableError as e:
+                self._last_error = str(e)
+                raise
+            with self._lock:
+                self._bundle = new_bundle
+                self.model_dir = model_dir
+                self._fingerprint = self._fingerprint_of(model_dir)
+                self._last_error = None
+        for listener in self._reload_listeners:
+            listener(new_bundle)
+        return new_bundle
+
+    def add_reload_listener(self, callback):
+        """Registers callback(bundle), called after every successful reload()."""
+        self._reload_listeners.append(callback)
+
+    # --- Introspection ---
+    @property
+    def is_ready(self):
+        return self._bundle is not None
+
+    def status(self):
+        bundle = self._bundle
+        return {
+            'ready': bundle is not None,
+            'model_version': bundle.version if bundle else None,
+            'engine': bundle.engine if bundle else None,
+            'precision': bundle.precision if bundle else None,
+            'model_dir': bundle.model_dir if bundle else self.model_dir,
+            'loaded_at': bundle.loaded_at if bundle else None,
+            'last_error': self._last_error,
+        }
+
+
+# Process-wide registry used by predict.py, configured from the environment
+model_registry = ModelRegistry(
+    model_dir=os.environ.get('ML_MODEL_DIR', 'models'),
+    engine=os.environ.get('ML_INFERENCE_ENGINE', 'auto'),
+    precision=os.environ.get('ML_MODEL_PRECISION', 'float32'),
+    num_threads=int(os.environ.get('ML_INFERENCE_THREADS', '1')),
+    auto_reload_interval=float(os.environ.get('ML_MODEL_RELOAD_INTERVAL', '0')),
+)
@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+
+# Wrappers around the exported TFLite and ONNX models (see quantize.py) with the same
+# predict()/predict_on_batch([X_lstm, X_mlp]) interface as the Keras and NumPy engines.
+# The runtimes are imported when a model is loaded, so neither is needed otherwise.
+
+RUNTIME_ENGINES = ('tflite', 'onnx')
+PRECISIONS = ('float32', 'float16', 'int8')
+RUNTIME_EXTENSIONS = {'tflite': '.tflite', 'onnx': '.onnx'}
+
+
+def runtime_model_filename(engine, precision):
+    """File name quantize.py writes for an engine/precision pair, e.g. 'multimodal_model_int8.tflite'."""
+    return f"multimodal_model_{precision}{RUNTIME_EXTENSIONS[engine]}"
+
+
+def _split_inputs(inputs):
+    X_lstm, X_mlp = (np.ascontiguousarray(x, dtype=np.float32) for x in inputs)
+    return X_lstm, X_mlp
+
+
+def _batched(model, inputs, batch_size):
+    X_lstm, X_mlp = inputs
+    if batch_size is None or batch_size >= len(X_lstm):
+        return model.predict_on_batch([X_lstm, X_mlp])
+    return np.concatenate([
+        model.predict_on_batch([X_lstm[i:i + batch_size], X_mlp[i:i + batch_size]])
+        for i in range(0, len(X_lstm), batch_size)
+    ])
+
+
+class TFLiteModel:
+    """
+    Runs a .tflite export with the LiteRT interpreter (ai-edge-litert), or TensorFlow's
+    bundled tf.lite interpreter when that isn't installed.
+
+    An interpreter is not thread-safe, so each request thread gets its own, created on
+    first use from the shared model bytes. Inputs are matched by rank (the converter may
+    order them by name), and tensors are only resized when the batch size changes.
+    """
+
+    def __init__(self, model_content, num_threads=1):
+        self.model_content = model_content
+        self.num_threads = num_threads
+        self._local = threading.local()
+        self._interpreter_class = self._import_interpreter()
+        self._interpreter()  # Fail at load time, not on the first request
+
+    @staticmethod
+    def _import_interpreter():
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        return Interpreter
+
+    @classmethod
+    def load(cls, path, num_threads=1):
+        with open(path, 'rb') as f:
+            return cls(f.read(), num_threads)
+
+    def _interpreter(self):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            interpreter = self._interpreter_class(model_content=self.model_content, num_threads=self.num_threads)
+            inputs = {len(detail['shape']): detail for detail in interpreter.get_input_details()}
+            state = self._local.state = {
+                'interpreter': interpreter,
+                'lstm': inputs[3],
+                'mlp': inputs[2],
+                'output': interpreter.get_output_details()[0]['index'],
+                'batch_size': None,
+            }
+        return state
+
+    def predict_on_batch(self, inputs):
+        X_lstm, X_mlp = _split_inputs(inputs)
+        state = self._interpreter()
+        interpreter = state['interpreter']
+        if state['batch_size'] != len(X_lstm):
+            interpreter.resize_tensor_input(state['lstm']['index'], X_lstm.shape)
+            interpreter.resize_tensor_input(state['mlp']['index'], X_mlp.shape)
+            interpreter.allocate_tensors()
+            state['batch_size'] = len(X_lstm)
+        interpreter.set_tensor(state['lstm']['index'], X_lstm)
+        interpreter.set_tensor(state['mlp']['index'], X_mlp)
+        interpreter.invoke()
+        # The output buffer is reused by the next invoke(), so hand out a copy
+        return interpreter.get_tensor(state['output']).copy()
+
+    def predict(self, inputs, batch_size=None, verbose=0):
+        return _batched(self, inputs, batch_size)
+
+
+class OnnxModel:
+    """Runs an .onnx export with ONNX Runtime on the CPU. Sessions are thread-safe, so one is shared."""
+
+    def __init__(self, session):
+        self.session = session
+        inputs = {len(node.shape): node.name for node in session.get_inputs()}
+        self.lstm_input, self.mlp_input = inputs[3], inputs[2]
+
+    @classmethod
+    def load(cls, path, num_threads=1):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        return cls(onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider']))
+
+    def predict_on_batch(self, inputs):
+        X_lstm, X_mlp = _split_inputs(inputs)
+        return self.session.run(None, {self.lstm_input: X_lstm, self.mlp_input: X_mlp})[0]
+
+    def predict(self, inputs, batch_size=None, verbose=0):
+        return _batched(self, inputs, batch_size)
+
+
+def load_runtime_model(engine, path, num_threads=1):
+    """Loads a TFLite or ONNX export as a model with predict_on_batch([X_lstm, X_mlp])."""
+    if engine == 'tflite':
+        return TFLiteModel.load(path, num_threads)
+    if engine == 'onnx':
+        return OnnxModel.load(path, num_threads)
+    raise ValueError(f"Unknown runtime engine '{engine}'.")
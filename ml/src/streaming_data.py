@@ -0,0 +1,219 @@
+"""
+Out-of-core version of the data_processing.py pipeline.
+
+Instead of one in-memory DataFrame and a .npz of materialized windows, the raw CSV is
+processed in three streaming steps, holding at most one chunk or one partition in memory:
+
+1. partition_by_user(): split the CSV into partitions by hashing user_id, so every user's
+   history lives in exactly one partition.
+2. fit_scalers(): first pass over the partitions. Fits the MinMax scalers with
+   partial_fit and counts rows and windows.
+3. write_windowed_dataset(): second pass. Writes the scaled rows once, as memory-mapped
+   .npy base arrays, plus the start row of every window.
+
+A window is never stored. WindowedDataset slices it out of the base arrays when a batch
+is requested, so disk use grows with users x days rather than users x days x 14.
+
+Run from the ml/ directory:
+
+    python -m src.streaming_data --partitions 64 --chunksize 200000
+"""
+import argparse
+import glob
+import json
+import os
+import zlib
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from src.data_processing import (
+    window_starts, NON_FEATURE_COLS, TIME_SERIES_FEATURES, TABULAR_FEATURES, TARGET_FEATURES
+)
+
+SERIES_FILE = 'series.npy'
+TABULAR_FILE = 'tabular.npy'
+TARGETS_FILE = 'targets.npy'
+STARTS_FILE = 'window_starts.npy'
+USERS_FILE = 'window_users.npy'
+META_FILE = 'meta.json'
+
+
+# --- 1. Partition the Raw CSV by User ---
+def partition_by_user(csv_path, partition_dir, num_partitions=64, chunksize=200000):
+    """
+    Streams `csv_path` in chunks and appends each row to partition `crc32(user_id) % num_partitions`.
+
+    Returns:
+        list: Paths of the non-empty partition files.
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(partition_dir, 'part-*.csv')):
+        os.remove(stale)
+
+    print(f"Partitioning {csv_path} into {num_partitions} user partitions...")
+    written = set()
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk = chunk[chunk['user_id'].notna()]
+        buckets = chunk['user_id'].astype(str).map(lambda uid: zlib.crc32(uid.encode()) % num_partitions)
+        for bucket, part in chunk.groupby(buckets):
+            path = os.path.join(partition_dir, f"part-{bucket:05d}.csv")
+            part.to_csv(path, mode='a', header=path not in written, index=False)
+            written.add(path)
+    return sorted(written)
+
+
+def _read_partition(path):
+    # Partitions hold complete users, so sorting here gives contiguous, date-ordered user blocks
+    df = pd.read_csv(path, parse_dates=['date'])
+    df['gender_numeric'] = (df['gender'] == 'M').astype(np.int64)
+    return df.sort_values(['user_id', 'date'], kind='stable').reset_index(drop=True)
+
+
+# --- 2. First Pass: Fit Scalers and Count ---
+def fit_scalers(partition_paths, sequence_length=14):
+    """
+    Fits the feature and target MinMax scalers incrementally, partition by partition.
+
+    Returns:
+        tuple: (feature_scaler, target_scaler, num_rows, num_windows)
+    """
+    print("Pass 1: fitting scalers...")
+    feature_scaler, target_scaler = MinMaxScaler(), MinMaxScaler()
+    num_rows = num_windows = 0
+    for path in partition_paths:
+        df = _read_partition(path)
+        feature_cols = df.columns.drop(NON_FEATURE_COLS + ['gender_numeric'])
+        feature_scaler.partial_fit(df[feature_cols])
+        target_scaler.partial_fit(df[TARGET_FEATURES])
+        num_rows += len(df)
+        num_windows += len(window_starts(df['user_id'].to_numpy(), sequence_length))
+    return feature_scaler, target_scaler, num_rows, num_windows
+
+
+# --- 3. Second Pass: Write Base Arrays and Window Offsets ---
+def write_windowed_dataset(partition_paths, output_dir, feature_scaler, target_scaler,
+                           num_rows, num_windows, sequence_length=14):
+    """
+    Scales each partition and writes it into preallocated memory-mapped .npy files.
+
+    Layout of `output_dir`:
+        series.npy          (rows, 6) float32   scaled watch features
+        tabular.npy         (rows, 8) float32   scaled profile features (gender unscaled)
+        targets.npy         (rows, 2) float32   scaled TG and GGT
+        window_starts.npy   (windows,) int64    first row of each window; target row is start + sequence_length
+        window_users.npy    (windows,) int64    user number (0..num_users-1), for grouped splits
+        meta.json                               shapes, column names and sequence length
+    """
+    print("Pass 2: writing memory-mapped base arrays...")
+    os.makedirs(output_dir, exist_ok=True)
+    open_memmap = np.lib.format.open_memmap
+    series = open_memmap(os.path.join(output_dir, SERIES_FILE), mode='w+', dtype=np.float32, shape=(num_rows, len(TIME_SERIES_FEATURES)))
+    tabular = open_memmap(os.path.join(output_dir, TABULAR_FILE), mode='w+', dtype=np.float32, shape=(num_rows, len(TABULAR_FEATURES)))
+    targets = open_memmap(os.path.join(output_dir, TARGETS_FILE), mode='w+', dtype=np.float32, shape=(num_rows, len(TARGET_FEATURES)))
+    starts = open_memmap(os.path.join(output_dir, STARTS_FILE), mode='w+', dtype=np.int64, shape=(num_windows,))
+    users = open_memmap(os.path.join(output_dir, USERS_FILE), mode='w+', dtype=np.int64, shape=(num_windows,))
+
+    row_offset = window_offset = user_offset = 0
+    feature_cols = list(feature_scaler.feature_names_in_)
+    for path in partition_paths:
+        df = _read_partition(path)
+        df[feature_cols] = feature_scaler.transform(df[feature_cols])
+        df[TARGET_FEATURES] = target_scaler.transform(df[TARGET_FEATURES])
+
+        user_ids = df['user_id'].to_numpy()
+        part_starts = window_starts(user_ids, sequence_length)
+        user_codes = pd.factorize(user_ids)[0]
+
+        rows = slice(row_offset, row_offset + len(df))
+        series[rows] = df[TIME_SERIES_FEATURES].to_numpy(dtype=np.float64)
+        tabular[rows] = df[TABULAR_FEATURES].to_numpy(dtype=np.float64)
+        targets[rows] = df[TARGET_FEATURES].to_numpy(dtype=np.float64)
+        windows = slice(window_offset, window_offset + len(part_starts))
+        starts[windows] = part_starts + row_offset
+        users[windows] = user_codes[part_starts] + user_offset
+
+        row_offset += len(df)
+        window_offset += len(part_starts)
+        user_offset += (user_codes.max() + 1) if len(user_codes) else 0
+
+    for array in (series, tabular, targets, starts, users):
+        array.flush()
+
+    meta = {
+        'sequence_length': sequence_length,
+        'num_rows': num_rows,
+        'num_windows': num_windows,
+        'num_users': int(user_offset),
+        'time_series_features': TIME_SERIES_FEATURES,
+        'tabular_features': TABULAR_FEATURES,
+        'target_features': TARGET_FEATURES,
+    }
+    with open(os.path.join(output_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Wrote {num_rows} rows and {num_windows} window offsets to {output_dir}")
+    return meta
+
+
+# --- 4. Reading Windows Back ---
+class WindowedDataset:
+    """
+    Read-only view over a directory written by write_windowed_dataset().
+
+    The base arrays are opened with mmap_mode='r', so only the pages a batch touches are
+    read, and processes opening the same files share the page cache.
+    """
+
+    def __init__(self, data_dir):
+        with open(os.path.join(data_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.sequence_length = self.meta['sequence_length']
+        self.series = np.load(os.path.join(data_dir, SERIES_FILE), mmap_mode='r')
+        self.tabular = np.load(os.path.join(data_dir, TABULAR_FILE), mmap_mode='r')
+        self.targets = np.load(os.path.join(data_dir, TARGETS_FILE), mmap_mode='r')
+        self.starts = np.load(os.path.join(data_dir, STARTS_FILE), mmap_mode='r')
+        self.users = np.load(os.path.join(data_dir, USERS_FILE), mmap_mode='r')
+        self._steps = np.arange(self.sequence_length)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def lstm_shape(self):
+        return (self.sequence_length, self.series.shape[1])
+
+    @property
+    def mlp_shape(self):
+        return (self.tabular.shape[1],)
+
+    def get_batch(self, window_indices):
+        """Builds ((X_lstm, X_mlp), y) for the given window indices."""
+        starts = self.starts[window_indices]
+        X_lstm = self.series[starts[:, None] + self._steps]
+        target_rows = starts + self.sequence_length
+        return (X_lstm, self.tabular[target_rows]), self.targets[target_rows]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Streaming preprocessing into a memory-mapped window dataset.")
+    parser.add_argument('--input', default='data/raw/synthetic_trig_ggt_dataset_with_watch.csv')
+    parser.add_argument('--partition-dir', default='data/interim/partitions')
+    parser.add_argument('--output-dir', default='data/processed/windows')
+    parser.add_argument('--partitions', type=int, default=64)
+    parser.add_argument('--chunksize', type=int, default=200000)
+    parser.add_argument('--sequence-length', type=int, default=14)
+    args = parser.parse_args()
+
+    FEATURE_SCALER_PATH = 'models/feature_scaler.pkl'
+    TARGET_SCALER_PATH = 'models/target_scaler.pkl'
+
+    partitions = partition_by_user(args.input, args.partition_dir, args.partitions, args.chunksize)
+    feature_scaler, target_scaler, num_rows, num_windows = fit_scalers(partitions, args.sequence_length)
+    joblib.dump(feature_scaler, FEATURE_SCALER_PATH)
+    joblib.dump(target_scaler, TARGET_SCALER_PATH)
+    print(f"Scalers saved to {FEATURE_SCALER_PATH} and {TARGET_SCALER_PATH}")
+
+    write_windowed_dataset(partitions, args.output_dir, feature_scaler, target_scaler,
+                           num_rows, num_windows, args.sequence_length)
+    print("\n--- Streaming Data Processing Complete ---")
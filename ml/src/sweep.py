@@ -0,0 +1,325 @@
+"""
+Hyperparameter sweep over build_multimodal_model variants, trained in parallel processes.
+
+Run from the ml/ directory:
+
+    python -m src.sweep --spec sweep.json --cores-per-trial 2
+
+The spec is a JSON file (all keys optional):
+
+    {
+      "base": {"epochs": 40, "batch_size": 256},
+      "grid": {"lstm_units": [32, 64, 128], "mlp_units": [[32, 16], [64, 32]],
+               "base_learning_rate": [0.001, 0.003]},
+      "max_trials": 8
+    }
+
+"base" holds train.py settings shared by every trial. "grid" keys are
+build_multimodal_model arguments or train.py settings; every combination is a trial,
+or a random `max_trials` of them. Each worker process is pinned to its own
+`--cores-per-trial` CPUs, and all of them memory-map the same copy of the preprocessed
+data. Trials whose validation MAE falls behind the median of the others are pruned.
+The leaderboard (validation MAE, NumPy-engine latency and model size) is written as
+leaderboard.csv and leaderboard.json in the output directory.
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# build_multimodal_model arguments a trial may set; everything else goes to the train config
+ARCHITECTURE_KEYS = ('lstm_units', 'mlp_units', 'head_units', 'lstm_dropout', 'mlp_dropout', 'head_dropout')
+
+DEFAULT_GRID = {
+    'lstm_units': [32, 64, 128],
+    'mlp_units': [[32, 16], [64, 32]],
+    'head_dropout': [0.2, 0.3],
+}
+
+SHARED_ARRAYS = ('X_lstm', 'X_mlp', 'y')
+
+
+# --- 1. Trials ---
+def expand_grid(grid, max_trials=None, seed=42):
+    """Every combination of the grid values as a list of {'id', 'params'} trials."""
+    keys = sorted(grid)
+    combinations = [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+    if max_trials and max_trials < len(combinations):
+        chosen = np.random.default_rng(seed).choice(len(combinations), max_trials, replace=False)
+        combinations = [combinations[i] for i in sorted(chosen)]
+    return [{'id': f"trial_{number:03d}", 'params': params} for number, params in enumerate(combinations)]
+
+
+def trial_config(base_config, params):
+    """Splits a trial's parameters into the train config and the builder's architecture."""
+    config = dict(base_config)
+    config['architecture'] = dict(base_config.get('architecture', {}))
+    for key, value in params.items():
+        if key in ARCHITECTURE_KEYS:
+            config['architecture'][key] = tuple(value) if isinstance(value, list) else value
+        else:
+            config[key] = value
+    return config
+
+
+# --- 2. Shared data ---
+def prepare_shared_data(config, output_dir):
+    """
+    Makes the preprocessed data memory-mappable and fixes the train/validation split.
+
+    A window dataset is already a set of .npy files. The .npz is written out once as .npy
+    files, because arrays inside an .npz can't be memory-mapped. Every worker then maps the
+    same files, so the OS page cache holds a single copy however many trials run.
+
+    Returns:
+        dict: What open_shared_data() needs to reopen the data in a worker.
+    """
+    from src.train import load_training_data, split_indices, WindowedDataset
+
+    dataset = load_training_data(config)
+    shared_dir = os.path.join(output_dir, 'shared')
+    os.makedirs(shared_dir, exist_ok=True)
+    if isinstance(dataset, WindowedDataset):
+        data_ref = {'kind': 'windows', 'path': config['windows_dir']}
+    else:
+        for name, array in zip(SHARED_ARRAYS, (dataset.X_lstm, dataset.X_mlp, dataset.y)):
+            np.save(os.path.join(shared_dir, f"{name}.npy"), array)
+        data_ref = {'kind': 'arrays', 'path': shared_dir}
+
+    # One split for all trials, so their validation MAEs are comparable
+    train_idx, val_idx = split_indices(dataset, config)
+    np.save(os.path.join(shared_dir, 'train_idx.npy'), train_idx)
+    np.save(os.path.join(shared_dir, 'val_idx.npy'), val_idx)
+    data_ref['split_dir'] = shared_dir
+    return data_ref
+
+
+def open_shared_data(data_ref):
+    from src.train import ArrayDataset, WindowedDataset
+
+    if data_ref['kind'] == 'windows':
+        dataset = WindowedDataset(data_ref['path'])
+    else:
+        arrays = [np.load(os.path.join(data_ref['path'], f"{name}.npy"), mmap_mode='r') for name in SHARED_ARRAYS]
+        dataset = ArrayDataset(*arrays)
+    train_idx = np.load(os.path.join(data_ref['split_dir'], 'train_idx.npy'))
+    val_idx = np.load(os.path.join(data_ref['split_dir'], 'val_idx.npy'))
+    return dataset, train_idx, val_idx
+
+
+# --- 3. Worker processes ---
+_worker_cores = None
+
+
+def core_groups(cores_per_trial, num_workers):
+    """Splits the CPUs this process may use into `num_workers` groups of `cores_per_trial`."""
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    groups = [available[i:i + cores_per_trial] for i in range(0, len(available), cores_per_trial)]
+    groups = [group for group in groups if len(group) == cores_per_trial] or [available]
+    # More workers than groups only happens when asked for explicitly; they then share cores
+    return [groups[i % len(groups)] for i in range(num_workers)]
+
+
+def _init_worker(core_queue, base_config):
+    """
+    Pins the worker to its CPU group and applies train.py's runtime settings. Thread pools
+    not sized by the base config are sized to the CPU group.
+    """
+    global _worker_cores
+    _worker_cores = core_queue.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, _worker_cores)
+    os.environ['OMP_NUM_THREADS'] = str(len(_worker_cores))
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    from src.train import configure_runtime
+    # Thread pools can only be sized before the first op, i.e. once per worker process
+    configure_runtime({
+        **base_config,
+        'intra_op_threads': base_config['intra_op_threads'] or len(_worker_cores),
+        'inter_op_threads': base_config['inter_op_threads'] or 1,
+    })
+
+
+def _pruning_callback(trial_id, reports, lock, warmup_epochs, min_peers):
+    """
+    Median stopping rule: after `warmup_epochs`, stop a trial whose best validation MAE so
+    far is worse than the median of the other trials' best at the same epoch.
+    """
+    import tensorflow as tf
+
+    class MedianPruning(tf.keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.best = np.inf
+            self.pruned_at = None
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.best = min(self.best, logs['val_mean_absolute_error'])
+            with lock:
+                peers = dict(reports.get(epoch, {}))
+                peers[trial_id] = self.best
+                reports[epoch] = peers
+            others = [value for key, value in peers.items() if key != trial_id]
+            if epoch + 1 >= warmup_epochs and len(others) >= min_peers and self.best > np.median(others):
+                self.pruned_at = epoch + 1
+                self.model.stop_training = True
+
+    return MedianPruning()
+
+
+def run_trial(trial, base_config, data_ref, output_dir, pruning):
+    """Trains and measures one trial inside a worker. Returns its leaderboard row."""
+    import tensorflow as tf
+    from src.model_builder import build_multimodal_model
+    from src.numpy_engine import export_weights, NumpyMultimodalModel
+    from src.quantize import measure_latency
+    from src.train import make_tf_dataset, scaled_learning_rate
+
+    config = trial_config(base_config, trial['params'])
+    row = {'trial': trial['id'], 'params': trial['params'], 'cores': list(_worker_cores or [])}
+    trial_dir = os.path.join(output_dir, 'trials', trial['id'])
+    os.makedirs(trial_dir, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        tf.keras.backend.clear_session()
+        # The worker ran configure_runtime() with the base config; these two may vary per
+        # trial, and the precision policy would otherwise carry over from the previous one
+        tf.keras.utils.set_random_seed(config['seed'])
+        tf.keras.mixed_precision.set_global_policy(config['mixed_precision'] or 'float32')
+        dataset, train_idx, val_idx = open_shared_data(data_ref)
+        pipeline = dict(parallel_calls=len(_worker_cores or [1]), deterministic=config['deterministic'])
+        train_data = make_tf_dataset(dataset, train_idx, config['batch_size'], shuffle=True, seed=config['seed'], **pipeline)
+        validation_data = make_tf_dataset(dataset, val_idx, config['batch_size'], **pipeline)
+
+        model = build_multimodal_model(tuple(dataset.lstm_shape), tuple(dataset.mlp_shape),
+                                       learning_rate=scaled_learning_rate(config), **config['architecture'])
+        callbacks = [tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=config['patience'], restore_best_weights=True)]
+        pruner = _pruning_callback(trial['id'], **pruning) if pruning else None
+        if pruner is not None:
+            callbacks.append(pruner)
+        history = model.fit(train_data, epochs=config['epochs'], validation_data=validation_data,
+                            callbacks=callbacks, verbose=0)
+
+        model.save(os.path.join(trial_dir, 'model.h5'))
+        numpy_path = os.path.join(trial_dir, 'model.npz')
+        export_weights(model, numpy_path)
+        numpy_model = NumpyMultimodalModel.load(numpy_path)
+        latency_inputs = [np.asarray(x, dtype=np.float32) for x in dataset.get_batch(np.sort(val_idx[:64]))[0]]
+        val_mae = history.history['val_mean_absolute_error']
+        row.update({
+            'status': 'pruned' if pruner is not None and pruner.pruned_at else 'completed',
+            'epochs': len(val_mae),
+            'best_val_mae': float(min(val_mae)),
+            'latency_ms_batch1': measure_latency(numpy_model, latency_inputs, 1, repeats=200),
+            'latency_ms_batch64': measure_latency(numpy_model, latency_inputs, 64, repeats=50),
+            'parameters': int(model.count_params()),
+            'size_kb': os.path.getsize(numpy_path) / 1024,
+        })
+    except Exception as e:
+        row.update({'status': 'failed', 'error': str(e)})
+    row['train_seconds'] = time.perf_counter() - start
+    with open(os.path.join(trial_dir, 'result.json'), 'w') as f:
+        json.dump(row, f, indent=2)
+    return row
+
+
+# --- 4. Leaderboard ---
+def pareto_front(rows):
+    """Marks rows no other row beats on both validation MAE and latency."""
+    scored = [row for row in rows if 'best_val_mae' in row]
+    for row in scored:
+        row['pareto'] = not any(
+            other['best_val_mae'] <= row['best_val_mae'] and other['latency_ms_batch1'] <= row['latency_ms_batch1']
+            and (other['best_val_mae'], other['latency_ms_batch1']) != (row['best_val_mae'], row['latency_ms_batch1'])
+            for other in scored
+        )
+
+
+def write_leaderboard(rows, output_dir):
+    status_order = {'completed': 0, 'pruned': 1, 'failed': 2}
+    rows = sorted(rows, key=lambda row: (status_order[row['status']], row.get('best_val_mae', np.inf)))
+    pareto_front(rows)
+    with open(os.path.join(output_dir, 'leaderboard.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+
+    columns = ['trial', 'status', 'best_val_mae', 'latency_ms_batch1', 'latency_ms_batch64', 'parameters',
+               'size_kb', 'epochs', 'train_seconds', 'pareto', 'params']
+    with open(os.path.join(output_dir, 'leaderboard.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, 'params': json.dumps(row['params'])})
+
+    print(f"\n{'trial':<10} {'status':<10} {'val MAE':>8} {'ms (b=1)':>9} {'params':>8} {'KB':>7}  params")
+    for row in rows:
+        if 'best_val_mae' not in row:
+            print(f"{row['trial']:<10} {row['status']:<10} {row.get('error', '')}")
+            continue
+        marker = '*' if row['pareto'] else ' '
+        print(f"{row['trial']:<10} {row['status']:<10} {row['best_val_mae']:>8.4f} {row['latency_ms_batch1']:>9.3f} "
+              f"{row['parameters']:>8} {row['size_kb']:>7.1f} {marker}{json.dumps(row['params'])}")
+    print("* = Pareto-optimal on validation MAE vs. latency")
+    return rows
+
+
+# --- 5. Sweep ---
+def run_sweep(spec, output_dir, cores_per_trial=1, num_workers=None, prune=True, warmup_epochs=5, min_peers=2):
+    from src.train import DEFAULT_CONFIG
+
+    base_config = {**DEFAULT_CONFIG, 'run_log_path': None, **spec.get('base', {})}
+    trials = expand_grid(spec.get('grid', DEFAULT_GRID), spec.get('max_trials'), base_config['seed'])
+    os.makedirs(output_dir, exist_ok=True)
+    data_ref = prepare_shared_data(base_config, output_dir)
+
+    available = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    num_workers = min(num_workers or max(1, available // cores_per_trial), len(trials))
+    print(f"Running {len(trials)} trials on {num_workers} workers with {cores_per_trial} core(s) each...")
+
+    # TensorFlow isn't fork-safe, so workers are spawned fresh
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        core_queue = manager.Queue()
+        for group in core_groups(cores_per_trial, num_workers):
+            core_queue.put(group)
+        pruning = None
+        if prune:
+            pruning = dict(reports=manager.dict(), lock=manager.Lock(), warmup_epochs=warmup_epochs, min_peers=min_peers)
+
+        rows = []
+        with ProcessPoolExecutor(num_workers, mp_context=context, initializer=_init_worker, initargs=(core_queue, base_config)) as pool:
+            futures = {pool.submit(run_trial, trial, base_config, data_ref, output_dir, pruning): trial for trial in trials}
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory)
+                    row = {'trial': futures[future]['id'], 'params': futures[future]['params'], 'status': 'failed', 'error': str(e)}
+                rows.append(row)
+                print(f"{row['trial']}: {row['status']} {row.get('best_val_mae', row.get('error', ''))}")
+
+    return write_leaderboard(rows, output_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--spec', help="Sweep spec JSON (defaults to DEFAULT_GRID with train.py defaults).")
+    parser.add_argument('--output-dir', default=os.path.join('sweeps', time.strftime('%Y%m%d-%H%M%S')))
+    parser.add_argument('--cores-per-trial', type=int, default=1)
+    parser.add_argument('--workers', type=int, help="Defaults to available cores / cores per trial.")
+    parser.add_argument('--no-pruning', dest='prune', action='store_false')
+    parser.add_argument('--warmup-epochs', type=int, default=5, help="Epochs before a trial can be pruned.")
+    parser.add_argument('--min-peers', type=int, default=2, help="Other trials that must have reported an epoch before pruning on it.")
+    args = parser.parse_args()
+
+    spec = {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    run_sweep(spec, args.output_dir, args.cores_per_trial, args.workers, args.prune, args.warmup_epochs, args.min_peers)
@@ -1,63 +1,300 @@
+"""
+Trains the multimodal model.
+
+Run from the ml/ directory. Every setting has a default below and can be overridden from a
+JSON file and then from the command line:
+
+    python -m src.train
+    python -m src.train --config train_config.json --batch-size 512 --intra-op-threads 8
+"""
+import argparse
+import json
+import os
+import time
+
 import numpy as np
 import tensorflow as tf
 from sklearn.model_selection import train_test_split
 from src.model_builder import build_multimodal_model
-import os
+from src.numpy_engine import export_weights
+from src.streaming_data import WindowedDataset, META_FILE
+
+# --- 1. Default Configuration ---
+DEFAULT_CONFIG = {
+    # Inputs: the memory-mapped window dataset (src/streaming_data.py) is preferred over the .npz
+    'data_path': 'data/processed/preprocessed_data.npz',
+    'windows_dir': 'data/processed/windows',
+    # Outputs: the .h5 for the Keras engine, plus NumPy weights next to it for fast loading
+    'model_save_path': 'models/multimodal_model.h5',
+    'numpy_export': True,
+    'saved_model_dir': None,
+    'run_log_path': 'models/training_run.json',
+    # build_multimodal_model arguments (lstm_units, mlp_units, ...); JSON config only
+    'architecture': {},
+    # Optimization
+    'epochs': 100,
+    'batch_size': 256,
+    'base_batch_size': 32,
+    'base_learning_rate': 0.001,
+    'lr_scaling': 'sqrt',            # 'linear', 'sqrt' or 'none', relative to base_batch_size
+    'patience': 10,
+    'val_fraction': 0.2,
+    'mixed_precision': None,         # None, 'mixed_float16' or 'mixed_bfloat16'
+    # Input pipeline and CPU
+    'parallel_calls': -1,            # tf.data map parallelism; -1 lets tf.data tune it
+    'intra_op_threads': 0,           # 0 lets TensorFlow pick
+    'inter_op_threads': 0,
+    # Reproducibility
+    'seed': 42,
+    'deterministic': False,
+}
+
+
+class ArrayDataset:
+    """In-memory counterpart of WindowedDataset for the preprocessed .npz file."""
+
+    def __init__(self, X_lstm, X_mlp, y, users=None):
+        self.X_lstm, self.X_mlp, self.y = X_lstm, X_mlp, y
+        self.users = users
+
+    def __len__(self):
+        return len(self.X_lstm)
+
+    @property
+    def lstm_shape(self):
+        return self.X_lstm.shape[1:]
+
+    @property
+    def mlp_shape(self):
+        return self.X_mlp.shape[1:]
+
+    def get_batch(self, window_indices):
+        return (self.X_lstm[window_indices], self.X_mlp[window_indices]), self.y[window_indices]
+
+
+# --- 2. Runtime Setup ---
+def configure_runtime(config):
+    """Threading, seeds and precision. Must run before TensorFlow executes any op."""
+    if config['intra_op_threads']:
+        tf.config.threading.set_intra_op_parallelism_threads(config['intra_op_threads'])
+    if config['inter_op_threads']:
+        tf.config.threading.set_inter_op_parallelism_threads(config['inter_op_threads'])
+    tf.keras.utils.set_random_seed(config['seed'])
+    if config['deterministic']:
+        tf.config.experimental.enable_op_determinism()
+    if config['mixed_precision']:
+        tf.keras.mixed_precision.set_global_policy(config['mixed_precision'])
+
+
+def scaled_learning_rate(config):
+    """Scales the base learning rate with the batch size (linear or square-root rule)."""
+    ratio = config['batch_size'] / config['base_batch_size']
+    factor = {'linear': ratio, 'sqrt': ratio ** 0.5, 'none': 1.0}[config['lr_scaling']]
+    return config['base_learning_rate'] * factor
+
+
+# --- 3. Data ---
+def load_training_data(config):
+    """Returns a WindowedDataset or ArrayDataset, whichever preprocessed data is present."""
+    if os.path.exists(os.path.join(config['windows_dir'], META_FILE)):
+        # Windows are built on the fly from memory-mapped base arrays, batch by batch
+        print(f"Opening memory-mapped window dataset in {config['windows_dir']}...")
+        return WindowedDataset(config['windows_dir'])
+
+    print(f"Loading preprocessed data from {config['data_path']}...")
+    try:
+        data = np.load(config['data_path'])
+    except FileNotFoundError:
+        print("Error: Preprocessed data not found.")
+        print("Please run 'src/data_processing.py' or 'src/streaming_data.py' first to generate the data.")
+        exit()
+    users = data['window_users'] if 'window_users' in data.files else None
+    return ArrayDataset(data['X_lstm'], data['X_mlp'], data['y'], users)
+
+
+def user_grouped_split(users, val_fraction, seed):
+    """
+    Splits window indices so every user's windows land on the same side.
+
+    Windows of one user overlap by 13 of 14 days, so a random split over windows puts
+    nearly identical samples in both sets and overstates validation accuracy.
+    """
+    unique_users = np.unique(users)
+    rng = np.random.default_rng(seed)
+    num_val_users = max(1, int(round(len(unique_users) * val_fraction)))
+    val_users = rng.permutation(unique_users)[:num_val_users]
+    is_val = np.isin(users, val_users)
+    return np.flatnonzero(~is_val), np.flatnonzero(is_val)
+
+
+def split_indices(dataset, config):
+    if dataset.users is not None:
+        return user_grouped_split(np.asarray(dataset.users), config['val_fraction'], config['seed'])
+    print("Warning: no per-window user ids in the data; falling back to a random window split. "
+          "Re-run src/data_processing.py to enable user-grouped splits.")
+    return train_test_split(np.arange(len(dataset)), test_size=config['val_fraction'], random_state=config['seed'])
+
+
+def make_tf_dataset(dataset, window_indices, batch_size, shuffle=False, seed=None, parallel_calls=-1, deterministic=False):
+    """
+    tf.data pipeline over window indices: shuffle and batch the indices, then gather the
+    batches with a parallel map and prefetch them while the model trains.
+    """
+    num_parallel_calls = tf.data.AUTOTUNE if parallel_calls == -1 else parallel_calls
+    lstm_shape, mlp_shape = tuple(dataset.lstm_shape), tuple(dataset.mlp_shape)
+    target_shape = np.shape(dataset.get_batch(np.arange(1))[1])[1:]
+
+    def gather(batch_indices):
+        # Sorted indices read the memory-mapped arrays front to back
+        (X_lstm, X_mlp), y = dataset.get_batch(np.sort(batch_indices))
+        return (np.asarray(X_lstm, dtype=np.float32), np.asarray(X_mlp, dtype=np.float32),
+                np.asarray(y, dtype=np.float32))
+
+    def load(batch_indices):
+        X_lstm, X_mlp, y = tf.numpy_function(gather, [batch_indices], [tf.float32, tf.float32, tf.float32])
+        X_lstm.set_shape((None,) + lstm_shape)
+        X_mlp.set_shape((None,) + mlp_shape)
+        y.set_shape((None,) + target_shape)
+        return (X_lstm, X_mlp), y
+
+    indices = tf.data.Dataset.from_tensor_slices(np.asarray(window_indices, dtype=np.int64))
+    if shuffle:
+        indices = indices.shuffle(len(window_indices), seed=seed, reshuffle_each_iteration=True)
+    batches = indices.batch(batch_size).map(load, num_parallel_calls=num_parallel_calls, deterministic=deterministic)
+    return batches.prefetch(tf.data.AUTOTUNE)
+
+
+# --- 4. Throughput Logging ---
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Adds `samples_per_sec` (training samples over the epoch's training time, validation excluded) to each epoch's logs."""
+
+    def __init__(self, num_samples):
+        super().__init__()
+        self.num_samples = num_samples
+        self._epoch_start = None
+        self._train_end = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+        self._train_end = None
+
+    def on_test_begin(self, logs=None):
+        # Validation runs at the end of the epoch; the training part stops here
+        if self._epoch_start is not None and self._train_end is None:
+            self._train_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = (self._train_end or time.perf_counter()) - self._epoch_start
+        samples_per_sec = self.num_samples / elapsed
+        if logs is not None:
+            logs['samples_per_sec'] = samples_per_sec
+            logs['epoch_seconds'] = elapsed
+        print(f"Epoch {epoch + 1}: {samples_per_sec:,.0f} samples/s ({elapsed:.1f}s)")
+
+
+# --- 5. Export ---
+def export_model(model, config):
+    """Saves the .h5, the NumPy engine weights and, if configured, a TF SavedModel."""
+    model_path = config['model_save_path']
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+    model.save(model_path)
+    print(f"Trained model saved successfully to {model_path}")
+
+    if config['numpy_export']:
+        # Loads in milliseconds without TensorFlow; the registry prefers it ('auto' engine)
+        numpy_path = os.path.splitext(model_path)[0] + '.npz'
+        export_weights(model, numpy_path)
+
+    if config['saved_model_dir']:
+        if hasattr(model, 'export'):
+            model.export(config['saved_model_dir'])
+        else:
+            tf.saved_model.save(model, config['saved_model_dir'])
+        print(f"SavedModel exported to {config['saved_model_dir']}")
+
+
+def _to_builtin(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def train(config):
+    """Runs one training job and returns (model, history)."""
+    configure_runtime(config)
+
+    # --- Load the Preprocessed Data ---
+    dataset = load_training_data(config)
+    print("Data loaded successfully.")
+    print(f"LSTM input shape: {(len(dataset),) + tuple(dataset.lstm_shape)}")
+    print(f"MLP input shape: {(len(dataset),) + tuple(dataset.mlp_shape)}")
+
+    # --- Split the Data into Training and Validation Sets ---
+    print("Splitting data into training and validation sets...")
+    train_idx, val_idx = split_indices(dataset, config)
+    print(f"{len(train_idx)} training and {len(val_idx)} validation windows")
+
+    pipeline = dict(parallel_calls=config['parallel_calls'], deterministic=config['deterministic'])
+    train_data = make_tf_dataset(dataset, train_idx, config['batch_size'], shuffle=True, seed=config['seed'], **pipeline)
+    validation_data = make_tf_dataset(dataset, val_idx, config['batch_size'], **pipeline)
+
+    # --- Build the Model ---
+    learning_rate = scaled_learning_rate(config)
+    print(f"Batch size {config['batch_size']}, learning rate {learning_rate:.5f} ({config['lr_scaling']} scaling)")
+    model = build_multimodal_model(tuple(dataset.lstm_shape), tuple(dataset.mlp_shape), learning_rate=learning_rate,
+                                   **config['architecture'])
+    model.summary()
+
+    # --- Train the Model ---
+    print("\nStarting model training...")
+    callbacks = [
+        ThroughputLogger(len(train_idx)),
+        tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=config['patience'], restore_best_weights=True),
+    ]
+    history = model.fit(train_data, epochs=config['epochs'], validation_data=validation_data,
+                        callbacks=callbacks, verbose=1)
+    print("Model training complete.")
+
+    # --- Save the Trained Model and the Run Log ---
+    export_model(model, config)
+    if config['run_log_path']:
+        run_log = {
+            'config': config,
+            'learning_rate': learning_rate,
+            'train_windows': len(train_idx),
+            'val_windows': len(val_idx),
+            'history': {key: [_to_builtin(v) for v in values] for key, values in history.history.items()},
+        }
+        with open(config['run_log_path'], 'w') as f:
+            json.dump(run_log, f, indent=2)
+        print(f"Run log written to {config['run_log_path']}")
+    return model, history
+
+
+def parse_config(argv=None):
+    """DEFAULT_CONFIG, overridden by --config JSON, overridden by command-line flags."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', help="JSON file with any of the settings below.")
+    for key, default in DEFAULT_CONFIG.items():
+        flag = '--' + key.replace('_', '-')
+        if isinstance(default, dict):
+            continue
+        if isinstance(default, bool):
+            parser.add_argument(flag, dest=key, action=argparse.BooleanOptionalAction, default=None)
+        else:
+            value_type = type(default) if default is not None else str
+            parser.add_argument(flag, dest=key, type=value_type, default=None)
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_CONFIG)
+        if unknown:
+            parser.error(f"Unknown settings in {args.config}: {', '.join(sorted(unknown))}")
+        config.update(overrides)
+    config.update({key: value for key, value in vars(args).items() if key != 'config' and value is not None})
+    return config
+
 
-# --- 1. Define File Paths ---
-PROCESSED_DATA_PATH = 'data/processed/preprocessed_data.npz'
-MODEL_SAVE_PATH = 'models/multimodal_model.h5'
-
-# --- 2. Load the Preprocessed Data ---
-print(f"Loading preprocessed data from {PROCESSED_DATA_PATH}...")
-try:
-    data = np.load(PROCESSED_DATA_PATH, allow_pickle=True)
-    X_lstm = data['X_lstm']
-    X_mlp = data['X_mlp']
-    y = data['y']
-except FileNotFoundError:
-    print("Error: Preprocessed data not found.")
-    print("Please run 'src/data_processing.py' first to generate the data.")
-    exit()
-
-print("Data loaded successfully.")
-print(f"LSTM input shape: {X_lstm.shape}")
-print(f"MLP input shape: {X_mlp.shape}")
-print(f"Target shape: {y.shape}")
-
-
-# --- 3. Split the Data into Training and Validation Sets ---
-print("Splitting data into training and validation sets...")
-X_lstm_train, X_lstm_val, X_mlp_train, X_mlp_val, y_train, y_val = train_test_split(
-    X_lstm, X_mlp, y, test_size=0.2, random_state=42
-)
-
-# --- 4. Build the Model ---
-lstm_input_shape = (X_lstm_train.shape[1], X_lstm_train.shape[2])
-mlp_input_shape = (X_mlp_train.shape[1],)
-
-model = build_multimodal_model(lstm_input_shape, mlp_input_shape)
-model.summary()
-
-
-# --- 5. Train the Model ---
-print("\nStarting model training...")
-early_stopping = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
-
-history = model.fit(
-    [X_lstm_train, X_mlp_train],
-    y_train,
-    epochs=100,
-    batch_size=32,
-    validation_data=([X_lstm_val, X_mlp_val], y_val),
-    callbacks=[early_stopping],
-    verbose=1
-)
-
-print("Model training complete.")
-
-
-# --- 6. Save the Trained Model ---
-os.makedirs(os.path.dirname(MODEL_SAVE_PATH), exist_ok=True)
-model.save(MODEL_SAVE_PATH)
-print(f"\nTrained model saved successfully to {MODEL_SAVE_PATH}")
\ No newline at end of file
+if __name__ == '__main__':
+    train(parse_config())
@@ -0,0 +1,9 @@
+"""
+Test setup for the prediction service. Run from the ml/ directory:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import numpy as np
+
+from src.batching import MicroBatcher
+
+
+def _echo_batch(batch_sizes, delay=0.0):
+    def batch_fn(watch_batch, profile_batch):
+        batch_sizes.append(len(watch_batch))
+        time.sleep(delay)
+        return [float(row.sum()) for row in profile_batch]
+    return batch_fn
+
+
+def test_lone_request_skips_the_batching_window():
+    batch_sizes = []
+    batcher = MicroBatcher(_echo_batch(batch_sizes), max_wait_ms=500)
+    batcher.predict(np.zeros((14, 6)), np.ones(8))  # starts the worker thread
+
+    start = time.perf_counter()
+    assert batcher.predict(np.zeros((14, 6)), np.full(8, 2.0), timeout=5) == 16.0
+    assert time.perf_counter() - start < 0.25
+    assert batch_sizes == [1, 1]
+
+
+def test_concurrent_requests_share_a_forward_pass():
+    batch_sizes = []
+    batcher = MicroBatcher(_echo_batch(batch_sizes, delay=0.05), max_batch_size=32, max_wait_ms=20)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.predict(np.zeros((14, 6)), np.full(8, float(i)), timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: 8.0 * i for i in range(16)}
+    assert sum(batch_sizes) == 16
+    assert len(batch_sizes) < 16
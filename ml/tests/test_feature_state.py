@@ -0,0 +1,96 @@
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+
+from src.feature_plan import FEATURE_COLS, FeaturePlan, SEQUENCE_LENGTH, TIME_SERIES_FEATURES
+from src.feature_state import FeatureStateStore
+
+PROFILE = {'age': 45, 'gender': 'F', 'bmi': 27.5, 'has_hereditary_risk': 1, 'calorie_intake': 2200,
+           'fat_grams': 80, 'carbs_grams': 260, 'protein_grams': 70}
+
+
+@pytest.fixture
+def plan():
+    rng = np.random.default_rng(0)
+    scaler = MinMaxScaler().fit(pd.DataFrame(rng.random((50, len(FEATURE_COLS))) * 100, columns=FEATURE_COLS))
+    return FeaturePlan(scaler)
+
+
+def _day(i, **overrides):
+    record = {col: float(i + pos) for pos, col in enumerate(TIME_SERIES_FEATURES)}
+    record.update(date=f"2024-01-{i + 1:02d}", energy_balance=-100.0)
+    record.update(overrides)
+    return record
+
+
+def _snapshot(state):
+    return (state.raw.copy(), state.profile.copy(), state.head, state.count, state.last_date,
+            state.energy_balance, state.cumulative_balance)
+
+
+def _assert_same(before, after):
+    for old, new in zip(before, after):
+        assert np.array_equal(old, new) if isinstance(old, np.ndarray) else old == new
+
+
+def test_seeded_user_gets_a_full_window(plan):
+    store = FeatureStateStore()
+    history = [_day(i) for i in range(SEQUENCE_LENGTH - 1)]
+    window, profile, state = store.update('u1', _day(SEQUENCE_LENGTH - 1), plan, user_data=PROFILE, history=history)
+    assert window.shape == (SEQUENCE_LENGTH, len(TIME_SERIES_FEATURES))
+    assert profile is not None
+    assert state.cumulative_balance == pytest.approx(-100.0 * SEQUENCE_LENGTH)
+
+
+@pytest.mark.parametrize('request_kwargs', [
+    {'day': _day(20), 'history': [_day(18), _day(19, sleep_hours='n/a')]},
+    {'day': _day(20, energy_balance='lots')},
+    {'day': _day(20), 'user_data': {'bmi': 'heavy'}},
+    {'day': _day(20, fat_grams=None)},
+])
+def test_invalid_request_leaves_state_unchanged(plan, request_kwargs):
+    store = FeatureStateStore()
+    store.update('u1', _day(0), plan, user_data=PROFILE, history=[_day(i) for i in range(1, 15)])
+    before = _snapshot(store.get('u1'))
+
+    with pytest.raises((KeyError, ValueError, TypeError)):
+        store.update('u1', plan=plan, **request_kwargs)
+    _assert_same(before, _snapshot(store.get('u1')))
+
+
+def _saved_users(path):
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT user_id FROM user_state")}
+
+
+def test_failed_snapshot_keeps_users_pending(plan, tmp_path, monkeypatch):
+    path = str(tmp_path / 'state.db')
+    store = FeatureStateStore(snapshot_path=path, snapshot_interval=3600)
+    store.update('u1', _day(0), plan, user_data=PROFILE)
+
+    def broken_connect():
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(store, '_connect', broken_connect)
+    with pytest.raises(sqlite3.OperationalError):
+        store.snapshot()
+    monkeypatch.undo()
+
+    assert store.snapshot() == 1
+    assert _saved_users(path) == {'u1'}
+    assert FeatureStateStore(snapshot_path=path).get('u1').count == 1
+
+
+def test_snapshots_are_written_in_the_background(plan, tmp_path):
+    path = str(tmp_path / 'state.db')
+    store = FeatureStateStore(snapshot_path=path, snapshot_interval=0.01)
+    store.update('u1', _day(0), plan, user_data=PROFILE)
+
+    deadline = time.monotonic() + 5
+    while store._dirty and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _saved_users(path) == {'u1'}
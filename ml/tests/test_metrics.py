@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from src.app import app
+
+
+def test_metrics_export_prediction_cache_counters():
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    for series in ('ml_prediction_cache_hits_total', 'ml_prediction_cache_misses_total',
+                   'ml_prediction_cache_evictions_total', 'ml_prediction_cache_invalidations_total',
+                   'ml_prediction_cache_hit_rate', 'ml_model_ready'):
+        assert f"\n{series} " in text
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from src.model_builder import build_multimodal_model
+from src.numpy_engine import export_weights, NumpyMultimodalModel
+
+LSTM_SHAPE = (14, 6)
+MLP_SHAPE = (11,)
+
+
+def _inputs(num_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.random((num_samples,) + LSTM_SHAPE, dtype=np.float32),
+            rng.random((num_samples,) + MLP_SHAPE, dtype=np.float32)]
+
+
+def _export_and_load(keras_model, tmp_path):
+    path = tmp_path / 'model.npz'
+    export_weights(keras_model, str(path))
+    return NumpyMultimodalModel.load(str(path))
+
+
+@pytest.mark.parametrize('architecture', [
+    {},
+    {'lstm_units': 16, 'mlp_units': (24, 16, 8), 'head_units': 12},
+])
+def test_matches_keras_on_a_batch(tmp_path, architecture):
+    keras_model = build_multimodal_model(LSTM_SHAPE, MLP_SHAPE, **architecture)
+    numpy_model = _export_and_load(keras_model, tmp_path)
+    inputs = _inputs(64)
+
+    expected = keras_model.predict(inputs, verbose=0)
+    actual = numpy_model.predict_on_batch(inputs)
+    assert actual.shape == expected.shape
+    assert np.allclose(actual, expected, atol=1e-5)
+    # Chunked predict() must agree with the single-batch pass
+    assert np.allclose(numpy_model.predict(inputs, batch_size=10), actual, atol=1e-6)
+
+
+def test_matches_keras_after_h5_round_trip(tmp_path):
+    trained = build_multimodal_model(LSTM_SHAPE, MLP_SHAPE)
+    h5_path = tmp_path / 'multimodal_model.h5'
+    trained.save(str(h5_path))
+    keras_model = tf.keras.models.load_model(str(h5_path), compile=False)
+    numpy_model = _export_and_load(keras_model, tmp_path)
+    inputs = _inputs(32, seed=1)
+
+    assert np.allclose(numpy_model.predict_on_batch(inputs), trained.predict(inputs, verbose=0), atol=1e-5)
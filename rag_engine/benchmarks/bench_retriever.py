@@ -0,0 +1,81 @@
+"""
+Per-query latency of the indexed retriever versus the original full-table scan.
+
+Run from the rag_engine/ directory:
+
+    python -m benchmarks.bench_retriever --db /srv/data/Anuvaad_INDB_2024.11.xlsx --queries 500
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.nutrition_db import NUTRITION_DB_PATH, load_nutrition_db
+from src.retriever import NutritionIndex, retrieve_healthier_alternatives
+
+SAMPLE_MEALS = [
+    'Chicken Biryani', 'Paneer Butter Masala', 'Masala Dosa', 'Aloo Paratha', 'Chole Bhature',
+    'Rajma Chawal', 'Mutton Curry', 'Egg Fried Rice', 'Vegetable Pulao', 'Samosa',
+    'Dal Makhani', 'Butter Naan', 'Pav Bhaji', 'Gulab Jamun', 'Fish Curry',
+]
+
+
+def retrieve_scan(meal_name, original_meal_info, db, top_n=3):
+    """The original retriever, kept here as the baseline."""
+    if db.empty:
+        return pd.DataFrame()
+    primary_ingredient = meal_name.split()[0].lower()
+    max_calories = original_meal_info['calories'] * 0.8
+    max_fat = original_meal_info['fat'] * 0.8
+    min_protein = original_meal_info['protein'] * 0.9
+    return db[
+        (db['food_name'].str.lower().str.contains(primary_ingredient)) &
+        (db['energy_kcal'] <= max_calories) &
+        (db['fat_g'] <= max_fat) &
+        (db['protein_g'] >= min_protein)
+    ].head(top_n)
+
+
+def make_queries(num_queries, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        (SAMPLE_MEALS[i % len(SAMPLE_MEALS)], {
+            'calories': float(rng.uniform(250, 800)),
+            'fat': float(rng.uniform(10, 45)),
+            'protein': float(rng.uniform(3, 30)),
+        })
+        for i in range(num_queries)
+    ]
+
+
+def _latencies(fn, queries, db):
+    samples = []
+    for meal_name, meal_info in queries:
+        start = time.perf_counter()
+        fn(meal_name, meal_info, db)
+        samples.append(time.perf_counter() - start)
+    return np.array(samples) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=NUTRITION_DB_PATH)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    db = load_nutrition_db(args.db)
+    queries = make_queries(args.queries)
+
+    start = time.perf_counter()
+    index = NutritionIndex(db)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    scan = _latencies(retrieve_scan, queries, db)
+    indexed = _latencies(retrieve_healthier_alternatives, queries, index)
+
+    print(f"{len(db)} foods, {len(queries)} queries, index built in {build_ms:.1f} ms")
+    print(f"{'retriever':>10} {'p50 (us)':>10} {'p95 (us)':>10} {'mean (us)':>10}")
+    for name, samples in (('scan', scan), ('indexed', indexed)):
+        print(f"{name:>10} {np.percentile(samples, 50):>10.1f} {np.percentile(samples, 95):>10.1f} {samples.mean():>10.1f}")
+    print(f"Speedup (median): {np.median(scan) / np.median(indexed):.1f}x")
@@ -0,0 +1,192 @@
+"""
+Benchmark and load-test suite for the recommendation engine, against a local stub LLM.
+
+Run from the rag_engine/ directory:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --quick --llm-latency 0.2
+    python -m benchmarks.suite --db /srv/data/Anuvaad_INDB_2024.11.xlsx --output benchmarks/results/baseline.json
+
+Micro-benchmarks time retrieve_healthier_alternatives, its batch variant and prompt
+building. The HTTP benchmarks serve src/app.py in this process and drive /recommend and
+/recommend/batch with synthetic meal payloads at each concurrency level. The LLM is
+always the stub backend (RAG_LLM_BACKEND=stub) with --llm-latency seconds per call, so
+runs need no API key and measure the service rather than the model. Results are written
+as JSON; compare two runs with `python -m niyantrana_common.loadgen compare before.json after.json`.
+
+The response cache is disabled unless --with-cache is given, so every request reaches
+the (stub) model.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from benchmarks.bench_retriever import SAMPLE_MEALS
+from niyantrana_common.loadgen import time_call, serve_in_process, run_load, environment, default_results_path, write_results, max_rss_mb
+
+
+# --- 1. Synthetic Payloads ---
+def make_user_context(rng):
+    """A 'user_context' as sent with /recommend: the ML service's TG prediction and a calorie target."""
+    return {
+        'predicted_tg': round(float(rng.uniform(80, 320)), 2),
+        'calorie_target': int(rng.integers(14, 30)) * 100,
+    }
+
+
+def make_meal(rng, meal_names):
+    """An 'original_meal' in the /recommend schema."""
+    return {
+        'name': str(rng.choice(meal_names)),
+        'calories': round(float(rng.uniform(250, 800))),
+        'fat': round(float(rng.uniform(10, 45)), 1),
+        'protein': round(float(rng.uniform(3, 30)), 1),
+    }
+
+
+def meal_names_for(db, count=200, seed=0):
+    """Food names from the nutrition table, so queries hit real rows, plus the common dishes."""
+    names = list(SAMPLE_MEALS)
+    if not db.empty:
+        rng = np.random.default_rng(seed)
+        names += [str(name) for name in rng.choice(db['food_name'].to_numpy(), min(count, len(db)), replace=False)]
+    return names
+
+
+def make_recommendation_payloads(count, meal_names, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'user_context': make_user_context(rng), 'original_meal': make_meal(rng, meal_names)} for _ in range(count)]
+
+
+def make_batch_payloads(count, meal_names, users_per_batch=4, meals_per_user=4, seed=0):
+    """/recommend/batch bodies: a few users, each with a day's worth of meals."""
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for batch in range(count):
+        items = []
+        for user in range(users_per_batch):
+            user_context = make_user_context(rng)
+            items += [
+                {'user_id': f"user_{batch}_{user}", 'user_context': user_context, 'original_meal': make_meal(rng, meal_names)}
+                for _ in range(meals_per_user)
+            ]
+        payloads.append({'requests': items})
+    return payloads
+
+
+# --- 2. Micro-benchmarks ---
+def micro_benchmarks(payloads, repeats, batch_size):
+    from src.retriever import retrieve_healthier_alternatives, retrieve_healthier_alternatives_batch, NUTRITION_INDEX
+    from src.prompts import PromptBuilder
+
+    results = {}
+    cycle = iter(range(10**9))
+    meals = [payload['original_meal'] for payload in payloads]
+
+    def one_retrieval():
+        meal = meals[next(cycle) % len(meals)]
+        retrieve_healthier_alternatives(meal['name'], meal, NUTRITION_INDEX)
+
+    print("Timing retrieve_healthier_alternatives...")
+    results['retrieve_healthier_alternatives'] = time_call(one_retrieval, repeats)
+    print(f"Timing retrieve_healthier_alternatives_batch ({batch_size} meals)...")
+    results['retrieve_healthier_alternatives_batch'] = time_call(
+        lambda: retrieve_healthier_alternatives_batch(meals[:batch_size], NUTRITION_INDEX),
+        max(repeats // 4, 10), items=batch_size
+    )
+
+    builder = PromptBuilder(token_budget=int(os.environ.get('RAG_PROMPT_TOKEN_BUDGET', '1024')))
+    retrieved = [
+        (payload['user_context'], payload['original_meal'],
+         retrieve_healthier_alternatives(payload['original_meal']['name'], payload['original_meal'], NUTRITION_INDEX))
+        for payload in payloads[:200]
+    ]
+
+    def one_prompt():
+        builder.build(*retrieved[next(cycle) % len(retrieved)])
+
+    print("Timing PromptBuilder.build...")
+    results['prompt_build'] = time_call(one_prompt, repeats)
+    return results
+
+
+# --- 3. HTTP Load ---
+def http_benchmarks(payloads, batch_payloads, concurrency_levels, duration, max_requests):
+    from src.app import app
+
+    results = {}
+    with serve_in_process(app) as base_url:
+        for concurrency in concurrency_levels:
+            print(f"Load testing /recommend with {concurrency} concurrent clients...")
+            results[f"recommend_c{concurrency}"] = run_load(base_url, '/recommend', payloads, concurrency, duration, max_requests)
+        items = len(batch_payloads[0]['requests'])
+        print(f"Load testing /recommend/batch ({items} meals per request)...")
+        result = run_load(base_url, '/recommend/batch', batch_payloads, max(concurrency_levels), duration, max_requests)
+        result['meals_per_sec'] = result['throughput_rps'] * items
+        results[f"recommend_batch{items}"] = result
+    return results
+
+
+def print_summary(benchmarks):
+    print(f"\n{'benchmark':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per sec':>11} {'peak RSS MB':>12}")
+    for name, result in benchmarks.get('micro', {}).items():
+        print(f"{name:<40} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+              f"{result['items_per_sec']:>11.1f} {'':>12}")
+    for name, result in benchmarks.get('http', {}).items():
+        latency = result['latency']
+        if not latency['count']:
+            print(f"{name:<40} all {result['requests']} requests failed: {result['status_counts']}")
+            continue
+        print(f"{name:<40} {latency['p50_ms']:>9.3f} {latency['p95_ms']:>9.3f} {latency['p99_ms']:>9.3f} "
+              f"{result['throughput_rps']:>11.1f} {result['rss_peak_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="Results JSON (default: benchmarks/results/rag-<commit>-<time>.json).")
+    parser.add_argument('--db', help="Nutrition table to load (default: RAG_NUTRITION_DB_PATH or the bundled INDB file).")
+    parser.add_argument('--payloads', type=int, default=2000, help="Distinct synthetic payloads to cycle through.")
+    parser.add_argument('--repeats', type=int, default=1000, help="Timed calls per micro-benchmark.")
+    parser.add_argument('--batch-size', type=int, default=64, help="Meals per retrieve_healthier_alternatives_batch call.")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="Seconds per stub LLM call.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per HTTP load level.")
+    parser.add_argument('--max-requests', type=int, default=0, help="Stop a load level after this many requests (0 = no limit).")
+    parser.add_argument('--with-cache', action='store_true', help="Keep the response cache enabled.")
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--quick', action='store_true', help="Short smoke run: fewer repeats, 2 s per load level.")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeats, args.duration = 100, 2.0
+    # Must be set before src.app (and src.retriever, which loads the table) is imported
+    os.environ['RAG_LLM_BACKEND'] = 'stub'
+    os.environ['RAG_STUB_LATENCY'] = str(args.llm_latency)
+    if args.db:
+        os.environ['RAG_NUTRITION_DB_PATH'] = args.db
+    if not args.with_cache:
+        os.environ['RAG_RESPONSE_CACHE_SIZE'] = '0'
+
+    from src.retriever import NUTRITION_DB
+
+    meal_names = meal_names_for(NUTRITION_DB)
+    payloads = make_recommendation_payloads(args.payloads, meal_names)
+    batch_payloads = make_batch_payloads(max(args.payloads // 16, 1), meal_names)
+    benchmarks = {}
+    if not args.skip_micro:
+        benchmarks['micro'] = micro_benchmarks(payloads, args.repeats, args.batch_size)
+    if not args.skip_http:
+        benchmarks['http'] = http_benchmarks(payloads, batch_payloads, args.concurrency, args.duration, args.max_requests)
+
+    results = {
+        'service': 'rag',
+        'environment': environment(),
+        'config': {**vars(args), 'foods': len(NUTRITION_DB), 'response_cache': args.with_cache,
+                   'llm_max_concurrency': int(os.environ.get('RAG_LLM_MAX_CONCURRENCY', '16'))},
+        'benchmarks': benchmarks,
+        'max_rss_mb': max_rss_mb(),
+    }
+    print_summary(benchmarks)
+    write_results(results, args.output or default_results_path('rag'))
@@ -0,0 +1,21 @@
+# Gunicorn settings for the RAG recommendation engine.
+# Run from the rag_engine/ directory: gunicorn -c gunicorn.conf.py src.app:app
+import multiprocessing
+import os
+
+bind = os.environ.get('RAG_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('RAG_WORKERS', multiprocessing.cpu_count()))
+# Requests mostly wait on the LLM, which runs on each worker's asyncio loop; a waiting
+# request only holds one of these threads, and RAG_LLM_MAX_CONCURRENCY bounds the calls.
+threads = int(os.environ.get('RAG_THREADS', '32'))
+timeout = 60
+
+
+def on_starting(server):
+    # Build the nutrition DB cache once in the master, so the workers only memory-map it
+    # (and share its pages) instead of racing to parse the workbook.
+    from src.nutrition_db import build_cache, NUTRITION_DB_PATH
+    try:
+        build_cache()
+    except Exception as e:
+        server.log.warning(f"Could not build the nutrition DB cache from {NUTRITION_DB_PATH}: {e}")
@@ -1,37 +1,116 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
 import pandas as pd
-import google.generativeai as genai
+import json
 import os
+import time
 
 # --- Import custom modules from the same directory ---
-from src.retriever import retrieve_healthier_alternatives, NUTRITION_DB
-from src.prompts import create_recommendation_prompt
+from src.retriever import retrieve_healthier_alternatives, retrieve_healthier_alternatives_batch, NUTRITION_INDEX, NUTRITION_DB
+from src.prompts import PromptBuilder, parse_batch_recommendations
+from src.llm import create_llm_client, LLMService, LLMError, LLMTimeoutError
+from src.cache import ResponseCache
+from niyantrana_common.tracing import MetricsRegistry, Tracer, SamplingProfiler, PROMETHEUS_CONTENT_TYPE
 
 # --- 1. Load Environment Variables ---
 load_dotenv()
 
-# --- 2. Configure the Gemini API ---
+# --- 2. Configure the prompt builder and model client (RAG_LLM_BACKEND=stub runs without the Gemini API) ---
+# Alternatives are trimmed so each prompt stays within RAG_PROMPT_TOKEN_BUDGET (0 = no limit)
+prompt_builder = PromptBuilder(token_budget=int(os.environ.get('RAG_PROMPT_TOKEN_BUDGET', '1024')))
 try:
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables. Please check your .env file.")
-    genai.configure(api_key=api_key)
+    llm_client = create_llm_client(system_instruction=prompt_builder.system_instructions)
 except Exception as e:
     print(f"Error configuring Gemini API: {e}")
     exit()
 
-# --- 3. Initialize the Flask App and Generative Model ---
+# --- 3. Initialize the Flask App, LLM service and response cache ---
 app = Flask(__name__)
-# --- UPDATED MODEL NAME TO A MORE STABLE, RECENT VERSION ---
-model_name = 'gemini-1.5-flash-latest'
-model = genai.GenerativeModel(model_name)
-# -----------------------------------------------------------
+
+# Request and per-stage latency histograms on /metrics. RAG_TRACE_SAMPLE_RATE > 0 also
+# appends that fraction of requests, with the timing of each stage, to RAG_TRACE_PATH.
+metrics = MetricsRegistry()
+tracer = Tracer(
+    metrics, 'rag',
+    sample_rate=float(os.environ.get('RAG_TRACE_SAMPLE_RATE', '0')),
+    trace_path=os.environ.get('RAG_TRACE_PATH', 'traces.jsonl'),
+)
+tracer.instrument(app)
+prompt_tokens_total = metrics.counter('rag_prompt_tokens_total', "Estimated prompt tokens sent to the LLM, excluding system instructions.")
+alternatives_trimmed_total = metrics.counter('rag_alternatives_trimmed_total', "Alternatives dropped to fit the prompt token budget.")
+llm_errors_total = metrics.counter('rag_llm_errors_total', "Failed LLM calls after retries, by kind.", ('kind',))
+time_to_first_token = metrics.histogram('rag_llm_time_to_first_token_seconds', "Delay before the first streamed chunk of /recommend/stream.")
+
+# Opt-in sampling profiler: RAG_PROFILING=1 enables GET /debug/profile
+PROFILING = os.environ.get('RAG_PROFILING', '0') == '1'
+profiler = SamplingProfiler(interval=float(os.environ.get('RAG_PROFILER_INTERVAL', '0.005')))
+
+llm_service = LLMService(
+    llm_client,
+    max_concurrency=int(os.environ.get('RAG_LLM_MAX_CONCURRENCY', '16')),
+    timeout=float(os.environ.get('RAG_LLM_TIMEOUT', '30')),
+    max_retries=int(os.environ.get('RAG_LLM_MAX_RETRIES', '2')),
+    backoff=float(os.environ.get('RAG_LLM_BACKOFF', '0.5')),
+)
+response_cache = ResponseCache(
+    max_size=int(os.environ.get('RAG_RESPONSE_CACHE_SIZE', '2048')),
+    ttl=float(os.environ.get('RAG_RESPONSE_CACHE_TTL', '3600')),
+)
+# Seconds without a token before a keep-alive comment is sent on an SSE stream
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('RAG_SSE_KEEPALIVE', '10'))
+# /recommend/batch limits: items per request, meals per combined prompt, LLM calls in flight
+BATCH_MAX_ITEMS = int(os.environ.get('RAG_BATCH_MAX_ITEMS', '500'))
+BATCH_MEALS_PER_PROMPT = int(os.environ.get('RAG_BATCH_MEALS_PER_PROMPT', '8'))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('RAG_BATCH_MAX_CONCURRENCY', '8'))
 
 print("RAG Recommendation Engine initialized successfully.")
-print(f"Using Gemini model: {model_name}") # Added for debugging confirmation
+print(f"Using model: {getattr(llm_client, 'model_name', llm_client.name)}") # Added for debugging confirmation
+
+# --- 4. Define the API Endpoints ---
+def prepare_recommendation(json_data):
+    """
+    Retrieval and cache lookup shared by the recommendation endpoints.
+
+    Returns:
+        tuple: (user_context, original_meal, alternatives DataFrame, response cache key)
+    """
+    user_context = json_data['user_context']
+    original_meal = json_data['original_meal']
+    if not isinstance(user_context, dict) or not isinstance(original_meal, dict):
+        raise TypeError("'user_context' and 'original_meal' must be objects")
+
+    with tracer.stage('retrieval'):
+        alternatives = retrieve_healthier_alternatives(
+            original_meal['name'],
+            original_meal,
+            NUTRITION_INDEX
+        )
+    # Same meal, same alternatives and a similar user context: reuse the advice
+    cache_key = response_cache.make_key(user_context, original_meal, alternatives.get('food_name', []))
+    return user_context, original_meal, alternatives, cache_key
+
+
+def record_prompt(prompt):
+    prompt_tokens_total.inc(prompt.prompt_tokens)
+    alternatives_trimmed_total.inc(prompt.alternatives_trimmed)
+
+
+def record_llm_error(error):
+    llm_errors_total.labels('timeout' if isinstance(error, LLMTimeoutError) else 'unavailable').inc()
+
+
+def prompt_usage(prompt=None):
+    """Token accounting reported with each response; a cache hit sends no prompt."""
+    if prompt is None:
+        return {"cached": True, "prompt_tokens": 0, "system_tokens": 0, "alternatives_trimmed": 0}
+    return {
+        "cached": False,
+        "prompt_tokens": prompt.prompt_tokens,
+        "system_tokens": prompt.system_tokens,
+        "alternatives_trimmed": prompt.alternatives_trimmed,
+    }
+
 
-# --- 4. Define the API Endpoint ---
 @app.route('/recommend', methods=['POST'])
 def get_recommendation():
     """
@@ -42,27 +121,262 @@ def get_recommendation():
         return jsonify({"error": "No input data provided"}), 400
 
     try:
-        user_context = json_data['user_context']
-        original_meal = json_data['original_meal']
-        
-        alternatives = retrieve_healthier_alternatives(
-            original_meal['name'],
-            original_meal,
-            NUTRITION_DB
-        )
-        
-        prompt = create_recommendation_prompt(user_context, original_meal, alternatives)
-        
-        response = model.generate_content(prompt)
-        
-        return jsonify({"recommendation": response.text})
+        user_context, original_meal, alternatives, cache_key = prepare_recommendation(json_data)
+
+        prompt = None
+        with tracer.stage('cache_lookup'):
+            recommendation = response_cache.get(cache_key)
+        tracer.annotate(cache_hit=recommendation is not None)
+        if recommendation is None:
+            with tracer.stage('prompt_build'):
+                prompt = prompt_builder.build(user_context, original_meal, alternatives)
+            record_prompt(prompt)
+            tracer.annotate(prompt_tokens=prompt.prompt_tokens)
+            with tracer.stage('llm'):
+                recommendation = llm_service.generate(prompt.text)
+            response_cache.put(cache_key, recommendation)
+
+        return jsonify({"recommendation": recommendation, "usage": prompt_usage(prompt)})
 
     except (KeyError, TypeError) as e:
         return jsonify({"error": f"Invalid or missing key in JSON payload: {e}"}), 400
+    except LLMTimeoutError as e:
+        print(f"LLM timeout: {e}")
+        record_llm_error(e)
+        return jsonify({"error": "The recommendation service timed out. Please try again."}), 504
+    except LLMError as e:
+        print(f"LLM unavailable: {e}")
+        record_llm_error(e)
+        return jsonify({"error": "The recommendation service is temporarily unavailable."}), 503
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return jsonify({"error": "An internal server error occurred."}), 500
 
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/recommend/stream', methods=['POST'])
+def stream_recommendation():
+    """
+    Streaming variant of /recommend, sent as Server-Sent Events.
+
+    Emits a `token` event ({"text": ...}) per generated chunk, then `done` with the full
+    {"recommendation": ..., "usage": ...}, or `error` if generation fails after the stream started.
+    """
+    json_data = request.get_json(silent=True)
+    if not json_data:
+        return jsonify({"error": "No input data provided"}), 400
+    try:
+        user_context, original_meal, alternatives, cache_key = prepare_recommendation(json_data)
+        with tracer.stage('cache_lookup'):
+            cached = response_cache.get(cache_key)
+        # Built before the response starts, so a malformed user_context is still a 400
+        # rather than a stream cut off without an error event
+        prompt = None
+        if cached is None:
+            with tracer.stage('prompt_build'):
+                prompt = prompt_builder.build(user_context, original_meal, alternatives)
+    except (KeyError, TypeError) as e:
+        return jsonify({"error": f"Invalid or missing key in JSON payload: {e}"}), 400
+
+    # Runs after the response has started, so these stages feed the histograms but not
+    # the request's trace
+    def events():
+        if cached is not None:
+            yield _sse('token', {"text": cached})
+            yield _sse('done', {"recommendation": cached, "usage": prompt_usage()})
+            return
+
+        record_prompt(prompt)
+        stream_start = time.perf_counter()
+        chunks = llm_service.stream(prompt.text, idle_interval=SSE_KEEPALIVE_SECONDS)
+        parts = []
+        try:
+            with tracer.stage('llm_stream'):
+                for chunk in chunks:
+                    if chunk is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    if not parts:
+                        time_to_first_token.observe(time.perf_counter() - stream_start)
+                    parts.append(chunk)
+                    yield _sse('token', {"text": chunk})
+        except LLMTimeoutError as e:
+            print(f"LLM timeout: {e}")
+            record_llm_error(e)
+            yield _sse('error', {"error": "The recommendation service timed out. Please try again."})
+            return
+        except Exception as e:
+            print(f"An unexpected error occurred while streaming: {e}")
+            record_llm_error(e)
+            yield _sse('error', {"error": "The recommendation service is temporarily unavailable."})
+            return
+        finally:
+            # Also runs when the client disconnects (the server closes this generator),
+            # which cancels the model call
+            chunks.close()
+
+        recommendation = ''.join(parts)
+        response_cache.put(cache_key, recommendation)
+        yield _sse('done', {"recommendation": recommendation, "usage": prompt_usage(prompt)})
+
+    # Each event is written to the socket as it is yielded; X-Accel-Buffering stops
+    # nginx from holding the stream back
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    """
+    Recommendations for many logged meals at once, e.g. the end-of-day review.
+
+    Expects {"requests": [{"user_id": ..., "user_context": {...}, "original_meal": {...}}, ...]}
+    and returns {"recommendations": [...], "usage": {...}} in the same order. Each entry holds either
+    "recommendation" or "error", so a bad item or a failed LLM call only fails its own meals.
+    Uncached meals of the same user and context are answered by one combined prompt.
+    """
+    json_data = request.get_json()
+
+    if not json_data or not isinstance(json_data.get('requests'), list):
+        return jsonify({"error": "Expected a 'requests' list in JSON payload"}), 400
+    items = json_data['requests']
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} requests per batch"}), 400
+
+    results = [None] * len(items)
+    valid = []
+    for position, item in enumerate(items):
+        try:
+            meal = item['original_meal']
+            float(item['user_context']['predicted_tg']), float(item['user_context']['calorie_target'])
+            float(meal['calories']), float(meal['fat']), float(meal['protein'])
+            # Checked here rather than left to the shared retrieval pass, where one bad
+            # name would fail every meal in the batch
+            if not isinstance(meal['name'], str) or not meal['name'].strip():
+                raise ValueError(f"'name' must be a non-empty string, got {meal['name']!r}")
+            valid.append(position)
+        except (KeyError, TypeError, ValueError) as e:
+            results[position] = {"error": f"Invalid or missing key in request: {e}"}
+
+    try:
+        # One vectorized retrieval pass for every meal in the batch
+        with tracer.stage('retrieval'):
+            alternatives = retrieve_healthier_alternatives_batch(
+                [items[position]['original_meal'] for position in valid],
+                NUTRITION_INDEX
+            )
+
+        groups = {}
+        with tracer.stage('cache_lookup'):
+            for position, alternatives_df in zip(valid, alternatives):
+                item = items[position]
+                cache_key = response_cache.make_key(item['user_context'], item['original_meal'], alternatives_df.get('food_name', []))
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    results[position] = {"recommendation": cached}
+                    continue
+                group_key = (str(item.get('user_id')), json.dumps(item['user_context'], sort_keys=True))
+                groups.setdefault(group_key, []).append((position, alternatives_df, cache_key))
+
+        prompts, prompt_members = [], []
+        with tracer.stage('prompt_build'):
+            for members in groups.values():
+                for start in range(0, len(members), BATCH_MEALS_PER_PROMPT):
+                    chunk = members[start:start + BATCH_MEALS_PER_PROMPT]
+                    prompts.append(prompt_builder.build_batch(
+                        items[chunk[0][0]]['user_context'],
+                        [items[position]['original_meal'] for position, _, _ in chunk],
+                        [alternatives_df for _, alternatives_df, _ in chunk],
+                    ))
+                    prompt_members.append(chunk)
+        for prompt in prompts:
+            record_prompt(prompt)
+        tracer.annotate(items=len(items), prompts=len(prompts))
+
+        with tracer.stage('llm'):
+            responses = llm_service.generate_many([prompt.text for prompt in prompts], max_concurrency=BATCH_MAX_CONCURRENCY)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+    for chunk, response in zip(prompt_members, responses):
+        if isinstance(response, Exception):
+            print(f"Batch LLM call failed: {response}")
+            record_llm_error(response)
+            error = ("The recommendation service timed out." if isinstance(response, LLMTimeoutError)
+                     else "The recommendation service is temporarily unavailable.")
+            for position, _, _ in chunk:
+                results[position] = {"error": error}
+            continue
+        try:
+            answers = parse_batch_recommendations(response, len(chunk))
+        except Exception as e:
+            # An unreadable reply fails only the meals of its own prompt
+            print(f"Could not parse batch LLM response: {e}")
+            answers = [None] * len(chunk)
+        for (position, _, cache_key), answer in zip(chunk, answers):
+            if answer is None:
+                results[position] = {"error": "No recommendation was generated for this meal."}
+                continue
+            results[position] = {"recommendation": answer}
+            response_cache.put(cache_key, answer)
+
+    usage = {
+        "prompts": len(prompts),
+        "prompt_tokens": sum(prompt.prompt_tokens for prompt in prompts),
+        "system_tokens": prompt_builder.system_tokens * len(prompts),
+        "alternatives_trimmed": sum(prompt.alternatives_trimmed for prompt in prompts),
+    }
+    return jsonify({"recommendations": results, "usage": usage})
+
+
+def collect_service_metrics():
+    """Response cache counters and engine configuration, read at scrape time."""
+    stats = response_cache.stats()
+    yield 'rag_response_cache_hits_total', 'counter', "Response cache hits.", {}, stats['hits']
+    yield 'rag_response_cache_misses_total', 'counter', "Response cache misses.", {}, stats['misses']
+    yield 'rag_response_cache_evictions_total', 'counter', "Entries evicted to respect the size limit.", {}, stats['evictions']
+    yield 'rag_response_cache_hit_rate', 'gauge', "Hits over lookups since the worker started.", {}, stats['hit_rate']
+    yield 'rag_response_cache_entries', 'gauge', "Entries in the response cache.", {}, stats['size']
+    yield 'rag_nutrition_foods', 'gauge', "Rows in the nutrition table.", {}, len(NUTRITION_DB)
+    labels = {'backend': llm_client.name, 'model': getattr(llm_client, 'model_name', llm_client.name)}
+    yield 'rag_llm_info', 'gauge', "The configured LLM backend.", labels, 1
+
+
+metrics.add_collector(collect_service_metrics)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics for this worker process: request and per-stage latency histograms
+    (retrieval, prompt building, LLM), token usage, LLM errors and response cache counters.
+    """
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/debug/profile', methods=['GET'])
+def get_profile():
+    """
+    Samples this worker's stacks for ?seconds=N (default 10, at most 60) and returns them
+    in collapsed format for flamegraph.pl or speedscope. Requires RAG_PROFILING=1, and the
+    X-Admin-Token header when RAG_ADMIN_TOKEN is set.
+    """
+    if not PROFILING:
+        return jsonify({"error": "Profiling is disabled. Set RAG_PROFILING=1 to enable it."}), 404
+    admin_token = os.environ.get('RAG_ADMIN_TOKEN')
+    if admin_token and request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        seconds = min(float(request.args.get('seconds', '10')), 60.0)
+        return Response(profiler.profile(seconds), mimetype='text/plain')
+    except ValueError:
+        return jsonify({"error": "'seconds' must be a number"}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
 # --- 5. Run the Flask App ---
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5001, debug=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Bucket widths for the user context: requests whose context falls in the same buckets
+# get the same advice, so they can share a cached response
+TG_BUCKET = 25            # mg/dL
+CALORIE_BUCKET = 100      # kcal
+MEAL_NUTRIENT_BUCKET = 5  # kcal / g
+
+
+def _bucket(value, width):
+    try:
+        return int(float(value) // width)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with a time-to-live for LLM recommendations.
+
+    Keys are semantic rather than textual: the meal (name and bucketed nutrients), the
+    names of the retrieved alternatives and the bucketed user context, so requests that
+    would produce the same prompt up to small numeric differences share one response.
+
+    Args:
+        max_size (int): Maximum number of entries; 0 disables the cache.
+        ttl (float): Seconds an entry stays valid; 0 means no expiry.
+    """
+
+    def __init__(self, max_size=2048, ttl=3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(user_context, original_meal, alternative_names, kind='recommendation'):
+        """
+        Args:
+            user_context (dict): 'predicted_tg' and 'calorie_target'.
+            original_meal (dict): 'name', 'calories', 'fat' (and optionally 'protein').
+            alternative_names (list): Food names of the retrieved alternatives, in order.
+            kind (str): Separates response formats that must not be mixed up.
+        """
+        parts = [
+            kind,
+            str(original_meal.get('name', '')).strip().lower(),
+            _bucket(original_meal.get('calories'), MEAL_NUTRIENT_BUCKET),
+            _bucket(original_meal.get('fat'), MEAL_NUTRIENT_BUCKET),
+            _bucket(original_meal.get('protein'), MEAL_NUTRIENT_BUCKET),
+            list(alternative_names),
+            _bucket(user_context.get('predicted_tg'), TG_BUCKET),
+            _bucket(user_context.get('calorie_target'), CALORIE_BUCKET),
+        ]
+        return hashlib.blake2b(json.dumps(parts).encode(), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (not self.ttl or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
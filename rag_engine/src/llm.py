@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import threading
+
+
+class LLMError(RuntimeError):
+    """Raised when the model can't produce a response, after retries."""
+
+
+class LLMTimeoutError(LLMError):
+    """Raised when every attempt at a call timed out."""
+
+
+# --- 1. Model clients ---
+class LLMClient:
+    """
+    Interface for the text generation backends used by the engine.
+
+    Implementations are used from the LLMService event loop only, so they may hold
+    loop-bound resources such as async gRPC channels. Static instructions are given once
+    as `system_instruction` rather than repeated in every prompt.
+    """
+
+    name = 'base'
+
+    async def generate(self, prompt):
+        """Returns the full response text for `prompt`."""
+        raise NotImplementedError
+
+    async def stream(self, prompt):
+        """Yields the response text in chunks as it is generated. Defaults to a single chunk."""
+        yield await self.generate(prompt)
+
+    def is_retryable(self, error):
+        """Whether a failed call is worth retrying (rate limits, transient server errors)."""
+        return False
+
+
+class GeminiClient(LLMClient):
+    """Google Gemini through google-generativeai's async API."""
+
+    name = 'gemini'
+
+    def __init__(self, model_name, api_key, system_instruction=None):
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        self._retryable = (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+        )
+
+    async def generate(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt):
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def is_retryable(self, error):
+        return isinstance(error, self._retryable)
+
+
+class StubLLMClient(LLMClient):
+    """
+    Local stand-in for benchmarks and tests: no network, configurable latency.
+
+    The reply is derived from the prompt (it recommends the first listed alternative),
+    so it is deterministic and cache behaviour can be checked end to end. Multi-meal
+    prompts get the JSON answer format they ask for.
+    """
+
+    name = 'stub'
+    _ALTERNATIVE_RE = re.compile(r"^\s*- (.+?): \d+ kcal, \d+g fat", re.MULTILINE)
+    _MEAL_RE = re.compile(r"^\s*\*\*Meal \d+:\*\*", re.MULTILINE)
+
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _suggest(self, text):
+        match = self._ALTERNATIVE_RE.search(text)
+        suggestion = match.group(1) if match else "a lighter home-cooked option"
+        digest = hashlib.sha1(text.encode()).hexdigest()[:8]
+        return f"Nice job logging your meal! Next time, try {suggestion} instead. [stub {digest}]"
+
+    def _reply(self, prompt):
+        sections = self._MEAL_RE.split(prompt)[1:]
+        if not sections:
+            return self._suggest(prompt)
+        answers = [{"meal": number, "recommendation": self._suggest(section)}
+                   for number, section in enumerate(sections, start=1)]
+        return json.dumps({"recommendations": answers})
+
+    async def generate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        if self._random.random() < self.failure_rate:
+            raise ConnectionError("Stub LLM failure")
+        return self._reply(prompt)
+
+    async def stream(self, prompt):
+        # Same total latency as generate(), spread over word-sized chunks
+        self.calls += 1
+        if self._random.random() < self.failure_rate:
+            raise ConnectionError("Stub LLM failure")
+        words = self._reply(prompt).split(' ')
+        delay = (self.latency + self._random.uniform(0, self.jitter)) / len(words)
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay)
+            yield word if i == 0 else ' ' + word
+
+    def is_retryable(self, error):
+        return isinstance(error, ConnectionError)
+
+
+def create_llm_client(backend=None, system_instruction=None):
+    """Builds the client selected by RAG_LLM_BACKEND ('gemini' or 'stub')."""
+    backend = backend or os.environ.get('RAG_LLM_BACKEND', 'gemini')
+    if backend == 'stub':
+        return StubLLMClient(latency=float(os.environ.get('RAG_STUB_LATENCY', '0.05')))
+    if backend == 'gemini':
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables. Please check your .env file.")
+        return GeminiClient(os.environ.get('RAG_LLM_MODEL', 'gemini-1.5-flash-latest'), api_key, system_instruction)
+    raise ValueError(f"Unknown RAG_LLM_BACKEND '{backend}'")
+
+
+# --- 2. Pooled async execution ---
+class LLMService:
+    """
+    Runs model calls on one background asyncio loop shared by all request threads.
+
+    Flask handlers call generate() from their own threads; the calls are multiplexed on
+    the loop, so a worker waiting on the LLM only holds a cheap thread, not a process.
+    At most `max_concurrency` calls are in flight per process; each attempt is bounded
+    by `timeout` and retryable failures are retried with jittered exponential backoff.
+
+    Args:
+        client (LLMClient): The model backend.
+        max_concurrency (int): Calls in flight at once; the rest wait for a slot.
+        timeout (float): Seconds allowed per attempt.
+        max_retries (int): Extra attempts after a timeout or retryable error.
+        backoff (float): Base delay in seconds, doubled on each retry.
+    """
+
+    def __init__(self, client, max_concurrency=16, timeout=30.0, max_retries=2, backoff=0.5):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._loop = None
+        self._semaphore = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        # Started lazily and per process: a loop thread doesn't survive a fork
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._start_lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='llm-loop', daemon=True).start()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._pid = os.getpid()
+                self._loop = loop
+        return self._loop
+
+    async def _call_with_retries(self, call, timeout=None, can_retry=None):
+        """
+        Runs `call()` (a coroutine factory) under the concurrency limit, with retries.
+
+        Each attempt is bounded by `timeout` (defaults to self.timeout; pass 0 when the call
+        enforces its own timeouts). `can_retry()` can veto a retry, e.g. once output was sent.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        can_retry = can_retry or (lambda: True)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    return await (asyncio.wait_for(call(), timeout) if timeout else call())
+            except asyncio.TimeoutError:
+                if attempt == self.max_retries or not can_retry():
+                    raise LLMTimeoutError(f"LLM call timed out after {attempt + 1} attempts of {self.timeout:g}s")
+            except Exception as e:
+                if not self.client.is_retryable(e):
+                    raise
+                if attempt == self.max_retries or not can_retry():
+                    raise LLMError(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+            await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    async def agenerate(self, prompt):
+        """Coroutine version of generate(); must run on the service loop."""
+        return await self._call_with_retries(lambda: self.client.generate(prompt))
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the service loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def generate(self, prompt):
+        """Blocking call for request threads: returns the response text."""
+        return self.submit(self.agenerate(prompt)).result()
+
+    async def _generate_many(self, prompts, max_concurrency):
+        batch_slots = asyncio.Semaphore(max_concurrency or max(len(prompts), 1))
+
+        async def generate_one(prompt):
+            async with batch_slots:
+                return await self.agenerate(prompt)
+
+        return await asyncio.gather(*(generate_one(prompt) for prompt in prompts), return_exceptions=True)
+
+    def generate_many(self, prompts, max_concurrency=None):
+        """
+        Runs many prompts concurrently and returns, in order, each response text or the
+        exception its call raised. `max_concurrency` caps how many of the service's slots
+        this batch may hold at once, so a large batch doesn't starve interactive requests.
+        """
+        return self.submit(self._generate_many(list(prompts), max_concurrency)).result()
+
+    async def _stream_into(self, prompt, chunks):
+        started = False
+
+        async def consume():
+            nonlocal started
+            parts = self.client.stream(prompt)
+            try:
+                while True:
+                    # The timeout applies to each chunk, so long answers aren't cut off
+                    try:
+                        chunk = await asyncio.wait_for(parts.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    started = True
+                    chunks.put(('chunk', chunk))
+            finally:
+                await parts.aclose()
+
+        try:
+            # Only retried until the first chunk: after that the client has seen output
+            await self._call_with_retries(consume, timeout=0, can_retry=lambda: not started)
+        except Exception as e:
+            chunks.put(('error', e))
+        else:
+            chunks.put(('done', None))
+
+    def stream(self, prompt, idle_interval=None):
+        """
+        Blocking generator for request threads: yields response chunks as they arrive.
+
+        Yields None when nothing arrived for `idle_interval` seconds, so a server can send
+        keep-alives (which is also how it notices a client that went away). Closing the
+        generator cancels the model call and frees its concurrency slot.
+        """
+        chunks = queue.Queue()
+        future = self.submit(self._stream_into(prompt, chunks))
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=idle_interval)
+                except queue.Empty:
+                    yield None
+                    continue
+                if kind == 'chunk':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
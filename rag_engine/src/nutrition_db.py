@@ -0,0 +1,197 @@
+"""
+Columnar, memory-mapped cache of the INDB nutrition workbook.
+
+Parsing the xlsx with openpyxl takes about a second and used to be repeated by every
+worker at import time. The workbook is now converted once into a cache directory:
+
+    <cache_dir>/<workbook stem>-<sha256[:16]>/
+        meta.json       source hash, row count and column layout
+        numeric.npy     all numeric columns as one (n_columns, n_rows) float64 array
+        <column>.npy    one fixed-width unicode array per text column
+
+Loading maps numeric.npy read-only and uses it as the DataFrame's storage without a copy,
+so every worker process shares those page-cache pages. Text columns are read from their
+files into Python strings, so each worker holds its own copy of them. The cache is keyed
+on a hash of the workbook's content, so editing the workbook rebuilds it.
+
+Run from the rag_engine/ directory to build the cache ahead of time:
+
+    python -m src.nutrition_db --source /srv/data/Anuvaad_INDB_2024.11.xlsx
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+RAG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE_PATH = os.path.join(os.path.dirname(RAG_ROOT), 'ml', 'data', 'raw', 'Anuvaad_INDB_2024.11.xlsx')
+DEFAULT_CACHE_DIR = os.path.join(RAG_ROOT, 'data', 'cache')
+
+NUTRITION_DB_PATH = os.path.abspath(os.environ.get('RAG_NUTRITION_DB_PATH', DEFAULT_SOURCE_PATH))
+NUTRITION_CACHE_DIR = os.path.abspath(os.environ.get('RAG_NUTRITION_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+CACHE_FORMAT_VERSION = 1
+# Rows without these can't be compared with a meal, so they are dropped when building
+REQUIRED_COLUMNS = ['energy_kcal', 'fat_g', 'protein_g']
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(source_path, source_hash, cache_dir=None):
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir or NUTRITION_CACHE_DIR, f"{stem}-{source_hash[:16]}")
+
+
+def read_source(source_path):
+    """Reads and cleans the workbook (or a CSV export of it)."""
+    if source_path.lower().endswith('.csv'):
+        db = pd.read_csv(source_path)
+    else:
+        db = pd.read_excel(source_path)
+    return db.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+
+
+def build_cache(source_path=None, cache_dir=None, force=False):
+    """
+    Converts the workbook into the columnar cache, if it isn't cached already.
+
+    The cache is written to a temporary directory and renamed into place, so concurrent
+    builders (e.g. several workers starting at once) never see a partial cache.
+
+    Returns:
+        str: The cache directory for the workbook's current content.
+    """
+    source_path = os.path.abspath(source_path or NUTRITION_DB_PATH)
+    source_hash = file_sha256(source_path)
+    target = cache_path_for(source_path, source_hash, cache_dir)
+    if os.path.exists(os.path.join(target, 'meta.json')) and not force:
+        return target
+
+    db = read_source(source_path)
+    numeric_columns = [col for col in db.columns if pd.api.types.is_numeric_dtype(db[col])]
+    string_columns = [col for col in db.columns if col not in numeric_columns]
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.building-', dir=os.path.dirname(target))
+    try:
+        numeric = np.ascontiguousarray(db[numeric_columns].to_numpy(dtype=np.float64).T)
+        np.save(os.path.join(staging, 'numeric.npy'), numeric)
+        for col in string_columns:
+            # Missing text is stored as '' and restored as NaN on load
+            values = db[col].astype(object).where(db[col].notna(), '').astype(str).to_numpy()
+            np.save(os.path.join(staging, f"{col}.npy"), values.astype(str))
+        meta = {
+            'format_version': CACHE_FORMAT_VERSION,
+            'source_path': source_path,
+            'source_sha256': source_hash,
+            'rows': len(db),
+            'columns': list(db.columns),
+            'numeric_columns': numeric_columns,
+            'string_columns': string_columns,
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if force and os.path.exists(target):
+            shutil.rmtree(target)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another process finished the same build first
+            if not os.path.exists(os.path.join(target, 'meta.json')):
+                raise
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+    print(f"Built nutrition DB cache with {len(db)} rows at {target}")
+    return target
+
+
+def load_cache(cache_path):
+    """
+    Maps a cache directory into a DataFrame.
+
+    The numeric columns are read-only views of numeric.npy, shared between processes.
+    The text columns are built as Python strings in each process, not shared.
+    """
+    with open(os.path.join(cache_path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != CACHE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported nutrition cache format in {cache_path}")
+
+    # A plain ndarray view of the map: pandas operations on the np.memmap subclass are slower
+    numeric = np.load(os.path.join(cache_path, 'numeric.npy'), mmap_mode='r').view(np.ndarray)
+    # numeric.T is the (rows, columns) view pandas stores as a single block without copying
+    db = pd.DataFrame(numeric.T, columns=meta['numeric_columns'], copy=False)
+    for col in meta['string_columns']:
+        values = np.load(os.path.join(cache_path, f"{col}.npy"), mmap_mode='r')
+        # An object array works on any pandas; each version then stores it as read_excel would
+        strings = np.where(values == '', None, values.astype(object))
+        db.insert(meta['columns'].index(col), col, pd.array(strings, dtype=object))
+    db.attrs['source_sha256'] = meta['source_sha256']
+    db.attrs['columnar_cache'] = cache_path
+    return db
+
+
+def _latest_cache(source_path, cache_dir=None):
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    cache_dir = cache_dir or NUTRITION_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return None
+    candidates = [
+        os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+        if name.startswith(f"{stem}-") and os.path.exists(os.path.join(cache_dir, name, 'meta.json'))
+    ]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+
+def load_nutrition_db(source_path=None, cache_dir=None):
+    """
+    Returns the nutrition database, building the cache first if the workbook changed.
+
+    If the workbook isn't present (e.g. a deployment that ships only the cache), the most
+    recently built cache for it is used. Returns an empty DataFrame when neither can be read.
+    """
+    source_path = os.path.abspath(source_path or NUTRITION_DB_PATH)
+    try:
+        if os.path.exists(source_path):
+            return load_cache(build_cache(source_path, cache_dir))
+        cache_path = _latest_cache(source_path, cache_dir)
+        if cache_path is None:
+            print(f"Could not find the nutrition database file at {source_path}.")
+            return pd.DataFrame()
+        print(f"Nutrition database file {source_path} not found; using the cache at {cache_path}.")
+        return load_cache(cache_path)
+    except Exception as e:
+        print(f"Could not load the nutrition database from {source_path}: {e}")
+        return pd.DataFrame()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=NUTRITION_DB_PATH, help="Path to the INDB workbook (or its CSV export).")
+    parser.add_argument('--cache-dir', default=NUTRITION_CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help="Rebuild even if a cache for this content exists.")
+    args = parser.parse_args()
+
+    cache_path = build_cache(args.source, args.cache_dir, force=args.force)
+
+    start = time.perf_counter()
+    read_source(os.path.abspath(args.source))
+    parse_time = time.perf_counter() - start
+    start = time.perf_counter()
+    db = load_nutrition_db(args.source, args.cache_dir)
+    load_time = time.perf_counter() - start
+    print(f"{len(db)} rows, {len(db.columns)} columns at {cache_path}")
+    print(f"Parsing the source: {parse_time * 1000:.1f} ms; loading through the cache: {load_time * 1000:.1f} ms")
@@ -1,34 +1,192 @@
-def create_recommendation_prompt(user_context, original_meal, alternatives_df):
+import json
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# --- 1. Static instructions ---
+# Identical for every request, so they are sent once as the model's system instruction
+# instead of being repeated in every prompt.
+SYSTEM_INSTRUCTIONS = (
+    "You are a friendly, expert nutritionist for a user in India whose goal is to reduce their risk "
+    "of fatty liver disease.\n"
+    "Write short, encouraging, and conversational messages. Acknowledge the meal the user ate, then "
+    "suggest a healthier but similar alternative for their next meal. Use one of the options listed "
+    "from our database as the primary suggestion and briefly explain *why* it's a better choice. "
+    "Do not invent new dishes."
+)
+
+# --- 2. Per-request templates, compiled once ---
+_CONTEXT_TEMPLATE = (
+    "**User's Health Context:**\n"
+    "- Predicted Triglycerides: {predicted_tg} mg/dL (High is > 150)\n"
+    "- Daily Calorie Target: {calorie_target} kcal\n\n"
+)
+_SINGLE_TEMPLATE = (
+    "{context}"
+    "**User's Recent Meal:**\n"
+    "- They just ate: {name} ({calories} kcal, {fat}g fat)\n\n"
+    "**Healthier Alternatives from our Database:**\n"
+    "{alternatives}"
+)
+_BATCH_TEMPLATE = (
+    "{context}"
+    "The user logged the {count} meals below today. Write one message per meal.\n"
+    "Respond with JSON only, exactly in this format, with one entry per meal in the same order:\n"
+    '{{"recommendations": [{{"meal": 1, "recommendation": "..."}}]}}\n\n'
+    "{sections}"
+)
+_MEAL_SECTION_TEMPLATE = (
+    "**Meal {number}:** {name} ({calories} kcal, {fat}g fat)\n"
+    "Healthier Alternatives from our Database:\n"
+    "{alternatives}\n"
+)
+_ALTERNATIVE_TEMPLATE = "- {}: {} kcal, {}g fat, {}g protein\n"
+NO_ALTERNATIVES_TEXT = "No direct alternatives found in our database.\n"
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Approximate token count: words and punctuation marks, or a quarter of the characters
+    if that is larger (long words split into several tokens). Close enough for budgeting
+    and cost tracking without a round trip to the tokenizer API.
+    """
+    return max(len(_TOKEN_RE.findall(text)), len(text) // 4)
+
+
+def alternative_lines(alternatives_df):
+    """Formats the retrieved alternatives as prompt lines, straight from the column arrays."""
+    if alternatives_df.empty:
+        return []
+    columns = (
+        alternatives_df['food_name'].to_numpy(),
+        alternatives_df['energy_kcal'].to_numpy().astype(np.int64).tolist(),
+        alternatives_df['fat_g'].to_numpy().astype(np.int64).tolist(),
+        alternatives_df['protein_g'].to_numpy().astype(np.int64).tolist(),
+    )
+    return [_ALTERNATIVE_TEMPLATE.format(*values) for values in zip(*columns)]
+
+
+def format_alternatives(alternatives_df):
+    """Lists the retrieved alternatives as prompt lines."""
+    return ''.join(alternative_lines(alternatives_df)) or NO_ALTERNATIVES_TEXT
+
+
+# --- 3. Prompt builder ---
+Prompt = namedtuple('Prompt', ['text', 'prompt_tokens', 'system_tokens', 'alternatives_used', 'alternatives_trimmed'])
+
+
+class PromptBuilder:
+    """
+    Builds recommendation prompts from precompiled templates under a token budget.
+
+    Args:
+        token_budget (int): Maximum estimated tokens of the per-request prompt (the system
+            instructions are counted separately). Lowest-ranked alternatives are dropped
+            until the prompt fits, keeping at least one per meal; 0 disables trimming.
+        system_instructions (str): Instructions configured once on the model.
     """
-    Builds the final prompt for the Gemini API.
-    """
-    # Convert alternatives dataframe to a simple string format
-    alternatives_text = ""
-    if not alternatives_df.empty:
-        for index, row in alternatives_df.iterrows():
-            alternatives_text += (
-                f"- {row['food_name']}: "
-                f"{int(row['energy_kcal'])} kcal, "
-                f"{int(row['fat_g'])}g fat, "
-                f"{int(row['protein_g'])}g protein\n"
+
+    def __init__(self, token_budget=0, system_instructions=SYSTEM_INSTRUCTIONS):
+        self.token_budget = token_budget
+        self.system_instructions = system_instructions
+        self.system_tokens = estimate_tokens(system_instructions)
+
+    def _fit(self, fixed_tokens, meal_lines):
+        """Returns how many alternative lines to keep per meal so the prompt fits the budget."""
+        keep = [len(lines) for lines in meal_lines]
+        if not self.token_budget:
+            return keep
+        line_tokens = [[estimate_tokens(line) for line in lines] for lines in meal_lines]
+        total = fixed_tokens + sum(sum(tokens) for tokens in line_tokens)
+        while total > self.token_budget:
+            # Trim the meal with the most alternatives left, from its lowest-ranked end
+            meal = max(range(len(keep)), key=lambda i: keep[i])
+            if keep[meal] <= 1:
+                break
+            keep[meal] -= 1
+            total -= line_tokens[meal][keep[meal]]
+        return keep
+
+    def _prompt(self, text, meal_lines, keep):
+        used = sum(keep)
+        return Prompt(text, estimate_tokens(text), self.system_tokens, used, sum(map(len, meal_lines)) - used)
+
+    def build(self, user_context, original_meal, alternatives_df):
+        """Prompt for one meal. Returns a Prompt with the text and its token accounting."""
+        context = _CONTEXT_TEMPLATE.format(**user_context)
+        fields = dict(context=context, name=original_meal['name'], calories=original_meal['calories'],
+                      fat=original_meal['fat'])
+        lines = alternative_lines(alternatives_df)
+        keep = self._fit(estimate_tokens(_SINGLE_TEMPLATE.format(alternatives='', **fields)), [lines])
+        text = _SINGLE_TEMPLATE.format(alternatives=''.join(lines[:keep[0]]) or NO_ALTERNATIVES_TEXT, **fields)
+        return self._prompt(text, [lines], keep)
+
+    def build_batch(self, user_context, meals, alternatives_dfs):
+        """One prompt covering several meals of the same user, answered as JSON."""
+        context = _CONTEXT_TEMPLATE.format(**user_context)
+        meal_lines = [alternative_lines(df) for df in alternatives_dfs]
+
+        def render(keep):
+            sections = ''.join(
+                _MEAL_SECTION_TEMPLATE.format(
+                    number=number, name=meal['name'], calories=meal['calories'], fat=meal['fat'],
+                    alternatives=''.join(lines[:count]) or NO_ALTERNATIVES_TEXT,
+                )
+                for number, (meal, lines, count) in enumerate(zip(meals, meal_lines, keep), start=1)
             )
-    else:
-        alternatives_text = "No direct alternatives found in our database."
+            return _BATCH_TEMPLATE.format(context=context, count=len(meals), sections=sections)
 
-    prompt = f"""
-    You are a friendly, expert nutritionist for a user in India whose goal is to reduce their risk of fatty liver disease.
+        keep = self._fit(estimate_tokens(render([0] * len(meals))), meal_lines)
+        return self._prompt(render(keep), meal_lines, keep)
 
-    **User's Health Context:**
-    - Predicted Triglycerides: {user_context['predicted_tg']} mg/dL (High is > 150)
-    - Daily Calorie Target: {user_context['calorie_target']} kcal
 
-    **User's Recent Meal:**
-    - They just ate: {original_meal['name']} ({original_meal['calories']} kcal, {original_meal['fat']}g fat)
+_DEFAULT_BUILDER = PromptBuilder()
 
-    **Task:**
-    Write a short, encouraging, and conversational message for the user. Acknowledge their recent meal. Then, suggest a healthier but similar alternative for their next meal. Use one of the options from our database as the primary suggestion and briefly explain *why* it's a better choice. Do not invent new dishes.
 
-    **Healthier Alternatives from our Database:**
-    {alternatives_text}
+def create_recommendation_prompt(user_context, original_meal, alternatives_df):
+    """
+    Builds the final prompt for the Gemini API (to be sent with SYSTEM_INSTRUCTIONS).
     """
-    return prompt
\ No newline at end of file
+    return _DEFAULT_BUILDER.build(user_context, original_meal, alternatives_df).text
+
+
+def create_batch_recommendation_prompt(user_context, meals, alternatives_dfs):
+    """
+    One prompt covering several meals of the same user, answered as JSON.
+
+    Args:
+        user_context (dict): The user's 'predicted_tg' and 'calorie_target'.
+        meals (list): Meal dicts with 'name', 'calories' and 'fat'.
+        alternatives_dfs (list): Retrieved alternatives for each meal, in the same order.
+    """
+    return _DEFAULT_BUILDER.build_batch(user_context, meals, alternatives_dfs).text
+
+
+def parse_batch_recommendations(response_text, num_meals):
+    """
+    Extracts the per-meal answers from a response to create_batch_recommendation_prompt().
+
+    Returns:
+        list: `num_meals` recommendation strings, with None for meals the model skipped.
+    """
+    # Models often wrap JSON in a markdown code fence
+    text = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", response_text.strip())
+    try:
+        entries = json.loads(text)['recommendations']
+    except (ValueError, KeyError, TypeError):
+        return [None] * num_meals
+    # Valid JSON of the wrong shape, e.g. {"recommendations": null}, is a skipped answer too
+    if not isinstance(entries, list):
+        return [None] * num_meals
+
+    answers = [None] * num_meals
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get('recommendation'), str):
+            continue
+        number = entry.get('meal', position + 1)
+        if isinstance(number, int) and not isinstance(number, bool) and 1 <= number <= num_meals:
+            answers[number - 1] = entry['recommendation']
+    return answers
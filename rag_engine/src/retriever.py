@@ -1,37 +1,197 @@
+import re
+
+import numpy as np
 import pandas as pd
 
-# Load your nutrition database
-try:
-    NUTRITION_DB = pd.read_excel("../ml/data/raw/Anuvaad_INDB_2024.11.xlsx")
-    # Basic cleaning
-    NUTRITION_DB.dropna(subset=['energy_kcal', 'fat_g', 'protein_g'], inplace=True)
-except FileNotFoundError:
-    print("Could not find the nutrition database file.")
-    NUTRITION_DB = pd.DataFrame()
+from src.nutrition_db import load_nutrition_db
+
+# Load your nutrition database: memory-mapped from the columnar cache, which is rebuilt
+# from the workbook at RAG_NUTRITION_DB_PATH whenever its content changes
+NUTRITION_DB = load_nutrition_db()
+
+# Words that say nothing about what a dish is made of
+STOPWORDS = {'with', 'and', 'of', 'in', 'the', 'a', 'ka', 'ki', 'ke', 'style', 'homemade'}
+_TOKEN_RE = re.compile(r"[a-z]+")
+
+# How much more "healthier" a candidate has to be: relative to the original meal
+CALORIE_FACTOR = 0.8   # 20% fewer calories
+FAT_FACTOR = 0.8       # 20% less fat
+PROTEIN_FACTOR = 0.9   # Similar protein
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def _normalize(name):
+    return ' '.join(name.lower().split())
+
+
+class NutritionIndex:
+    """
+    Search structures over the nutrition database, built once at startup.
+
+    - `names`: food names lowercased once, for the substring fallback.
+    - `postings`: inverted index from name token to the sorted row positions containing it.
+    - `idf`: inverse document frequency per token, so a shared dish word ("paneer") counts
+      for more than a generic one ("masala", "curry") when ranking candidates.
+    - `energy`, `fat`, `protein`: contiguous float arrays, so range filters and distances
+      over a candidate set are plain NumPy indexing.
+    - `scale`: per-nutrient standard deviation, used to make the distance unit-free.
+    """
+
+    def __init__(self, db):
+        # copy() consolidates the per-column blocks read_excel produces, which makes
+        # slicing out the result rows ~10x cheaper. Frames from the columnar cache are
+        # already consolidated, and copying them would unshare the memory-mapped pages.
+        if db.empty or 'columnar_cache' in db.attrs:
+            self.db = db
+        else:
+            self.db = db.reset_index(drop=True).copy()
+        names = self.db['food_name'].astype(str).str.lower().tolist() if not db.empty else []
+        self.names = names
+        # Whitespace-normalized names, to leave the queried dish itself out of its alternatives
+        self.normalized_names = np.array([_normalize(name) for name in names], dtype=str)
+
+        postings = {}
+        for row, name in enumerate(names):
+            for token in set(tokenize(name)):
+                postings.setdefault(token, []).append(row)
+        self.postings = {token: np.array(rows, dtype=np.int64) for token, rows in postings.items()}
+        self.idf = {token: float(np.log(1 + len(names) / len(rows))) for token, rows in postings.items()}
+
+        if db.empty:
+            self.energy = self.fat = self.protein = np.empty(0)
+            self.scale = np.ones(3)
+        else:
+            self.energy = self.db['energy_kcal'].to_numpy(dtype=np.float64)
+            self.fat = self.db['fat_g'].to_numpy(dtype=np.float64)
+            self.protein = self.db['protein_g'].to_numpy(dtype=np.float64)
+            stds = np.array([self.energy.std(), self.fat.std(), self.protein.std()])
+            self.scale = np.where(stds > 0, stds, 1.0)
+
+    @property
+    def empty(self):
+        return len(self.names) == 0
+
+    def candidates(self, meal_name):
+        """
+        Rows whose name shares a token with the meal, with the summed IDF of the shared tokens.
+
+        Falls back to a substring match on the first word (the old behaviour) when no
+        token matches, e.g. for compound words. Rows named exactly like the meal are left out.
+        """
+        hits = [(self.postings[token], self.idf[token]) for token in set(tokenize(meal_name)) if token in self.postings]
+        if hits:
+            rows, inverse = np.unique(np.concatenate([token_rows for token_rows, _ in hits]), return_inverse=True)
+            weights = np.concatenate([np.full(len(token_rows), idf) for token_rows, idf in hits])
+            scores = np.bincount(inverse, weights=weights)
+        else:
+            words = meal_name.split()
+            if not words:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            primary_ingredient = words[0].lower()
+            rows = np.array([row for row, name in enumerate(self.names) if primary_ingredient in name], dtype=np.int64)
+            scores = np.ones(len(rows), dtype=np.float64)
+        not_self = self.normalized_names[rows] != _normalize(meal_name)
+        return rows[not_self], scores[not_self]
+
+    def search(self, meal_name, original_meal_info, top_n=3):
+        """Returns the row positions of the best `top_n` healthier alternatives."""
+        return self.search_many([meal_name], [original_meal_info], top_n)[0]
+
+    def search_many(self, meal_names, original_meal_infos, top_n=3):
+        """
+        Row positions of the best `top_n` healthier alternatives for each of many meals.
+
+        Candidates of all meals are concatenated into one (meal, row) array, so filtering,
+        distances and ranking run as a single vectorized pass instead of once per meal.
+
+        Returns:
+            list: One array of row positions per meal, best first.
+        """
+        num_meals = len(meal_names)
+        if self.empty or num_meals == 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(num_meals)]
+
+        meal_ids, rows, scores = [], [], []
+        for meal_id, meal_name in enumerate(meal_names):
+            meal_rows, meal_scores = self.candidates(meal_name)
+            meal_ids.append(np.full(len(meal_rows), meal_id, dtype=np.int64))
+            rows.append(meal_rows)
+            scores.append(meal_scores)
+        meal_ids, rows, scores = np.concatenate(meal_ids), np.concatenate(rows), np.concatenate(scores)
+
+        # Define what "healthier" means, per meal
+        info = np.array(
+            [[meal['calories'], meal['fat'], meal['protein']] for meal in original_meal_infos], dtype=np.float64
+        )
+        max_calories = info[:, 0] * CALORIE_FACTOR
+        max_fat = info[:, 1] * FAT_FACTOR
+        min_protein = info[:, 2] * PROTEIN_FACTOR
+
+        energy, fat, protein = self.energy[rows], self.fat[rows], self.protein[rows]
+        keep = (energy <= max_calories[meal_ids]) & (fat <= max_fat[meal_ids]) & (protein >= min_protein[meal_ids])
+        meal_ids, rows, scores = meal_ids[keep], rows[keep], scores[keep]
+
+        # Nutrient distance to the ideal swap: the calorie and fat targets above, same protein
+        target = np.stack([max_calories, max_fat, info[:, 2]], axis=1)[meal_ids]
+        values = np.stack([energy[keep], fat[keep], protein[keep]], axis=1)
+        distance = np.sqrt((((values - target) / self.scale) ** 2).sum(axis=1))
+        # Per meal: highest IDF-weighted token overlap first, then the closest nutrient profile
+        order = np.lexsort((distance, -scores, meal_ids))
+        sorted_ids = meal_ids[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_ids, sorted_ids, side='left')
+        top = order[rank < top_n]
+        bounds = np.searchsorted(meal_ids[top], np.arange(1, num_meals))
+        return np.split(rows[top], bounds)
+
+
+NUTRITION_INDEX = NutritionIndex(NUTRITION_DB)
+
+
+def _index_for(db):
+    if isinstance(db, NutritionIndex):
+        return db
+    if db is NUTRITION_DB:
+        return NUTRITION_INDEX
+    return NutritionIndex(db)
+
 
 def retrieve_healthier_alternatives(meal_name, original_meal_info, db, top_n=3):
     """
     Finds healthier but similar alternatives from the nutrition database.
-    
-    A simple retriever based on filtering.
+
+    Candidates come from the token index, are filtered to 20% fewer calories and less fat
+    with similar protein, and are ranked by IDF-weighted token overlap and nutrient distance.
+    A database row named exactly like the meal is never suggested as its own alternative.
+
+    Args:
+        db: NUTRITION_DB, a NutritionIndex, or any DataFrame with the INDB columns
+            (indexed on the fly, so prefer passing a prebuilt NutritionIndex).
     """
-    if db.empty:
+    index = _index_for(db)
+    if index.empty:
         return pd.DataFrame()
+    return index.db.iloc[index.search(meal_name, original_meal_info, top_n)]
+
 
-    # Try to find a primary ingredient (e.g., 'chicken' from 'Chicken Biryani')
-    primary_ingredient = meal_name.split()[0].lower()
-    
-    # Define what "healthier" means
-    max_calories = original_meal_info['calories'] * 0.8 # 20% fewer calories
-    max_fat = original_meal_info['fat'] * 0.8       # 20% less fat
-    min_protein = original_meal_info['protein'] * 0.9 # Similar protein
-
-    # Filter the database
-    alternatives = db[
-        (db['food_name'].str.lower().str.contains(primary_ingredient)) &
-        (db['energy_kcal'] <= max_calories) &
-        (db['fat_g'] <= max_fat) &
-        (db['protein_g'] >= min_protein)
-    ].head(top_n)
-    
-    return alternatives
\ No newline at end of file
+def retrieve_healthier_alternatives_batch(meals, db, top_n=3):
+    """
+    retrieve_healthier_alternatives() for many meals in one vectorized pass.
+
+    Args:
+        meals (list): Meal dicts with 'name', 'calories', 'fat' and 'protein'.
+        db: NUTRITION_DB, a NutritionIndex, or any DataFrame with the INDB columns.
+
+    Returns:
+        list: One DataFrame of alternatives per meal, in input order.
+    """
+    index = _index_for(db)
+    if index.empty:
+        return [pd.DataFrame() for _ in meals]
+    per_meal = index.search_many([meal['name'] for meal in meals], meals, top_n)
+    # One row selection for the whole batch, then cheap slices of it per meal
+    selected = index.db.iloc[np.concatenate(per_meal)] if per_meal else index.db.iloc[:0]
+    ends = np.cumsum([len(rows) for rows in per_meal])
+    return [selected.iloc[end - len(rows):end] for rows, end in zip(per_meal, ends)]
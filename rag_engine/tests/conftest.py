@@ -0,0 +1,36 @@
+"""
+Test setup for the recommendation engine. Run from the rag_engine/ directory:
+
+    python -m pytest tests
+
+src.app reads its configuration and loads the nutrition table at import time, so the
+environment is set here, before any test imports it: the stub LLM with no latency, no
+response cache, and a small nutrition table written to a temporary directory.
+"""
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FOODS = pd.DataFrame({
+    'food_code': ['ASC001', 'ASC002', 'ASC003', 'ASC004', 'ASC005', 'ASC006'],
+    'food_name': ['Chicken Biryani', 'Chicken Pulao', 'Vegetable Biryani', 'Grilled Chicken Salad',
+                  'Paneer Tikka', 'Paneer Bhurji'],
+    'energy_kcal': [290.0, 180.0, 170.0, 120.0, 220.0, 160.0],
+    'fat_g': [12.0, 5.0, 4.0, 3.0, 14.0, 9.0],
+    'protein_g': [14.0, 13.0, 5.0, 15.0, 15.0, 14.0],
+})
+
+_data_dir = tempfile.mkdtemp(prefix='rag-tests-')
+FOODS.to_csv(os.path.join(_data_dir, 'foods.csv'), index=False)
+
+os.environ.update({
+    'RAG_LLM_BACKEND': 'stub',
+    'RAG_STUB_LATENCY': '0',
+    'RAG_RESPONSE_CACHE_SIZE': '0',
+    'RAG_NUTRITION_DB_PATH': os.path.join(_data_dir, 'foods.csv'),
+    'RAG_NUTRITION_CACHE_DIR': os.path.join(_data_dir, 'cache'),
+})
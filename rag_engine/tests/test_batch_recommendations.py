@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from src.app import app
+
+
+def _item(user_id, name, calories=450, fat=20, protein=15):
+    return {
+        'user_id': user_id,
+        'user_context': {'predicted_tg': 180.0, 'calorie_target': 2000},
+        'original_meal': {'name': name, 'calories': calories, 'fat': fat, 'protein': protein},
+    }
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_batch_answers_every_valid_meal(client):
+    response = client.post('/recommend/batch', json={'requests': [
+        _item('u1', 'Chicken Biryani'), _item('u1', 'Paneer Tikka'), _item('u2', 'Chicken Biryani'),
+    ]})
+    assert response.status_code == 200
+    recommendations = response.get_json()['recommendations']
+    assert len(recommendations) == 3
+    assert all('recommendation' in entry for entry in recommendations)
+
+
+@pytest.mark.parametrize('bad_name', [123, None, '', '   ', ['Chicken Biryani']])
+def test_bad_meal_name_only_fails_its_own_item(client, bad_name):
+    response = client.post('/recommend/batch', json={'requests': [
+        _item('u1', 'Chicken Biryani'), _item('u1', bad_name), _item('u2', 'Paneer Tikka'),
+    ]})
+    assert response.status_code == 200
+    first, bad, last = response.get_json()['recommendations']
+    assert 'recommendation' in first and 'recommendation' in last
+    assert set(bad) == {'error'}
+
+
+def test_missing_and_non_numeric_fields_are_per_item_errors(client):
+    missing = _item('u1', 'Paneer Tikka')
+    del missing['original_meal']['fat']
+    non_numeric = _item('u1', 'Chicken Pulao', calories='lots')
+    response = client.post('/recommend/batch', json={'requests': [missing, non_numeric, _item('u1', 'Chicken Biryani')]})
+    assert response.status_code == 200
+    recommendations = response.get_json()['recommendations']
+    assert [set(entry) for entry in recommendations] == [{'error'}, {'error'}, {'recommendation'}]
+
+
+@pytest.mark.parametrize('bad_reply', ['{"recommendations": 5}', '{"recommendations": null}', None])
+def test_unreadable_llm_reply_only_fails_its_own_prompt(client, monkeypatch, bad_reply):
+    from src import app as app_module
+
+    def generate_many(prompts, max_concurrency=None):
+        # One prompt per user: the first gets a bad reply, the second a valid one
+        good = json.dumps({'recommendations': [{'meal': 1, 'recommendation': 'Try the salad.'}]})
+        return [bad_reply] + [good] * (len(prompts) - 1)
+
+    monkeypatch.setattr(app_module.llm_service, 'generate_many', generate_many)
+    response = client.post('/recommend/batch', json={'requests': [
+        _item('u1', 'Chicken Biryani'), _item('u2', 'Paneer Tikka'),
+    ]})
+    assert response.status_code == 200
+    bad, good = response.get_json()['recommendations']
+    assert set(bad) == {'error'}
+    assert good == {'recommendation': 'Try the salad.'}
@@ -0,0 +1,19 @@
+from src.app import app
+
+
+def test_metrics_export_stages_and_cache_counters():
+    client = app.test_client()
+    response = client.post('/recommend', json={
+        'user_context': {'predicted_tg': 180.0, 'calorie_target': 2000},
+        'original_meal': {'name': 'Chicken Biryani', 'calories': 450, 'fat': 20, 'protein': 15},
+    })
+    assert response.status_code == 200
+
+    metrics = client.get('/metrics')
+    assert metrics.status_code == 200
+    assert metrics.content_type.startswith('text/plain; version=0.0.4')
+    text = metrics.get_data(as_text=True)
+    for stage in ('retrieval', 'cache_lookup', 'prompt_build', 'llm'):
+        assert f'rag_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    for series in ('rag_response_cache_hits_total', 'rag_response_cache_misses_total', 'rag_response_cache_hit_rate'):
+        assert f"\n{series} " in text
@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+from src.prompts import parse_batch_recommendations
+
+
+def test_parses_answers_by_meal_number():
+    reply = '```json\n' + json.dumps({'recommendations': [
+        {'meal': 2, 'recommendation': 'Try dal.'}, {'meal': 1, 'recommendation': 'Try salad.'},
+    ]}) + '\n```'
+    assert parse_batch_recommendations(reply, 3) == ['Try salad.', 'Try dal.', None]
+
+
+@pytest.mark.parametrize('reply', [
+    'not json',
+    '[]',
+    '{"recommendations": 5}',
+    '{"recommendations": null}',
+    '{"recommendations": "Try salad."}',
+    '{"recommendations": [5, null, ["Try salad."]]}',
+    '{"recommendations": [{"meal": true, "recommendation": "Try salad."}, {"meal": 1, "recommendation": 7}]}',
+])
+def test_wrong_shaped_replies_count_as_skipped(reply):
+    assert parse_batch_recommendations(reply, 2) == [None, None]
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from src.retriever import NutritionIndex
+
+FOODS = [
+    ('Paneer butter masala', 300, 20, 12),
+    ('Chat masala', 250, 5, 12),
+    ('Garam masala', 260, 10, 11),
+    ('Chana masala', 280, 12, 11),
+    ('Egg masala', 240, 15, 12),
+    ('Paneer tikka', 320, 18, 14),
+    ('Palak paneer', 310, 20, 13),
+    ('Chicken curry', 250, 12, 20),
+    ('Chicken tikka', 260, 10, 24),
+    ('Chicken kebab', 240, 11, 22),
+    ('Egg curry', 220, 12, 11),
+    ('Potato curry', 200, 8, 19),
+    ('Mixed vegetable curry', 210, 9, 18),
+]
+
+
+def _index():
+    return NutritionIndex(pd.DataFrame(
+        [(f"F{pos:03d}", name, energy, fat, protein) for pos, (name, energy, fat, protein) in enumerate(FOODS)],
+        columns=['food_code', 'food_name', 'energy_kcal', 'fat_g', 'protein_g'],
+    ))
+
+
+def _search(index, meal_name, calories, fat, protein):
+    rows = index.search(meal_name, {'calories': calories, 'fat': fat, 'protein': protein}, top_n=3)
+    return [index.db['food_name'].iloc[row] for row in rows]
+
+
+def test_shared_dish_words_outrank_generic_ones():
+    names = _search(_index(), 'Paneer  Butter Masala', 400, 28, 10)
+    assert 'Paneer butter masala' not in names
+    assert set(names[:2]) == {'Paneer tikka', 'Palak paneer'}
+
+
+def test_meal_is_not_its_own_alternative():
+    names = _search(_index(), 'Chicken curry', 350, 16, 20)
+    assert 'Chicken curry' not in names
+    assert set(names[:2]) == {'Chicken kebab', 'Chicken tikka'}
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from src.app import app
+
+MEAL = {'name': 'Chicken Biryani', 'calories': 450, 'fat': 20, 'protein': 15}
+
+
+def _events(body):
+    events = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_stream_ends_with_done():
+    response = app.test_client().post('/recommend/stream', json={
+        'user_context': {'predicted_tg': 180.0, 'calorie_target': 2000}, 'original_meal': MEAL,
+    })
+    assert response.status_code == 200
+    events = _events(response.get_data(as_text=True))
+    assert events[-1][0] == 'done'
+    assert ''.join(data['text'] for name, data in events if name == 'token') == events[-1][1]['recommendation']
+
+
+@pytest.mark.parametrize('user_context', [{'calorie_target': 2000}, {'predicted_tg': 180.0}, None])
+def test_malformed_user_context_is_rejected_before_streaming(user_context):
+    response = app.test_client().post('/recommend/stream', json={'user_context': user_context, 'original_meal': MEAL})
+    assert response.status_code == 400
+    assert response.is_json and 'error' in response.get_json()